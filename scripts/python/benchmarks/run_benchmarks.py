@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+Benchmark Suite for Clinical Informatics Textbook
+Throughput and memory of the calculators, models, validator and services.
+
+For each --persons size a synthetic OMOP dataset (utilities/
+synthetic_omop.py, about 37 rows per person across the 11 tables) is
+generated once into the work directory, and every selected case is timed
+on it:
+
+    generator       synthetic_omop.generate   persons -> CSV rows written
+    cha2ds2vasc     .scalar / .batch /        patients scored
+                    .population               (population: from the CSVs)
+    cohorts         .afib                     condition rows scanned
+                    .quality                  event rows scanned (all
+                                              HEDIS measures, one pass)
+                    .bp_trends                measurement rows pivoted
+                    .drug_eras                drug exposures merged into eras
+    readmission     .features / .scalar / .batch
+    validator       .load / .streaming        CSV rows validated
+    registration    .workflow                 search -> register -> encounter
+                                              workflows (mock FHIR server,
+                                              run once, independent of size)
+
+Each case runs in a fresh worker process, so its peak memory (RSS) is
+its own; the setup (table loading, via the columnar cache) is not timed
+and its peak is reported separately. Timed sections are repeated
+--repeat times and the fastest run is reported.
+
+Results are written as JSON (environment plus one record per case and
+size). With --baseline, throughput is compared against an earlier
+results file and the exit status is 1 if any case regressed by more than
+--tolerance.
+
+Usage:
+    python run_benchmarks.py [--persons 1000 10000 100000] [--repeat 3]
+                             [--components cha2ds2vasc readmission ...]
+                             [--work-dir DIR] [--output results.json]
+                             [--baseline previous.json] [--tolerance 0.25]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timezone
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+_PYTHON_DIR = Path(__file__).resolve().parent.parent
+for _directory in ("utilities", "calculators", "cohorts", "ml_models", "services"):
+    sys.path.insert(0, str(_PYTHON_DIR / _directory))
+
+from omop_loader import load_schema, load_table  # noqa: E402
+from validate_data import peak_rss_mb  # noqa: E402
+
+RESULTS_VERSION = 1
+
+# Patients / discharges scored one at a time in the scalar cases
+SCALAR_SAMPLE = 20_000
+REFERENCE_DATE = date(2026, 1, 13)
+STREAMING_CHUNK_SIZE = 100_000
+DATASET_META = "synthetic.json"
+CACHE_DIR = ".cache"
+
+
+def _tables(data_dir: Path, columns: dict) -> dict:
+    """Load {table: columns} through the columnar cache."""
+    schema = load_schema(data_dir)
+    return {table: load_table(data_dir / f"{table}.csv", schema,
+                              data_dir / CACHE_DIR, usecols=usecols)
+            for table, usecols in columns.items()}
+
+
+def _dataset_rows(data_dir: Path, table: str = None) -> int:
+    rows = json.loads((data_dir / DATASET_META).read_text())["rows"]
+    return rows[table] if table else sum(rows.values())
+
+
+# --- cases -------------------------------------------------------------------
+# Each case takes the dataset directory and returns (rows, unit, run)
+# where run() is the timed work; anything before that is setup.
+
+def generator_case(data_dir: Path, persons: int, seed: int = 0):
+    from synthetic_omop import write_dataset
+
+    def run():
+        rows = write_dataset(data_dir, persons, seed)
+        (data_dir / DATASET_META).write_text(
+            json.dumps({"persons": persons, "seed": seed, "rows": rows}))
+    return None, "rows", run
+
+
+def cha2ds2vasc_scalar_case(data_dir: Path, persons: int):
+    from cha2ds2vasc_calculator import PatientContext, calculate_cha2ds2_vasc
+
+    data = _tables(data_dir, {
+        "person": ["person_id", "gender_concept_id", "birth_datetime"],
+        "condition_occurrence": ["person_id", "condition_source_value"],
+    })
+    person = data["person"].head(SCALAR_SAMPLE)
+    codes = data["condition_occurrence"]
+    codes = codes[codes["person_id"].isin(person["person_id"])]
+    by_person = (codes["condition_source_value"].astype(object)
+                 .groupby(codes["person_id"]).agg(list))
+    contexts = [
+        PatientContext(birth_date=birth.date(),
+                       gender="female" if gender == 8532 else "male",
+                       conditions=by_person.get(person_id, []))
+        for person_id, gender, birth in person.itertuples(index=False)
+    ]
+
+    def run():
+        for context in contexts:
+            calculate_cha2ds2_vasc(context)
+    return len(contexts), "patients", run
+
+
+def cha2ds2vasc_batch_case(data_dir: Path, persons: int):
+    from cha2ds2vasc_batch import calculate_cha2ds2_vasc_batch
+
+    data = _tables(data_dir, {
+        "person": ["person_id", "gender_concept_id", "birth_datetime"],
+        "condition_occurrence": ["person_id", "condition_source_value"],
+    })
+    person, codes = data["person"], data["condition_occurrence"]
+    birth_dates = person["birth_datetime"].to_numpy()
+    genders = np.where(person["gender_concept_id"] == 8532, "female", "male")
+    owner = pd.Index(person["person_id"]).get_indexer(codes["person_id"])
+
+    def run():
+        calculate_cha2ds2_vasc_batch(
+            birth_dates, genders, condition_codes=codes["condition_source_value"],
+            condition_owner=owner, reference_date=REFERENCE_DATE)
+    return len(person), "patients", run
+
+
+def cha2ds2vasc_population_case(data_dir: Path, persons: int):
+    from cha2ds2vasc_population import score_population
+
+    return _dataset_rows(data_dir, "person"), "patients", lambda: score_population(
+        data_dir, REFERENCE_DATE)
+
+
+def afib_cohort_case(data_dir: Path, persons: int):
+    from afib_cohort import build_cohort
+
+    return _dataset_rows(data_dir, "condition_occurrence"), "conditions", \
+        lambda: build_cohort(data_dir)
+
+
+def quality_measures_case(data_dir: Path, persons: int):
+    from quality_measures import EVENT_TABLES, evaluate_measures
+
+    rows = sum(_dataset_rows(data_dir, spec.table) for spec in EVENT_TABLES.values())
+    return rows, "events", lambda: evaluate_measures(data_dir, as_of=REFERENCE_DATE)
+
+
+def drug_eras_case(data_dir: Path, persons: int):
+    from drug_eras import build_drug_eras
+
+    period = (date(REFERENCE_DATE.year - 1, REFERENCE_DATE.month, REFERENCE_DATE.day),
+              REFERENCE_DATE)
+    return _dataset_rows(data_dir, "drug_exposure"), "exposures", lambda: build_drug_eras(
+        data_dir, period=period)
+
+
+def bp_trends_case(data_dir: Path, persons: int):
+    from bp_control_trends import build_series, load_schema, summarize
+
+    schema = load_schema(data_dir)
+    return _dataset_rows(data_dir, "measurement"), "rows", lambda: summarize(
+        build_series(data_dir / "measurement.csv", schema))
+
+
+def _readmission_data(data_dir: Path) -> dict:
+    from readmission_features import SOURCE_COLUMNS
+    return _tables(data_dir, SOURCE_COLUMNS)
+
+
+def readmission_features_case(data_dir: Path, persons: int):
+    from readmission_features import extract_features
+
+    data = _readmission_data(data_dir)
+    discharges = len(extract_features(data))
+    return discharges, "discharges", lambda: extract_features(data)
+
+
+def readmission_scalar_case(data_dir: Path, persons: int):
+    from readmission_batch import FEATURES
+    from readmission_features import extract_features
+    from readmission_prediction import predict_30day_readmission
+
+    features = extract_features(_readmission_data(data_dir)).head(SCALAR_SAMPLE)
+    rows = features[list(FEATURES)].to_dict("records")
+
+    def run():
+        for row in rows:
+            predict_30day_readmission(**row)
+    return len(rows), "discharges", run
+
+
+def readmission_batch_case(data_dir: Path, persons: int):
+    from readmission_batch import predict_30day_readmission_frame
+    from readmission_features import extract_features
+
+    features = extract_features(_readmission_data(data_dir))
+    return len(features), "discharges", lambda: predict_30day_readmission_frame(features)
+
+
+def _validate(argv: list):
+    import validate_data
+
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        try:
+            validate_data.main(argv)
+        except SystemExit as done:
+            if done.code:
+                raise RuntimeError(f"validation failed:\n{output.getvalue()}") from None
+
+
+def validator_load_case(data_dir: Path, persons: int):
+    return _dataset_rows(data_dir), "rows", lambda: _validate(
+        ["--data-dir", str(data_dir)])
+
+
+def validator_streaming_case(data_dir: Path, persons: int):
+    return _dataset_rows(data_dir), "rows", lambda: _validate(
+        ["--data-dir", str(data_dir), "--chunk-size", str(STREAMING_CHUNK_SIZE)])
+
+
+def registration_workflow_case(data_dir: Path, workflows: int):
+    import asyncio
+
+    from mock_fhir_server import serve_in_process, synthetic_patients
+    from registration_load_test import make_arrivals, run as load_test
+
+    patients = synthetic_patients(10_000)
+    arrivals = make_arrivals(patients, workflows)
+
+    def run():
+        # Zero server latency: the numbers track the client's CPU cost
+        with serve_in_process(len(patients), latency=0.0) as base_url:
+            asyncio.run(load_test(base_url, arrivals, users=16, validation="lazy",
+                                  client_options={}))
+    return workflows, "workflows", run
+
+
+CASES = {
+    "synthetic_omop.generate": generator_case,
+    "cha2ds2vasc.scalar": cha2ds2vasc_scalar_case,
+    "cha2ds2vasc.batch": cha2ds2vasc_batch_case,
+    "cha2ds2vasc.population": cha2ds2vasc_population_case,
+    "cohorts.afib": afib_cohort_case,
+    "cohorts.quality": quality_measures_case,
+    "cohorts.bp_trends": bp_trends_case,
+    "cohorts.drug_eras": drug_eras_case,
+    "readmission.features": readmission_features_case,
+    "readmission.scalar": readmission_scalar_case,
+    "readmission.batch": readmission_batch_case,
+    "validator.load": validator_load_case,
+    "validator.streaming": validator_streaming_case,
+    "registration.workflow": registration_workflow_case,
+}
+COMPONENTS = {
+    "generator": ["synthetic_omop.generate"],
+    "cha2ds2vasc": ["cha2ds2vasc.scalar", "cha2ds2vasc.batch",
+                    "cha2ds2vasc.population"],
+    "cohorts": ["cohorts.afib", "cohorts.quality", "cohorts.bp_trends",
+                "cohorts.drug_eras"],
+    "readmission": ["readmission.features", "readmission.scalar", "readmission.batch"],
+    "validator": ["validator.load", "validator.streaming"],
+    "registration": ["registration.workflow"],
+}
+
+
+def run_case(case: str, data_dir: Path, size: int, repeat: int) -> dict:
+    """Set up and time one case (in a worker process)."""
+    rows, unit, run = CASES[case](Path(data_dir), size)
+    setup_rss = peak_rss_mb()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    if rows is None:
+        rows = _dataset_rows(Path(data_dir))
+    best = min(timings)
+    return {
+        "rows": rows,
+        "unit": unit,
+        "seconds": best,
+        "median_seconds": statistics.median(timings),
+        "throughput": rows / best if best else None,
+        "setup_rss_mb": setup_rss,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_isolated(case: str, data_dir: Path, size: int, repeat: int) -> dict:
+    """run_case() in a fresh process, so peak memory is the case's own."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(run_case, case, data_dir, size, repeat).result()
+
+
+def environment() -> dict:
+    import os
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+
+def compare(results: list, baseline: dict, tolerance: float) -> list:
+    """(case, persons, ratio) for cases slower than baseline by > tolerance."""
+    previous = {(r["case"], r["persons"]): r for r in baseline["results"]
+                if r.get("throughput")}
+    regressions = []
+    for result in results:
+        before = previous.get((result["case"], result["persons"]))
+        if before and result.get("throughput"):
+            ratio = result["throughput"] / before["throughput"]
+            result["baseline_ratio"] = ratio
+            if ratio < 1 - tolerance:
+                regressions.append((result["case"], result["persons"], ratio))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--persons", type=int, nargs="+", default=[1_000, 10_000, 100_000],
+                        help="Synthetic population sizes (about 37 rows per person)")
+    parser.add_argument("--components", nargs="+", choices=COMPONENTS,
+                        default=list(COMPONENTS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workflows", type=int, default=1000,
+                        help="Registration workflows per run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", type=Path, default=None,
+                        help="Keep generated datasets here and reuse them between "
+                             "runs (default: a temporary directory)")
+    parser.add_argument("--output", type=Path, default=Path("benchmark_results.json"))
+    parser.add_argument("--baseline", type=Path, default=None,
+                        help="Earlier results file to compare throughput against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed throughput drop versus --baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    work_dir = args.work_dir or Path(tempfile.mkdtemp(prefix="omop-bench-"))
+    cases = [case for component in args.components for case in COMPONENTS[component]]
+    report = {
+        "version": RESULTS_VERSION,
+        "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": environment(),
+        "results": [],
+    }
+
+    def record(case: str, persons, stats: dict):
+        component = next(name for name, members in COMPONENTS.items() if case in members)
+        result = {"case": case, "component": component, "persons": persons, **stats}
+        report["results"].append(result)
+        peak = f"{stats['peak_rss_mb']:,.0f}" if stats["peak_rss_mb"] else "-"
+        print(f"{case:<24} {persons or '-':>9} {stats['rows']:>12,} "
+              f"{stats['seconds']:>9.3f} {stats['throughput']:>14,.0f} "
+              f"{stats['unit']:<10} {peak:>8}", flush=True)
+
+    print("=" * 94)
+    print(f"Benchmark suite: persons {args.persons}, best of {args.repeat}, "
+          f"work dir {work_dir}")
+    print("=" * 94)
+    print(f"{'Case':<24} {'Persons':>9} {'Rows':>12} {'Seconds':>9} "
+          f"{'Throughput/s':>14} {'Unit':<10} {'Peak MB':>8}")
+
+    try:
+        for persons in args.persons:
+            data_dir = work_dir / f"omop-{persons}-seed{args.seed}"
+            meta = data_dir / DATASET_META
+            generate = "synthetic_omop.generate" in cases
+            if not meta.exists() or generate:
+                stats = run_isolated("synthetic_omop.generate", data_dir, persons, 1)
+                if generate:
+                    record("synthetic_omop.generate", persons, stats)
+            for case in cases:
+                if case.startswith(("synthetic_omop.", "registration.")):
+                    continue
+                record(case, persons, run_isolated(case, data_dir, persons, args.repeat))
+
+        if "registration.workflow" in cases:
+            record("registration.workflow", None, run_isolated(
+                "registration.workflow", work_dir, args.workflows, args.repeat))
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    regressions = []
+    if args.baseline:
+        regressions = compare(report["results"], json.loads(args.baseline.read_text()),
+                              args.tolerance)
+    args.output.write_text(json.dumps(report, indent=2))
+    print("=" * 94)
+    print(f"Results written to {args.output}")
+    for case, persons, ratio in regressions:
+        print(f"REGRESSION {case} ({persons} persons): "
+              f"{ratio:.0%} of baseline throughput")
+    print("=" * 94)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
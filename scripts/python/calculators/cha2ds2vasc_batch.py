@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+# ============================================================================
+# Script: cha2ds2vasc_batch.py
+# Chapter: 6 - Clinical Decision Support
+# Textbook Section: 6.2 Risk Scores Implementation
+#
+# Description:
+#   Columnar (vectorized) CHA2DS2-VASc scoring for whole patient
+#   populations. Produces the same score, annual stroke risk,
+#   recommendation and contributing factors as calculate_cha2ds2_vasc(),
+#   but operates on arrays so a nightly AFib panel refresh can score
+#   millions of patients in a single call.
+#
+# Prerequisites:
+#   - Python 3.8+
+#   - numpy, pandas (pip install -r requirements.txt)
+#
+# Usage:
+#   python cha2ds2vasc_batch.py [num_patients]
+#
+# Expected Results:
+#   Batch results identical to the per-patient calculator for every
+#   patient, at roughly 1/50th of the per-patient cost.
+# ============================================================================
+
+"""
+Vectorized CHA2DS2-VASc Stroke Risk Calculator
+Population-scale scoring for atrial fibrillation panels
+"""
+
+import sys
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from cha2ds2vasc_calculator import CHA2DS2_VASC_INDEX, RISK_TABLE, RiskScore
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'utilities'))
+
+from factorize import factorize  # noqa: E402
+
+# Bit flags for the condition-based criteria
+CHF = CHA2DS2_VASC_INDEX.bit('CHF')
+HYPERTENSION = CHA2DS2_VASC_INDEX.bit('Hypertension')
+DIABETES = CHA2DS2_VASC_INDEX.bit('Diabetes')
+STROKE_TIA = CHA2DS2_VASC_INDEX.bit('Stroke/TIA')
+VASCULAR = CHA2DS2_VASC_INDEX.bit('Vascular disease')
+
+RECOMMENDATIONS = (
+    "Oral anticoagulation strongly recommended",  # female, score ≥2
+    "Anticoagulation should be considered",       # female, score 1
+    "Oral anticoagulation recommended",           # male, score ≥1
+    "No anticoagulation indicated",
+)
+
+_RISK_BY_SCORE = np.array([RISK_TABLE[s] for s in range(10)])
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_MISSING_DAY = np.iinfo(np.int64).min  # NaT as int64 days
+
+
+@dataclass
+class BatchRiskScores:
+    """Columnar risk calculation result (one element per patient)."""
+    score: np.ndarray
+    annual_stroke_risk: np.ndarray
+    recommendation: pd.Categorical
+    factors: Dict[str, np.ndarray]
+
+    def __len__(self) -> int:
+        return len(self.score)
+
+    def __getitem__(self, i: int) -> RiskScore:
+        """Materialize a single patient's result as a RiskScore."""
+        return RiskScore(
+            score=int(self.score[i]),
+            annual_stroke_risk=float(self.annual_stroke_risk[i]),
+            recommendation=self.recommendation[i],
+            factors={
+                name: int(points[i])
+                for name, points in self.factors.items()
+                if points[i]
+            }
+        )
+
+    def to_frame(self, index=None) -> pd.DataFrame:
+        """Return the results as a DataFrame with one column per factor."""
+        columns = {
+            'score': self.score,
+            'annual_stroke_risk': self.annual_stroke_risk,
+            'recommendation': self.recommendation,
+        }
+        columns.update(self.factors)
+        return pd.DataFrame(columns, index=index)
+
+
+def condition_flags(
+    codes: Sequence[str],
+    owner: np.ndarray,
+    num_patients: int
+) -> np.ndarray:
+    """
+    Derive per-patient criterion flags from long-format condition codes.
+
+    Each distinct code is classified once against CHA2DS2_VASC_INDEX;
+    the resulting bit flags are
+    then OR'ed onto patients with a single unbuffered scatter.
+
+    Args:
+        codes: ICD-10 code per condition row (array, Series or Categorical)
+        owner: Patient position (0..num_patients-1) for each condition row
+        num_patients: Number of patients being scored
+
+    Returns:
+        uint8 array of OR'ed criterion flags, one element per patient
+    """
+    code_ids, vocabulary = factorize(codes)
+    vocabulary_flags = np.fromiter(
+        (CHA2DS2_VASC_INDEX.classify(str(code)) for code in vocabulary),
+        dtype=np.uint8,
+        count=len(vocabulary)
+    )
+    # Missing codes (-1) index the trailing zero and carry no flags
+    vocabulary_flags = np.append(vocabulary_flags, np.uint8(0))
+
+    row_flags = vocabulary_flags[code_ids]
+    owner = np.asarray(owner)
+
+    # Most historic codes match no criterion; when that holds, only
+    # scatter the rows that do
+    if np.count_nonzero(row_flags) < len(row_flags) // 2:
+        hits = np.flatnonzero(row_flags)
+        owner, row_flags = owner[hits], row_flags[hits]
+
+    flags = np.zeros(num_patients, dtype=np.uint8)
+    np.bitwise_or.at(flags, owner, row_flags)
+    return flags
+
+
+def _as_day_array(values) -> np.ndarray:
+    """
+    Convert birth dates (date objects, strings, datetime64) to days since
+    epoch; missing dates (None/NaT) become _MISSING_DAY.
+    """
+    if isinstance(values, pd.Series):
+        values = values.to_numpy()
+    if len(values) and isinstance(values[0], date):
+        return np.fromiter(
+            (_MISSING_DAY if pd.isna(d) else d.toordinal() - _EPOCH_ORDINAL
+             for d in values),
+            dtype=np.int64, count=len(values)
+        )
+    return np.asarray(values).astype('datetime64[D]').astype(np.int64)
+
+
+def calculate_age_batch(birth_dates, reference_date: date = None) -> np.ndarray:
+    """
+    Vectorized calculate_age(): age in whole years at reference_date.
+
+    Ages are computed once per calendar day in the span of birth dates
+    and then gathered, which is far cheaper than splitting every
+    datetime64 into year/month/day.
+
+    Raises:
+        ValueError: if any birth date is missing (None/NaT), naming the
+            rows (index labels for a Series, else positions)
+    """
+    if reference_date is None:
+        reference_date = date.today()
+
+    days = _as_day_array(birth_dates)
+    if len(days) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # Checked before the day table is built: NaT would stretch it to
+    # the whole int64 range
+    missing = np.flatnonzero(days == _MISSING_DAY)
+    if len(missing):
+        rows = birth_dates.index[missing] if isinstance(birth_dates, pd.Series) else missing
+        shown = ', '.join(map(str, rows[:10])) + (', ...' if len(rows) > 10 else '')
+        raise ValueError(f"Missing birth date in {len(rows)} row(s): {shown}")
+
+    first = days.min()
+    span = (first + np.arange(days.max() - first + 1)).astype('datetime64[D]')
+    years = span.astype('datetime64[Y]')
+    months = span.astype('datetime64[M]')
+    birth_year = years.astype(np.int64) + 1970
+    birth_month = (months - years.astype('datetime64[M]')).astype(np.int64) + 1
+    birth_day = (span - months.astype('datetime64[D]')).astype(np.int64) + 1
+
+    age_by_day = reference_date.year - birth_year - (
+        (birth_month * 32 + birth_day)
+        > (reference_date.month * 32 + reference_date.day)
+    )
+    return age_by_day[days - first]
+
+
+def _is_female(genders) -> np.ndarray:
+    """Case-insensitive 'female' test, evaluated once per distinct value."""
+    gender_ids, vocabulary = factorize(genders)
+    female = np.array(
+        [str(g).lower() == 'female' for g in vocabulary] + [False], dtype=bool
+    )
+    return female[gender_ids]
+
+
+def calculate_cha2ds2_vasc_batch(
+    birth_dates,
+    genders,
+    conditions: Optional[Sequence[Sequence[str]]] = None,
+    condition_codes=None,
+    condition_owner=None,
+    has_chf=None,
+    has_hypertension=None,
+    has_diabetes=None,
+    has_stroke_tia=None,
+    has_vascular_disease=None,
+    reference_date: date = None
+) -> BatchRiskScores:
+    """
+    Calculate CHA2DS2-VASc scores for many patients at once.
+
+    Conditions can be given either per patient (``conditions``, one list
+    of ICD-10 codes per patient, like PatientContext.conditions) or in
+    long format (``condition_codes`` with ``condition_owner`` holding the
+    0-based patient position of each code), which avoids building
+    per-patient lists for data already shaped like condition_occurrence.
+
+    Args:
+        birth_dates: Birth date per patient
+        genders: 'male' or 'female' per patient (case-insensitive)
+        conditions: Optional per-patient lists of ICD-10 codes
+        condition_codes: Optional long-format ICD-10 codes
+        condition_owner: Patient position for each long-format code
+        has_chf ... has_vascular_disease: Optional boolean arrays that
+            mirror the PatientContext override flags
+        reference_date: Date at which age is evaluated (default: today)
+
+    Returns:
+        BatchRiskScores with one element per patient
+    """
+    age = calculate_age_batch(birth_dates, reference_date)
+    n = len(age)
+
+    if conditions is not None:
+        lengths = np.fromiter(map(len, conditions), dtype=np.int64, count=n)
+        condition_owner = np.repeat(np.arange(n), lengths)
+        condition_codes = np.fromiter(
+            (code for codes in conditions for code in codes),
+            dtype=object,
+            count=int(lengths.sum())
+        )
+    if condition_codes is not None:
+        flags = condition_flags(condition_codes, condition_owner, n)
+    else:
+        flags = np.zeros(n, dtype=np.uint8)
+
+    def criterion(bit, override):
+        met = (flags & bit) != 0
+        if override is not None:
+            met |= np.asarray(override, dtype=bool)
+        return met.astype(np.int8)
+
+    # Keys follow the order calculate_cha2ds2_vasc() reports factors in
+    female = _is_female(genders)
+    factors = {
+        'CHF': criterion(CHF, has_chf),
+        'Hypertension': criterion(HYPERTENSION, has_hypertension),
+        'Age ≥75': np.where(age >= 75, 2, 0).astype(np.int8),
+        'Age 65-74': ((age >= 65) & (age < 75)).astype(np.int8),
+        'Diabetes': criterion(DIABETES, has_diabetes),
+        'Stroke/TIA': criterion(STROKE_TIA, has_stroke_tia) * np.int8(2),
+        'Vascular disease': criterion(VASCULAR, has_vascular_disease),
+        'Female sex': female.astype(np.int8),
+    }
+
+    score = np.zeros(n, dtype=np.int8)
+    for points in factors.values():
+        score += points
+
+    recommendation_index = np.where(
+        female,
+        np.where(score >= 2, 0, np.where(score == 1, 1, 3)),
+        np.where(score >= 1, 2, 3)
+    ).astype(np.int8)
+
+    return BatchRiskScores(
+        score=score,
+        annual_stroke_risk=_RISK_BY_SCORE[np.minimum(score, 9)],
+        recommendation=pd.Categorical.from_codes(
+            recommendation_index, categories=RECOMMENDATIONS
+        ),
+        factors=factors
+    )
+
+
+def calculate_cha2ds2_vasc_frame(
+    df: pd.DataFrame,
+    reference_date: date = None
+) -> pd.DataFrame:
+    """
+    Score a DataFrame shaped like PatientContext.
+
+    Expects ``birth_date``, ``gender`` and ``conditions`` (list of ICD-10
+    codes) columns; any of the ``has_*`` override columns are optional.
+    """
+    overrides = {
+        name: df[name].to_numpy(dtype=bool)
+        for name in ('has_chf', 'has_hypertension', 'has_diabetes',
+                     'has_stroke_tia', 'has_vascular_disease')
+        if name in df.columns
+    }
+    result = calculate_cha2ds2_vasc_batch(
+        df['birth_date'],
+        df['gender'],
+        conditions=df['conditions'].tolist(),
+        reference_date=reference_date,
+        **overrides
+    )
+    return result.to_frame(index=df.index)
+
+
+if __name__ == "__main__":
+    import time
+
+    from cha2ds2vasc_calculator import PatientContext, calculate_cha2ds2_vasc
+
+    num_patients = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = np.random.default_rng(12345)
+
+    # Synthetic AFib panel in columnar (long) form
+    code_pool = np.array(['I48.91', 'I10', 'E11.9', 'E66.9', 'I50.9', 'I63.9',
+                          'G45.9', 'I25.10', 'I70.0', 'I71.4', 'E78.5',
+                          'N18.3', 'Z79.01'], dtype=object)
+    birth_dates = (
+        np.datetime64('1925-01-01')
+        + rng.integers(0, 80 * 365, num_patients).astype('timedelta64[D]')
+    )
+    genders = pd.Categorical.from_codes(
+        rng.integers(0, 2, num_patients), categories=['male', 'female']
+    )
+    codes_per_patient = rng.integers(0, 8, num_patients)
+    owner = np.repeat(np.arange(num_patients), codes_per_patient)
+    codes = pd.Categorical(rng.choice(code_pool, len(owner)))
+
+    start = time.perf_counter()
+    batch = calculate_cha2ds2_vasc_batch(
+        birth_dates, genders, condition_codes=codes, condition_owner=owner
+    )
+    batch_seconds = time.perf_counter() - start
+
+    # Compare against the per-patient calculator on a sample
+    sample = rng.choice(num_patients, min(num_patients, 20_000), replace=False)
+    offsets = np.concatenate([[0], np.cumsum(codes_per_patient)])
+    codes_list = np.asarray(codes, dtype=object)
+    contexts = [
+        PatientContext(
+            birth_date=birth_dates[i].item(),
+            gender=genders[i],
+            conditions=list(codes_list[offsets[i]:offsets[i + 1]])
+        )
+        for i in sample
+    ]
+    start = time.perf_counter()
+    expected = [calculate_cha2ds2_vasc(context) for context in contexts]
+    scalar_seconds = time.perf_counter() - start
+
+    mismatches = sum(batch[i] != result for i, result in zip(sample, expected))
+    batch_per_patient = batch_seconds / num_patients
+    scalar_per_patient = scalar_seconds / len(sample)
+
+    print("=" * 60)
+    print("CHA2DS2-VASc Batch Calculator - Synthetic AFib Panel")
+    print("=" * 60)
+    print(f"Patients scored: {num_patients:,}")
+    print(f"Batch time: {batch_seconds:.3f}s "
+          f"({batch_per_patient * 1e9:.0f} ns/patient)")
+    print(f"Scalar time: {scalar_per_patient * 1e9:.0f} ns/patient")
+    print(f"Speedup: {scalar_per_patient / batch_per_patient:.0f}x")
+    print(f"Mismatches vs calculate_cha2ds2_vasc: {mismatches} / {len(sample):,}")
+    print("=" * 60)
@@ -32,6 +32,35 @@ from dataclasses import dataclass
 from datetime import date
 from typing import List, Optional
 
+from icd10_index import ICD10PrefixIndex
+
+# ICD-10 prefixes for the condition-based criteria
+STROKE_CODES = ('I63', 'I64', 'G45', 'I74')
+VASCULAR_CODES = ('I25', 'I70', 'I71')  # CAD, PAD, aortic disease
+
+CHA2DS2_VASC_CRITERIA = {
+    'CHF': ('I50',),
+    'Hypertension': ('I10',),
+    'Diabetes': ('E11',),
+    'Stroke/TIA': STROKE_CODES,
+    'Vascular disease': VASCULAR_CODES,
+}
+CHA2DS2_VASC_INDEX = ICD10PrefixIndex(CHA2DS2_VASC_CRITERIA)
+
+# Annual stroke risk (%) by CHA2DS2-VASc score
+RISK_TABLE = {
+    0: 0.2,
+    1: 0.6,
+    2: 2.2,
+    3: 3.2,
+    4: 4.8,
+    5: 7.2,
+    6: 9.7,
+    7: 11.2,
+    8: 10.8,
+    9: 12.2
+}
+
 
 @dataclass
 class PatientContext:
@@ -82,14 +111,16 @@ def calculate_cha2ds2_vasc(context: PatientContext) -> RiskScore:
     """
     score = 0
     factors = {}
+    index = CHA2DS2_VASC_INDEX
+    flags = index.classify_all(context.conditions)
 
     # C: Congestive heart failure
-    if context.has_chf or any(code.startswith('I50') for code in context.conditions):
+    if context.has_chf or flags & index.bit('CHF'):
         score += 1
         factors['CHF'] = 1
 
     # H: Hypertension
-    if context.has_hypertension or 'I10' in context.conditions:
+    if context.has_hypertension or flags & index.bit('Hypertension'):
         score += 1
         factors['Hypertension'] = 1
 
@@ -104,25 +135,17 @@ def calculate_cha2ds2_vasc(context: PatientContext) -> RiskScore:
         factors['Age 65-74'] = 1
 
     # D: Diabetes
-    if context.has_diabetes or any(code.startswith('E11') for code in context.conditions):
+    if context.has_diabetes or flags & index.bit('Diabetes'):
         score += 1
         factors['Diabetes'] = 1
 
     # S2: Stroke/TIA/thromboembolism
-    stroke_codes = ['I63', 'I64', 'G45', 'I74']
-    if context.has_stroke_tia or any(
-        any(code.startswith(sc) for sc in stroke_codes)
-        for code in context.conditions
-    ):
+    if context.has_stroke_tia or flags & index.bit('Stroke/TIA'):
         score += 2
         factors['Stroke/TIA'] = 2
 
     # V: Vascular disease
-    vascular_codes = ['I25', 'I70', 'I71']  # CAD, PAD, aortic disease
-    if context.has_vascular_disease or any(
-        any(code.startswith(vc) for vc in vascular_codes)
-        for code in context.conditions
-    ):
+    if context.has_vascular_disease or flags & index.bit('Vascular disease'):
         score += 1
         factors['Vascular disease'] = 1
 
@@ -132,19 +155,7 @@ def calculate_cha2ds2_vasc(context: PatientContext) -> RiskScore:
         factors['Female sex'] = 1
 
     # Calculate annual stroke risk based on score
-    risk_table = {
-        0: 0.2,
-        1: 0.6,
-        2: 2.2,
-        3: 3.2,
-        4: 4.8,
-        5: 7.2,
-        6: 9.7,
-        7: 11.2,
-        8: 10.8,
-        9: 12.2
-    }
-    annual_risk = risk_table.get(min(score, 9), 12.2)
+    annual_risk = RISK_TABLE.get(min(score, 9), 12.2)
 
     # Determine recommendation
     if context.gender.lower() == 'female':
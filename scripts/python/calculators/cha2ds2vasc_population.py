@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# ============================================================================
+# Script: cha2ds2vasc_population.py
+# Chapter: 6 - Clinical Decision Support
+# Textbook Section: 6.2 Risk Scores Implementation
+#
+# Description:
+#   Population CHA2DS2-VASc scoring straight from the OMOP CDM extracts.
+#   The Python counterpart of 02_calculate_cha2ds2vasc.sql, but for every
+#   person rather than person_id 12345: condition_occurrence is scanned
+#   once, its distinct ICD-10 source codes are classified, and criterion
+#   flags are OR'ed per person_id (condition_flags()). The flags and
+#   person demographics are then scored with calculate_cha2ds2_vasc_batch().
+#
+#   The CSV scan is split into line-aligned byte ranges that worker
+#   processes parse independently; each returns only the flags of its
+#   persons with a criterion, so the work scales with rows and cores.
+#   With --cache-dir the two columns are read from the columnar cache
+#   instead (omop_loader).
+#
+#   Conditions are classified by condition_source_value with the
+#   calculator's ICD-10 prefixes, not by the SQL's standard concepts,
+#   so results are identical to calculate_cha2ds2_vasc() for the same
+#   codes. Given a concept_ancestor extract (--concept-ancestor), the
+#   standard condition_concept_id is classified instead, against the
+#   descendants of CONCEPT_CRITERIA (vocabulary.py).
+#
+# Prerequisites:
+#   - Python 3.8+
+#   - numpy, pandas (pip install -r requirements.txt)
+#
+# Usage:
+#   python cha2ds2vasc_population.py [--data-dir DIR] [--output scores.csv]
+#                                    [--workers N] [--cache-dir DIR]
+#                                    [--concept-ancestor CONCEPT_ANCESTOR.csv]
+#                                    [--reference-date 2026-01-13]
+#
+# Expected Results:
+#   On the teaching dataset, Maria Rodriguez (person 12345) scores 3 at
+#   2026-01-13 (Hypertension, Diabetes, Female sex), as in the SQL.
+# ============================================================================
+
+"""
+Population CHA2DS2-VASc Scoring
+Every person in an OMOP extract, scored in one pass
+"""
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cha2ds2vasc_batch import (
+    CHF, DIABETES, HYPERTENSION, STROKE_TIA, VASCULAR,
+    calculate_cha2ds2_vasc_batch, condition_flags,
+)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'utilities'))
+
+from omop_loader import csv_byte_ranges, load_schema, load_table, read_csv_typed  # noqa: E402
+from vocabulary import (  # noqa: E402
+    ConceptAncestorIndex, concept_flags, expand_concept_sets, load_concept_ancestor,
+)
+
+FEMALE_CONCEPT_ID = 8532
+
+PERSON_COLUMNS = ['person_id', 'gender_concept_id', 'year_of_birth',
+                  'month_of_birth', 'day_of_birth', 'birth_datetime']
+CONDITION_COLUMNS = ['person_id', 'condition_source_value']
+CONCEPT_COLUMNS = ['person_id', 'condition_concept_id']
+
+# Standard concept ancestors of each criterion, used instead of the ICD-10
+# prefixes when a concept_ancestor index is given
+CONCEPT_CRITERIA = {
+    CHF: (316139,),                 # Heart failure
+    HYPERTENSION: (316866,),        # Hypertensive disorder
+    DIABETES: (201820,),            # Diabetes mellitus
+    STROKE_TIA: (443454, 373503),   # Cerebral infarction, TIA
+    VASCULAR: (317576, 321052),     # Coronary arteriosclerosis, PVD
+}
+
+# Byte ranges per worker: more, smaller ranges even out the load
+RANGES_PER_WORKER = 4
+
+
+def person_condition_flags(person_ids, codes, concept_sets: dict = None) -> tuple:
+    """
+    OR the criterion flags of long-format condition rows per person.
+
+    Args:
+        person_ids: person_id per condition row
+        codes: ICD-10 source code per condition row, or the standard
+            condition_concept_id when ``concept_sets`` is given
+        concept_sets: Optional criterion bit -> KeyIndex
+            (vocabulary.expand_concept_sets(CONCEPT_CRITERIA))
+
+    Returns:
+        (person_ids meeting any criterion, their uint8 flags)
+    """
+    owner, ids = pd.factorize(np.asarray(person_ids, dtype=np.int64))
+    if concept_sets is None:
+        flags = condition_flags(codes, owner, len(ids))
+    else:
+        row_flags = concept_flags(codes, concept_sets)
+        hits = np.flatnonzero(row_flags)
+        flags = np.zeros(len(ids), dtype=np.uint8)
+        np.bitwise_or.at(flags, owner[hits], row_flags[hits])
+    met = flags != 0
+    return ids[met], flags[met]
+
+
+def _merge_flags(parts: list) -> tuple:
+    """Combine per-range person_condition_flags() results."""
+    if not parts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint8)
+    if len(parts) == 1:
+        return parts[0]
+    # A person's rows may straddle ranges: OR their flags once more
+    owner, ids = pd.factorize(np.concatenate([p[0] for p in parts]))
+    flags = np.zeros(len(ids), dtype=np.uint8)
+    np.bitwise_or.at(flags, owner, np.concatenate([p[1] for p in parts]))
+    return ids, flags
+
+
+def _condition_frame_flags(df: pd.DataFrame, concept_sets: dict = None) -> tuple:
+    valid = df['person_id'].notna().to_numpy()
+    codes = df[CONDITION_COLUMNS[1] if concept_sets is None else CONCEPT_COLUMNS[1]]
+    return person_condition_flags(df['person_id'].to_numpy(dtype=np.int64, na_value=0)[valid],
+                                  codes[valid], concept_sets)
+
+
+def _range_flags(path: Path, schema: dict, offset: int, end: int,
+                 concept_sets: dict = None) -> tuple:
+    """Process-pool task: person_condition_flags() of one byte range."""
+    columns = CONDITION_COLUMNS if concept_sets is None else CONCEPT_COLUMNS
+    df = read_csv_typed(path, schema, usecols=columns, offset=offset, end=end)
+    return _condition_frame_flags(df, concept_sets)
+
+
+def scan_condition_flags(path: Path, schema: dict, workers: int = None,
+                         cache_dir: Path = None, concept_sets: dict = None) -> tuple:
+    """
+    Criterion flags per person_id from a condition_occurrence extract.
+
+    Args:
+        path: condition_occurrence CSV
+        schema: Output of omop_loader.load_schema()
+        workers: Worker processes for the CSV scan (default: all CPUs;
+            1 scans in this process)
+        cache_dir: Optional columnar cache; the cached columns are read
+            in this process instead of scanning the CSV
+        concept_sets: Optional criterion bit -> KeyIndex
+            (vocabulary.expand_concept_sets(CONCEPT_CRITERIA)); classifies
+            condition_concept_id instead of the ICD-10 source value
+
+    Returns:
+        (person_ids meeting any criterion, their uint8 flags)
+    """
+    if cache_dir is not None:
+        columns = CONDITION_COLUMNS if concept_sets is None else CONCEPT_COLUMNS
+        return _condition_frame_flags(load_table(path, schema, cache_dir, usecols=columns),
+                                      concept_sets)
+
+    workers = workers or os.cpu_count() or 1
+    ranges = csv_byte_ranges(path, workers * RANGES_PER_WORKER if workers > 1 else 1)
+    if workers == 1:
+        return _merge_flags([_range_flags(path, schema, *r, concept_sets) for r in ranges])
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(_range_flags, [path] * len(ranges), [schema] * len(ranges),
+                              *zip(*ranges), [concept_sets] * len(ranges)))
+    return _merge_flags(parts)
+
+
+def birth_dates(person: pd.DataFrame) -> np.ndarray:
+    """
+    Birth date per person as datetime64[D].
+
+    birth_datetime where present; otherwise year/month/day of birth,
+    with a missing month or day taken as 1 (as MAKE_DATE in the SQL).
+    """
+    births = pd.to_datetime(person['birth_datetime']) if 'birth_datetime' in person \
+        else pd.Series(pd.NaT, index=person.index)
+    missing = births.isna().to_numpy()
+    if missing.any():
+        parts = person.loc[missing, ['year_of_birth', 'month_of_birth', 'day_of_birth']]
+        parts = parts.astype('float64').fillna({'month_of_birth': 1, 'day_of_birth': 1})
+        births = births.copy()
+        births[missing] = pd.to_datetime(pd.DataFrame({
+            'year': parts['year_of_birth'],
+            'month': parts['month_of_birth'],
+            'day': parts['day_of_birth'],
+        }), errors='coerce')
+    return births.to_numpy().astype('datetime64[D]')
+
+
+def score_population(data_dir: Path, reference_date: date = None, workers: int = None,
+                     cache_dir: Path = None,
+                     vocabulary: ConceptAncestorIndex = None) -> pd.DataFrame:
+    """
+    Score every person in an OMOP extract.
+
+    Every person row with a person_id is returned, so totals reconcile
+    with person.csv: persons without a usable birth date cannot be aged
+    and get null scores (score, annual_stroke_risk, recommendation and
+    factors all missing). Condition rows of persons missing from the
+    person table are ignored.
+
+    Args:
+        data_dir: Directory holding person.csv and condition_occurrence.csv
+        reference_date: Date at which age is evaluated (default: today)
+        workers: Worker processes for the condition scan
+        cache_dir: Optional columnar cache directory
+        vocabulary: Optional concept_ancestor index; conditions are then
+            classified by their standard concept under CONCEPT_CRITERIA
+
+    Returns:
+        DataFrame indexed by person_id with score, annual_stroke_risk,
+        recommendation and one column per factor (score and factors as
+        nullable Int64)
+    """
+    data_dir = Path(data_dir)
+    schema = load_schema(data_dir)
+    person = load_table(data_dir / 'person.csv', schema, cache_dir, usecols=PERSON_COLUMNS)
+    person = person[person['person_id'].notna()]
+    births = birth_dates(person)
+    person_ids = person['person_id'].to_numpy(dtype=np.int64)
+
+    flags = np.zeros(len(person), dtype=np.uint8)
+    condition_path = data_dir / 'condition_occurrence.csv'
+    if condition_path.exists():
+        concept_sets = None if vocabulary is None else expand_concept_sets(CONCEPT_CRITERIA, vocabulary)
+        ids, id_flags = scan_condition_flags(condition_path, schema, workers, cache_dir,
+                                             concept_sets)
+        positions = pd.Index(person_ids).get_indexer(ids)
+        known = positions >= 0
+        np.bitwise_or.at(flags, positions[known], id_flags[known])
+
+    female = person['gender_concept_id'].to_numpy(dtype=np.int64, na_value=0) == FEMALE_CONCEPT_ID
+    scored = np.flatnonzero(~np.isnat(births))
+    flags = flags[scored]
+    result = calculate_cha2ds2_vasc_batch(
+        births[scored],
+        np.where(female[scored], 'female', 'male'),
+        has_chf=(flags & CHF) != 0,
+        has_hypertension=(flags & HYPERTENSION) != 0,
+        has_diabetes=(flags & DIABETES) != 0,
+        has_stroke_tia=(flags & STROKE_TIA) != 0,
+        has_vascular_disease=(flags & VASCULAR) != 0,
+        reference_date=reference_date
+    )
+    # Back to one row per person, unscored rows null
+    scores = result.to_frame(index=scored).reindex(np.arange(len(person)))
+    integers = ['score', *result.factors]
+    scores[integers] = scores[integers].astype('Int64')
+    scores.index = pd.Index(person_ids, name='person_id')
+    return scores
+
+
+def write_scores(scores: pd.DataFrame, path: Path):
+    """Write scores as Parquet (.parquet) or CSV."""
+    path = Path(path)
+    if path.suffix == '.parquet':
+        scores.to_parquet(path)
+    else:
+        scores.to_csv(path)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from cha2ds2vasc_calculator import PatientContext, calculate_cha2ds2_vasc
+
+    parser = argparse.ArgumentParser(description="Population CHA2DS2-VASc scoring")
+    parser.add_argument('--data-dir', type=Path,
+                        default=Path(__file__).resolve().parents[3] / 'data' / 'csv')
+    parser.add_argument('--output', type=Path, default=None,
+                        help="Write scores to this CSV or .parquet file")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Worker processes for the condition scan (default: all CPUs)")
+    parser.add_argument('--cache-dir', type=Path, default=None,
+                        help="Read tables through the columnar cache")
+    parser.add_argument('--concept-ancestor', type=Path, default=None,
+                        help="concept_ancestor extract: classify conditions by "
+                             "standard concept instead of ICD-10 code")
+    parser.add_argument('--reference-date', type=date.fromisoformat, default=None,
+                        help="Date at which age is evaluated (default: today)")
+    parser.add_argument('--check', type=int, default=1000,
+                        help="Persons compared against calculate_cha2ds2_vasc()")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    vocabulary = None
+    if args.concept_ancestor:
+        vocabulary = load_concept_ancestor(args.concept_ancestor, args.cache_dir)
+    scores = score_population(args.data_dir, args.reference_date, args.workers,
+                              args.cache_dir, vocabulary)
+    seconds = time.perf_counter() - start
+    if args.output:
+        write_scores(scores, args.output)
+
+    # Cross-check a sample against the per-patient calculator, which
+    # always evaluates age at today's date and classifies ICD-10 codes
+    mismatches = 0
+    sample = scores.index[scores['score'].notna()][:args.check]
+    if (len(sample) and args.reference_date in (None, date.today())
+            and vocabulary is None):
+        schema = load_schema(args.data_dir)
+        person = read_csv_typed(args.data_dir / 'person.csv', schema, usecols=PERSON_COLUMNS)
+        person = person.set_index('person_id')
+        births = pd.Series(birth_dates(person.reset_index()), index=person.index)
+        conditions = read_csv_typed(args.data_dir / 'condition_occurrence.csv', schema,
+                                    usecols=CONDITION_COLUMNS)
+        conditions = conditions[conditions['person_id'].isin(sample)]
+        by_person = (conditions['condition_source_value'].astype(object).dropna()
+                     .groupby(conditions['person_id']).agg(list))
+        for person_id in sample:
+            expected = calculate_cha2ds2_vasc(PatientContext(
+                birth_date=births[person_id].date(),
+                gender='female' if person.at[person_id, 'gender_concept_id']
+                == FEMALE_CONCEPT_ID else 'male',
+                conditions=by_person.get(person_id, [])
+            ))
+            row = scores.loc[person_id]
+            mismatches += (expected.score != row['score']
+                           or expected.recommendation != row['recommendation'])
+    else:
+        sample = sample[:0]
+
+    print("=" * 60)
+    print("CHA2DS2-VASc Population Scoring from OMOP CDM")
+    print("=" * 60)
+    unscored = int(scores['score'].isna().sum())
+    print(f"Persons scored: {len(scores) - unscored:,} of {len(scores):,} in {seconds:.3f}s "
+          f"({len(scores) / seconds:,.0f} persons/s)")
+    if unscored:
+        print(f"Persons without a birth date (null score): {unscored:,}")
+    print("Score distribution:")
+    print(scores['score'].value_counts().sort_index().to_string())
+    if len(sample):
+        print(f"Mismatches vs calculate_cha2ds2_vasc: {mismatches} / {len(sample):,}")
+    if 12345 in scores.index:
+        maria = scores.loc[12345]
+        print(f"Person 12345: score {maria['score']}, {maria['recommendation']}")
+    if args.output:
+        print(f"Scores written to {args.output}")
+    print("=" * 60)
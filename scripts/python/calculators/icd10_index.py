@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# ============================================================================
+# Script: icd10_index.py
+# Chapter: 6 - Clinical Decision Support
+# Textbook Section: 6.2 Risk Scores Implementation
+#
+# Description:
+#   Compiled ICD-10 prefix index for risk-score criteria. Criteria are
+#   declared once as lists of code prefixes and compiled into a prefix
+#   trie, so a single walk over a patient's diagnosis codes classifies
+#   every code against every criterion at the same time.
+#
+# Prerequisites:
+#   - Python 3.8+
+#   - No external dependencies (uses standard library only)
+#
+# Usage:
+#   from icd10_index import ICD10PrefixIndex
+#   index = ICD10PrefixIndex({'CHF': ['I50'], 'Diabetes': ['E11']})
+#   index.names(index.classify_all(['I10', 'E11.9']))  # ['Diabetes']
+# ============================================================================
+
+"""
+ICD-10 Prefix Index
+Shared criteria matching for clinical risk scores
+"""
+
+from typing import Dict, Iterable, List
+
+# Trie key holding the criterion flags of codes that end at a node
+_TERMINAL = ''
+
+
+def normalize_code(code: str) -> str:
+    """Normalize an ICD-10 code for matching ('i50.9 ' -> 'I509')."""
+    return code.strip().upper().replace('.', '')
+
+
+class ICD10PrefixIndex:
+    """
+    Prefix trie mapping ICD-10 codes to criterion bit flags.
+
+    Each criterion is assigned one bit in declaration order. Looking up
+    a code walks the trie once, collecting the flags of every declared
+    prefix it passes, so the cost is bounded by the code length rather
+    than by the number of prefixes or criteria. Results are memoized per
+    distinct code, which keeps patients with hundreds of (largely
+    repeated) historic codes cheap to classify.
+    """
+
+    def __init__(self, criteria: Dict[str, Iterable[str]]):
+        if len(criteria) > 63:
+            raise ValueError("ICD10PrefixIndex supports at most 63 criteria")
+
+        self.criteria = {name: tuple(prefixes) for name, prefixes in criteria.items()}
+        self.bits = {name: 1 << i for i, name in enumerate(self.criteria)}
+        self.all_flags = (1 << len(self.criteria)) - 1
+        self._root: dict = {}
+        self._cache: Dict[str, int] = {}
+
+        for name, prefixes in self.criteria.items():
+            for prefix in prefixes:
+                node = self._root
+                for char in normalize_code(prefix):
+                    node = node.setdefault(char, {})
+                node[_TERMINAL] = node.get(_TERMINAL, 0) | self.bits[name]
+
+    def bit(self, name: str) -> int:
+        """Return the flag assigned to a criterion."""
+        return self.bits[name]
+
+    def classify(self, code: str) -> int:
+        """Return the OR'ed flags of every criterion matching one code."""
+        flags = self._cache.get(code)
+        if flags is not None:
+            return flags
+
+        flags = 0
+        node = self._root
+        for char in normalize_code(code):
+            node = node.get(char)
+            if node is None:
+                break
+            flags |= node.get(_TERMINAL, 0)
+
+        self._cache[code] = flags
+        return flags
+
+    def classify_all(self, codes: Iterable[str]) -> int:
+        """Return the OR'ed flags for a patient's codes in a single pass."""
+        flags = 0
+        for code in codes:
+            flags |= self.classify(code)
+            if flags == self.all_flags:
+                break
+        return flags
+
+    def names(self, flags: int) -> List[str]:
+        """Return the criterion names set in flags, in declaration order."""
+        return [name for name, bit in self.bits.items() if flags & bit]
@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+# ============================================================================
+# Script: bp_control_trends.py
+# Chapter: 7 - Quality Measurement & Population Health
+# Textbook Section: 7.2 HEDIS Quality Measure Implementation
+#
+# Description:
+#   Longitudinal blood pressure series for hypertension control reporting.
+#   02_bp_control_trends.sql pivots one patient's systolic (8480-6) and
+#   diastolic (8462-4) readings per visit with MAX(CASE ...) and reads
+#   control (<140/90) off by hand. Here measurement.csv is pivoted for
+#   every person at once with a vectorized group-by, one row per person
+#   and visit, and each person gets:
+#     - per-reading control status, change from the previous reading and
+#       a rolling mean over the last readings
+#     - latest-reading control status and the least-squares slope of
+#       systolic and diastolic pressure (mmHg per 30 days)
+#
+#   BPSeriesStore keeps the pivoted series as append-only columnar
+#   segments plus a per-person summary. A refresh reads only the bytes
+#   appended to measurement.csv since the previous one (a file edited
+#   anywhere before its old end is rebuilt in full), writes them as a
+#   new segment and recomputes the summary of the persons they touch.
+#
+#   When a visit has several readings, the lowest systolic and the
+#   lowest diastolic count, as in HEDIS (the SQL takes the highest).
+#
+# Prerequisites:
+#   - Python 3.8+
+#   - numpy, pandas (pip install -r requirements.txt)
+#
+# Usage:
+#   python bp_control_trends.py [--data-dir DIR] [--store DIR]
+#                               [--person 12345] [--output summary.csv]
+#                               [--check]
+#
+# Expected Results:
+#   Maria Rodriguez (person 12345): 148/92 (not controlled), 142/88,
+#   132/82 (controlled), improving by about 50 mmHg systolic per 30 days.
+# ============================================================================
+
+"""
+Blood Pressure Control Trends
+Per-visit BP series, control status and trends for every person
+"""
+
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'utilities'))
+
+from omop_loader import (  # noqa: E402
+    CACHE_FORMAT, ends_with_newline, file_digests, load_schema, read_csv_typed,
+)
+
+SYSTOLIC_CONCEPT, DIASTOLIC_CONCEPT = 3004249, 3012888
+SYSTOLIC_CODE, DIASTOLIC_CODE = '8480-6', '8462-4'
+CONTROL_SYSTOLIC, CONTROL_DIASTOLIC = 140, 90
+
+MEASUREMENT_COLUMNS = ['person_id', 'visit_occurrence_id', 'measurement_concept_id',
+                       'measurement_date', 'value_as_number', 'measurement_source_value']
+KEY_COLUMNS = ['person_id', 'measurement_date', 'visit_occurrence_id']
+SERIES_COLUMNS = KEY_COLUMNS + ['systolic', 'diastolic']
+
+# Readings per rolling mean, and the slope (mmHg per 30 days) beyond
+# which a person's systolic or diastolic trend counts as changing
+ROLLING_READINGS = 3
+SLOPE_THRESHOLD = 1.0
+
+CONTROLLED, UNCONTROLLED, INCOMPLETE = 'controlled', 'uncontrolled', 'incomplete'
+STATUSES = (CONTROLLED, UNCONTROLLED, INCOMPLETE)
+TRENDS = ('baseline', 'improving', 'stable', 'worsening')
+
+# Store layout and refresh parameters
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_VERSION = 3
+SUMMARY_FILE = f'summary.{CACHE_FORMAT}'
+READ_CHUNK_ROWS = 1_000_000
+MAX_SEGMENTS = 16
+
+
+def pivot_vitals(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Pivot BP measurements to one row per (person, date, visit).
+
+    Readings are recognised by concept id or LOINC source value. Rows
+    without a visit are paired by date (visit_occurrence_id -1).
+
+    Returns:
+        DataFrame with SERIES_COLUMNS, sorted by person, date and visit
+    """
+    concept = df['measurement_concept_id'].to_numpy(dtype=np.int64, na_value=0)
+    source = df['measurement_source_value'].astype(object).to_numpy()
+    systolic = (concept == SYSTOLIC_CONCEPT) | (source == SYSTOLIC_CODE)
+    diastolic = (concept == DIASTOLIC_CONCEPT) | (source == DIASTOLIC_CODE)
+    keep = (systolic | diastolic) & df['person_id'].notna().to_numpy() \
+        & df['measurement_date'].notna().to_numpy()
+
+    readings = pd.DataFrame({
+        'person_id': df['person_id'].to_numpy(dtype=np.int64, na_value=-1)[keep],
+        'measurement_date': df['measurement_date'].to_numpy(dtype='datetime64[ns]')[keep]
+        .astype('datetime64[D]'),
+        'visit_occurrence_id': df['visit_occurrence_id'].to_numpy(dtype=np.int64,
+                                                                  na_value=-1)[keep],
+        'systolic': np.where(systolic, df['value_as_number'].to_numpy(dtype=np.float64,
+                                                                     na_value=np.nan),
+                             np.nan)[keep],
+    })
+    readings['diastolic'] = np.where(systolic[keep], np.nan,
+                                     df['value_as_number'].to_numpy(
+                                         dtype=np.float64, na_value=np.nan)[keep])
+    return combine_series(readings)
+
+
+def combine_series(series: pd.DataFrame) -> pd.DataFrame:
+    """
+    Merge rows with the same (person, date, visit), keeping the lowest
+    systolic and diastolic; used both to pivot readings and to merge
+    segments whose visits straddle a refresh.
+    """
+    series = series.groupby(KEY_COLUMNS, sort=True)[['systolic', 'diastolic']].min()
+    return series.reset_index()[SERIES_COLUMNS]
+
+
+def _control_codes(systolic: np.ndarray, diastolic: np.ndarray) -> np.ndarray:
+    """Index into STATUSES per reading."""
+    complete = ~np.isnan(systolic) & ~np.isnan(diastolic)
+    controlled = (systolic < CONTROL_SYSTOLIC) & (diastolic < CONTROL_DIASTOLIC)
+    return np.where(complete, np.where(controlled, 0, 1), 2).astype(np.int8)
+
+
+def _trend_codes(systolic_change: np.ndarray, diastolic_change: np.ndarray,
+                 before: np.ndarray, after: np.ndarray,
+                 threshold: float = 0.0) -> np.ndarray:
+    """
+    Index into TRENDS (never baseline) from both components' change and
+    the control status codes before and after it.
+
+    Crossing into uncontrolled is worsening and into controlled is
+    improving, whatever the numbers did. Otherwise the trend is
+    improving when a component fell by more than ``threshold`` and
+    neither rose by more, worsening the other way round, and stable
+    when neither moved or they moved apart (a missing change is ignored).
+    """
+    up = (systolic_change > threshold) | (diastolic_change > threshold)
+    down = (systolic_change < -threshold) | (diastolic_change < -threshold)
+    trend = np.select([(before == 0) & (after == 1), (before == 1) & (after == 0),
+                       down & ~up, up & ~down], [3, 1, 1, 3], default=2)
+    return trend.astype(np.int8)
+
+
+def _group_starts(person: np.ndarray) -> np.ndarray:
+    """Start row of each person's run in a person-sorted array."""
+    return np.flatnonzero(np.r_[True, person[1:] != person[:-1]]) if len(person) \
+        else np.zeros(0, dtype=np.int64)
+
+
+def _rolling_mean(values: np.ndarray, starts: np.ndarray, window: int) -> np.ndarray:
+    """Mean of each row's last ``window`` non-missing values within its person."""
+    present = ~np.isnan(values)
+    sums = np.r_[0, np.cumsum(np.where(present, values, 0))]
+    counts = np.r_[0, np.cumsum(present)]
+    row = np.arange(len(values))
+    first = np.repeat(starts, np.diff(np.r_[starts, len(values)]))
+    lower = np.maximum(row + 1 - window, first)
+    n = counts[row + 1] - counts[lower]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(n > 0, (sums[row + 1] - sums[lower]) / n, np.nan)
+
+
+def add_trends(series: pd.DataFrame, window: int = ROLLING_READINGS) -> pd.DataFrame:
+    """
+    Per-reading status and trend columns for a person-sorted series.
+
+    Adds control_status, systolic/diastolic change from the person's
+    previous reading, rolling means over the last ``window`` readings
+    and a trend label (baseline for a person's first reading, otherwise
+    from the change in both components and in control status since the
+    previous reading; see _trend_codes).
+    """
+    series = series.copy()
+    person = series['person_id'].to_numpy()
+    starts = _group_starts(person)
+    first = np.zeros(len(series), dtype=bool)
+    first[starts] = True
+
+    for column in ('systolic', 'diastolic'):
+        values = series[column].to_numpy(dtype=np.float64)
+        change = np.diff(values, prepend=np.nan)
+        change[first] = np.nan
+        series[f'{column}_change'] = change
+        series[f'{column}_rolling'] = _rolling_mean(values, starts, window)
+
+    status = _control_codes(series['systolic'].to_numpy(dtype=np.float64),
+                            series['diastolic'].to_numpy(dtype=np.float64))
+    series['control_status'] = pd.Categorical.from_codes(status, categories=STATUSES)
+    trend = _trend_codes(series['systolic_change'].to_numpy(),
+                         series['diastolic_change'].to_numpy(),
+                         np.roll(status, 1), status)
+    trend[first] = 0
+    series['trend'] = pd.Categorical.from_codes(trend, categories=TRENDS)
+    return series
+
+
+def summarize(series: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per person from a person- and date-sorted series.
+
+    Columns: readings, first_date, latest_date, latest_systolic,
+    latest_diastolic, latest_status, systolic_slope and diastolic_slope
+    (least squares, mmHg per 30 days; NaN with fewer than two dated
+    readings) and trend (from both slopes, SLOPE_THRESHOLD and the
+    control status of the first and latest readings; see _trend_codes).
+    """
+    person = series['person_id'].to_numpy(dtype=np.int64)
+    starts = _group_starts(person)
+    if not len(starts):
+        return pd.DataFrame(columns=['person_id', 'readings', 'first_date', 'latest_date',
+                                     'latest_systolic', 'latest_diastolic', 'latest_status',
+                                     'systolic_slope', 'diastolic_slope', 'trend'])
+    last = np.r_[starts[1:], len(person)] - 1
+    dates = series['measurement_date'].to_numpy(dtype='datetime64[D]')
+    # Days since the person's first reading keeps the sums well conditioned
+    days = (dates - np.repeat(dates[starts], np.diff(np.r_[starts, len(person)])))
+    days = days.astype(np.float64)
+    systolic = series['systolic'].to_numpy(dtype=np.float64)
+    diastolic = series['diastolic'].to_numpy(dtype=np.float64)
+
+    latest_status = _control_codes(systolic[last], diastolic[last])
+
+    summary = pd.DataFrame({
+        'person_id': person[starts],
+        'readings': np.diff(np.r_[starts, len(person)]),
+        'first_date': dates[starts],
+        'latest_date': dates[last],
+        'latest_systolic': systolic[last],
+        'latest_diastolic': diastolic[last],
+        'latest_status': pd.Categorical.from_codes(latest_status, categories=STATUSES),
+    })
+    for column, values in (('systolic', systolic), ('diastolic', diastolic)):
+        present = ~np.isnan(values)
+        x, y = np.where(present, days, 0), np.where(present, values, 0)
+        n, sx, sy, sxx, sxy = (np.add.reduceat(v, starts).astype(np.float64)
+                               for v in (present, x, y, x * x, x * y))
+        denominator = n * sxx - sx * sx
+        with np.errstate(invalid='ignore', divide='ignore'):
+            slope = np.where(denominator > 0, (n * sxy - sx * sy) / denominator * 30, np.nan)
+        summary[f'{column}_slope'] = slope
+
+    systolic_slope = summary['systolic_slope'].to_numpy()
+    diastolic_slope = summary['diastolic_slope'].to_numpy()
+    trend = _trend_codes(systolic_slope, diastolic_slope,
+                         _control_codes(systolic[starts], diastolic[starts]), latest_status,
+                         SLOPE_THRESHOLD)
+    trend[np.isnan(systolic_slope) & np.isnan(diastolic_slope)] = 0
+    summary['trend'] = pd.Categorical.from_codes(trend, categories=TRENDS)
+    return summary
+
+
+def build_series(measurements: Path, schema: dict = None,
+                 offset: int = 0, end: int = None) -> pd.DataFrame:
+    """Pivot measurement.csv (or its bytes from ``offset``) in chunks."""
+    chunks = read_csv_typed(measurements, schema, usecols=MEASUREMENT_COLUMNS,
+                            chunksize=READ_CHUNK_ROWS, offset=offset, end=end)
+    parts = [pivot_vitals(chunk) for chunk in chunks]
+    if not parts:
+        return _empty_series()
+    return combine_series(pd.concat(parts, ignore_index=True))
+
+
+def _data_start(path: Path) -> int:
+    """Byte offset of the first row after the header."""
+    with open(path, 'rb') as f:
+        return len(f.readline())
+
+
+def _empty_series() -> pd.DataFrame:
+    return pd.DataFrame({c: pd.Series(dtype=t) for c, t in zip(
+        SERIES_COLUMNS, ['int64', 'datetime64[s]', 'int64', 'float64', 'float64'])})
+
+
+class BPSeriesStore:
+    """
+    Append-only per-person BP series with an incrementally refreshed summary.
+
+    The directory holds a manifest (source file size, mtime and content
+    digest, as in validate_data.validate_incremental), the series
+    as columnar segments sorted by person and date, and summary.
+    Segments are only ever added; once there are more than MAX_SEGMENTS
+    they are merged into one.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.manifest_path = self.directory / MANIFEST_FILE
+        self.manifest = {'version': MANIFEST_VERSION, 'source': None, 'segments': [],
+                         'next_segment': 0}
+        if self.manifest_path.exists():
+            stored = json.loads(self.manifest_path.read_text())
+            if stored.get('version') == MANIFEST_VERSION:
+                self.manifest = stored
+
+    def _write(self, name: str, df: pd.DataFrame):
+        partial = self.directory / f'{name}.{os.getpid()}.tmp'
+        if CACHE_FORMAT == 'parquet':
+            df.to_parquet(partial, index=False)
+        else:
+            df.to_pickle(partial)
+        os.replace(partial, self.directory / name)
+
+    def _read(self, name: str, persons: np.ndarray = None) -> pd.DataFrame:
+        path = self.directory / name
+        if CACHE_FORMAT == 'parquet':
+            filters = [('person_id', 'in', persons.tolist())] if persons is not None else None
+            df = pd.read_parquet(path, filters=filters)
+            # Parquet stores dates at millisecond resolution
+            for column in ('measurement_date', 'first_date', 'latest_date'):
+                if column in df:
+                    df[column] = df[column].astype('datetime64[s]')
+            return df
+        df = pd.read_pickle(path)
+        return df[df['person_id'].isin(persons)].reset_index(drop=True) \
+            if persons is not None else df
+
+    def series(self, persons=None) -> pd.DataFrame:
+        """The stored series, optionally for some persons only."""
+        persons = None if persons is None else np.unique(np.asarray(persons, dtype=np.int64))
+        parts = [self._read(name, persons) for name in self.manifest['segments']]
+        if not parts:
+            return _empty_series()
+        series = pd.concat(parts, ignore_index=True)
+        return combine_series(series) if len(parts) > 1 else series
+
+    def summary(self) -> pd.DataFrame:
+        if not (self.directory / SUMMARY_FILE).exists():
+            return summarize(_empty_series())
+        return self._read(SUMMARY_FILE)
+
+    def refresh(self, measurements: Path, schema: dict = None) -> dict:
+        """
+        Bring the store up to date with measurement.csv.
+
+        Returns:
+            {'mode': 'unchanged' | 'appended' | 'rebuilt',
+             'readings': new series rows, 'persons': persons touched}
+        """
+        measurements = Path(measurements)
+        stat = measurements.stat()
+        source = self.manifest['source']
+        if source is None:
+            mode = 'rebuilt'
+            digest = file_digests(measurements, 0, stat.st_size)[1]
+        elif source['size'] == stat.st_size and source['mtime_ns'] == stat.st_mtime_ns:
+            mode = 'unchanged'
+            digest = source['digest']
+        else:
+            # An append only if the bytes already stored are unchanged
+            grown = stat.st_size >= source['size']
+            previous, digest = file_digests(measurements, source['size'] if grown else 0,
+                                            stat.st_size)
+            if grown and source['ends_with_newline'] and previous == source['digest']:
+                mode = 'appended' if stat.st_size > source['size'] else 'unchanged'
+            else:
+                mode = 'rebuilt'
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        new = _empty_series()
+        if mode != 'unchanged':
+            offset = source['size'] if mode == 'appended' else _data_start(measurements)
+            new = build_series(measurements, schema, offset=offset, end=stat.st_size)
+            if mode == 'rebuilt':
+                self.manifest['segments'] = []
+            if len(new):
+                name = f"segment-{self.manifest['next_segment']:05d}.{CACHE_FORMAT}"
+                self._write(name, new)
+                self.manifest['segments'].append(name)
+                self.manifest['next_segment'] += 1
+            if len(self.manifest['segments']) > MAX_SEGMENTS:
+                self._compact()
+
+            persons = new['person_id'].unique()
+            if mode == 'rebuilt':
+                summary = summarize(new)
+            else:
+                kept = self.summary()
+                kept = kept[~kept['person_id'].isin(persons)]
+                summary = pd.concat([kept, summarize(self.series(persons))],
+                                    ignore_index=True)
+                summary = summary.sort_values('person_id', ignore_index=True)
+            self._write(SUMMARY_FILE, summary)
+
+        # The manifest is written last: after an interrupted refresh the
+        # next one redoes the work instead of trusting partial files
+        self.manifest['source'] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'digest': digest,
+            'ends_with_newline': ends_with_newline(measurements, stat.st_size),
+        }
+        partial = self.manifest_path.with_suffix('.tmp')
+        partial.write_text(json.dumps(self.manifest, indent=2))
+        os.replace(partial, self.manifest_path)
+        self._remove_stale()
+        return {'mode': mode, 'readings': len(new), 'persons': new['person_id'].nunique()}
+
+    def _compact(self):
+        """Merge all segments into one."""
+        series = self.series()
+        name = f"segment-{self.manifest['next_segment']:05d}.{CACHE_FORMAT}"
+        self._write(name, series)
+        self.manifest['segments'] = [name]
+        self.manifest['next_segment'] += 1
+
+    def _remove_stale(self):
+        """Delete segment files the manifest no longer lists."""
+        live = set(self.manifest['segments'])
+        for path in self.directory.glob(f'segment-*.{CACHE_FORMAT}'):
+            if path.name not in live:
+                path.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Blood pressure control trends")
+    parser.add_argument('--data-dir', type=Path,
+                        default=Path(__file__).resolve().parents[3] / 'data' / 'csv')
+    parser.add_argument('--store', type=Path, default=None,
+                        help="Keep the series in this directory and refresh it "
+                             "incrementally")
+    parser.add_argument('--person', type=int, default=12345,
+                        help="Person whose readings are printed")
+    parser.add_argument('--output', type=Path, default=None,
+                        help="Write the per-person summary to this CSV")
+    parser.add_argument('--check', action='store_true',
+                        help="Compare the store's summary with a full rebuild")
+    args = parser.parse_args()
+
+    measurements = args.data_dir / 'measurement.csv'
+    schema = load_schema(args.data_dir)
+    start = time.perf_counter()
+    if args.store:
+        store = BPSeriesStore(args.store)
+        result = store.refresh(measurements, schema)
+        summary = store.summary()
+        series = store.series([args.person])
+    else:
+        result = None
+        series = build_series(measurements, schema)
+        summary = summarize(series)
+        series = series[series['person_id'] == args.person]
+    seconds = time.perf_counter() - start
+
+    print("=" * 60)
+    print("Blood Pressure Control Trends")
+    print("=" * 60)
+    if result:
+        print(f"Store {args.store}: {result['mode']}, {result['readings']:,} new readings "
+              f"for {result['persons']:,} persons")
+    print(f"{len(summary):,} persons in {seconds:.3f}s")
+    counts = summary['latest_status'].value_counts().reindex(STATUSES, fill_value=0)
+    for status, count in counts.items():
+        print(f"  Latest reading {status:<13} {count:>8,} "
+              f"({count / max(1, len(summary)):.1%})")
+
+    print(f"\nPerson {args.person}:")
+    for row in add_trends(series).itertuples(index=False):
+        print(f"  {row.measurement_date:%Y-%m-%d}  {row.systolic:>5.0f}/{row.diastolic:<4.0f}"
+              f" {row.control_status:<13} {row.trend}")
+    person = summary[summary['person_id'] == args.person]
+    for row in person.itertuples(index=False):
+        print(f"  Latest {row.latest_status}, systolic slope "
+              f"{row.systolic_slope:+.1f} mmHg/30 days ({row.trend})")
+
+    if args.check and args.store:
+        expected = summarize(build_series(measurements, schema))
+        print(f"\nFull rebuild matches the store: {expected.equals(summary)}")
+    if args.output:
+        summary.to_csv(args.output, index=False)
+        print(f"Summary written to {args.output}")
+    print("=" * 60)
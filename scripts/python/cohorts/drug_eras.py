@@ -0,0 +1,484 @@
+#!/usr/bin/env python3
+# ============================================================================
+# Script: drug_eras.py
+# Chapter: 10 - Outcomes, Research & Continuous Improvement
+# Textbook Section: 10.3 Research Applications
+#
+# Description:
+#   Builds OMOP drug_era rows and proportion of days covered (PDC) from
+#   drug_exposure, for analyses such as the anticoagulated AFib cohort
+#   of 01_afib_research_cohort.sql, which needs continuous therapy
+#   rather than single prescriptions, and for adherence reporting.
+#
+#   Each exposure becomes an interval [start, end): end is
+#   drug_exposure_end_date, else verbatim_end_date, else start +
+#   days_supply * (refills + 1), else start + days_supply, and at least
+#   one day. Drugs are rolled up to ingredients when a concept_ancestor
+#   extract and ingredient list are given, and are otherwise their own
+#   ingredient.
+#
+#   Eras follow the OHDSI convention: sorted by (person, ingredient,
+#   start), an exposure starting at most --gap-days (30) after the end
+#   of everything before it in the same era extends that era. The
+#   running end is a cumulative maximum computed for all groups at once,
+#   so the whole build is one sort plus linear array passes. gap_days is
+#   the era length minus the days its exposures cover.
+#
+#   PDC follows the PQA method: within the measurement period, from the
+#   first fill to the end of the period, with an early refill's supply
+#   shifted to start when the previous one runs out.
+#
+#   For extracts larger than memory the scan writes exposures to
+#   person-id partitions on disk (person_id % partitions) in chunks, and
+#   each partition - every exposure of its persons - is then built on
+#   its own. Both stages run across processes.
+#
+# Prerequisites:
+#   - Python 3.8+
+#   - numpy, pandas (pip install -r requirements.txt)
+#
+# Usage:
+#   python drug_eras.py [--data-dir DIR] [--output drug_era.csv]
+#                       [--pdc-output pdc.csv] [--gap-days 30]
+#                       [--as-of 2026-07-06] [--workers N] [--partitions N]
+#                       [--work-dir DIR] [--cache-dir DIR]
+#                       [--concept-ancestor CONCEPT_ANCESTOR.csv
+#                        --ingredients 1310149 ...]
+#
+# Expected Results:
+#   Maria Rodriguez (teaching dataset): one era per drug; her lisinopril
+#   and metformin prescriptions run to 2026-05-15 and 2026-02-10 and her
+#   anticoagulant and metoprolol to July 2026.
+# ============================================================================
+
+"""
+Drug Era Builder
+OMOP drug_era rows and proportion of days covered from drug_exposure
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'utilities'))
+
+from omop_loader import csv_byte_ranges, load_schema, load_table, read_csv_typed  # noqa: E402
+from vocabulary import (  # noqa: E402
+    ConceptAncestorIndex, expand_concept_sets, load_concept_ancestor,
+)
+
+EXPOSURE_COLUMNS = ['person_id', 'drug_concept_id', 'drug_exposure_start_date',
+                    'drug_exposure_end_date', 'verbatim_end_date', 'days_supply', 'refills']
+ERA_COLUMNS = ['drug_era_id', 'person_id', 'drug_concept_id', 'drug_era_start_date',
+               'drug_era_end_date', 'drug_exposure_count', 'gap_days']
+PDC_COLUMNS = ['person_id', 'drug_concept_id', 'fills', 'first_fill_date',
+               'days_in_period', 'days_covered', 'pdc', 'adherent']
+
+# OHDSI persistence window, and the PDC counted as adherent
+GAP_DAYS = 30
+ADHERENCE_THRESHOLD = 0.8
+PERIOD_DAYS = 365
+
+# Anticoagulant ingredients of 01_afib_research_cohort.sql
+ANTICOAGULANTS = {
+    1310149: 'Warfarin',
+    40228152: 'Apixaban',
+    40241331: 'Rivaroxaban',
+    43013024: 'Dabigatran',
+    793143: 'Edoxaban',
+}
+
+# Scan and partition sizing
+READ_CHUNK_ROWS = 1_000_000
+PARTITION_BYTES = 256 << 20     # drug_exposure.csv bytes per partition
+RANGE_BYTES = 64 << 20          # largest byte range read into memory at once
+RANGES_PER_WORKER = 4
+
+# Missing dates, and the arrays of a partition file
+_NAT = np.iinfo(np.int64).min
+_ARRAYS = ('person', 'ingredient', 'start', 'end')
+
+
+def exposure_intervals(df: pd.DataFrame, ingredient_sets: dict = None) -> tuple:
+    """
+    Drug exposures as (person_id, ingredient, start day, end day) arrays.
+
+    Days count from the epoch and end is exclusive. Rows without a
+    person, drug or start date are dropped.
+
+    Args:
+        df: drug_exposure rows (EXPOSURE_COLUMNS)
+        ingredient_sets: Optional {ingredient concept id: KeyIndex of its
+            drug concepts} (vocabulary.expand_concept_sets()); drugs in
+            several sets yield one interval per ingredient, drugs in
+            none keep their own concept id
+    """
+    person = df['person_id'].to_numpy(dtype=np.int64, na_value=-1)
+    drug = df['drug_concept_id'].to_numpy(dtype=np.int64, na_value=-1)
+    start = _days(df['drug_exposure_start_date'])
+    valid = (person >= 0) & (drug >= 0) & (start != _NAT)
+
+    end = _days(df['drug_exposure_end_date'])
+    verbatim = _days(df['verbatim_end_date'])
+    supply = df['days_supply'].to_numpy(dtype=np.float64, na_value=np.nan)
+    refills = df['refills'].to_numpy(dtype=np.float64, na_value=np.nan)
+    supplied = np.where(np.isnan(refills), supply, supply * (np.nan_to_num(refills) + 1))
+    end = np.where(end != _NAT, end, verbatim)
+    end = np.where(end != _NAT, end,
+                   start + np.nan_to_num(supplied, nan=0).astype(np.int64))
+    end = np.maximum(end, start + 1)
+
+    person, drug, start, end = person[valid], drug[valid], start[valid], end[valid]
+    if not ingredient_sets:
+        return person, drug, start, end
+
+    # Roll up each distinct drug once
+    codes, distinct = pd.factorize(drug)
+    member = np.zeros((len(ingredient_sets), len(distinct)), dtype=bool)
+    ingredients = np.fromiter(ingredient_sets, dtype=np.int64, count=len(ingredient_sets))
+    for k, concept_set in enumerate(ingredient_sets.values()):
+        member[k] = concept_set.contains(distinct)
+    unmapped = ~member.any(axis=0)
+    rows, ids = [], []
+    for k in range(len(ingredients)):
+        hit = np.flatnonzero(member[k][codes])
+        rows.append(hit)
+        ids.append(np.full(len(hit), ingredients[k]))
+    hit = np.flatnonzero(unmapped[codes])
+    rows.append(hit)
+    ids.append(drug[hit])
+    rows = np.concatenate(rows)
+    return person[rows], np.concatenate(ids), start[rows], end[rows]
+
+
+def _days(values: pd.Series) -> np.ndarray:
+    """Dates as int64 days since the epoch (NaT as _NAT)."""
+    dates = pd.to_datetime(values, errors='coerce').to_numpy(dtype='datetime64[ns]')
+    days = dates.astype('datetime64[D]').astype(np.int64)
+    days[np.isnat(dates)] = _NAT
+    return days
+
+
+def _sorted_groups(person, ingredient, start, end) -> tuple:
+    """Sort by (person, ingredient, start); returns the arrays and group starts."""
+    order = np.lexsort((start, ingredient, person))
+    person, ingredient, start, end = (a[order] for a in (person, ingredient, start, end))
+    new_group = np.ones(len(person), dtype=bool)
+    new_group[1:] = (person[1:] != person[:-1]) | (ingredient[1:] != ingredient[:-1])
+    return person, ingredient, start, end, new_group
+
+
+def _group_cummax(values: np.ndarray, new_group: np.ndarray) -> np.ndarray:
+    """Running maximum of values, restarting at each new_group row."""
+    if not len(values):
+        return values
+    group = np.cumsum(new_group) - 1
+    low = values.min()
+    span = values.max() - low + 1
+    # Offsetting each group above the previous one makes a single global
+    # running maximum restart per group
+    offset = group * span
+    return np.maximum.accumulate(values - low + offset) - offset + low
+
+
+def build_eras(person, ingredient, start, end, gap_days: int = GAP_DAYS) -> pd.DataFrame:
+    """
+    Merge exposure intervals into drug eras.
+
+    An exposure starting no more than ``gap_days`` after the running end
+    of the earlier exposures of the same person and ingredient joins
+    their era.
+
+    Returns:
+        DataFrame with ERA_COLUMNS except drug_era_id, sorted by person,
+        ingredient and start date
+    """
+    person, ingredient, start, end, new_group = _sorted_groups(person, ingredient, start, end)
+    running = _group_cummax(end, new_group)
+    before = np.empty_like(running)
+    before[1:] = running[:-1]
+    new_era = new_group.copy()
+    new_era[1:] |= start[1:] > before[1:] + gap_days
+
+    # Days each exposure adds to its era's coverage beyond those before it
+    before[new_era] = start[new_era]
+    covered = np.maximum(0, end - np.maximum(start, before))
+
+    starts = np.flatnonzero(new_era)
+    era_start = start[starts]
+    era_end = np.maximum.reduceat(end, starts) if len(starts) else end[:0]
+    covered = np.add.reduceat(covered, starts) if len(starts) else covered[:0]
+    return pd.DataFrame({
+        'person_id': person[starts],
+        'drug_concept_id': ingredient[starts],
+        'drug_era_start_date': era_start.astype('datetime64[D]'),
+        'drug_era_end_date': era_end.astype('datetime64[D]'),
+        'drug_exposure_count': np.diff(np.append(starts, len(person))),
+        'gap_days': era_end - era_start - covered,
+    })
+
+
+def proportion_of_days_covered(person, ingredient, start, end,
+                               period_start: date, period_end: date) -> pd.DataFrame:
+    """
+    PDC per person and ingredient over an inclusive measurement period.
+
+    Fills starting in the period count. Coverage runs from the first of
+    them to the period end; a fill starting while earlier supply lasts
+    is shifted to begin when it runs out.
+
+    Returns:
+        DataFrame with PDC_COLUMNS, sorted by person and ingredient
+    """
+    first_day = np.datetime64(period_start, 'D').astype(np.int64)
+    last_day = np.datetime64(period_end, 'D').astype(np.int64) + 1
+    keep = (start >= first_day) & (start < last_day)
+    person, ingredient, start, end, new_group = _sorted_groups(
+        person[keep], ingredient[keep], start[keep], end[keep])
+
+    # Shifted fills: E_i = max(start_i + d_i, E_{i-1} + d_i). With D_i the
+    # group's cumulative supply, E_i - D_i is the running maximum of
+    # start_i - D_{i-1}
+    supply = end - start
+    total = np.cumsum(supply)
+    starts = np.flatnonzero(new_group)
+    cumulative = total - np.repeat(total[starts] - supply[starts],
+                                   np.diff(np.append(starts, len(total))))
+    shifted_end = _group_cummax(start - (cumulative - supply), new_group) + cumulative
+    shifted_start = shifted_end - supply
+
+    index_day = np.repeat(start[starts], np.diff(np.append(starts, len(start))))
+    covered = np.maximum(0, np.minimum(shifted_end, last_day)
+                         - np.maximum(shifted_start, index_day))
+    covered = np.add.reduceat(covered, starts) if len(starts) else covered
+    days = last_day - start[starts]
+    pdc = covered / days if len(starts) else np.zeros(0)
+    return pd.DataFrame({
+        'person_id': person[starts],
+        'drug_concept_id': ingredient[starts],
+        'fills': np.diff(np.append(starts, len(start))),
+        'first_fill_date': start[starts].astype('datetime64[D]'),
+        'days_in_period': days,
+        'days_covered': covered,
+        'pdc': pdc,
+        'adherent': pdc >= ADHERENCE_THRESHOLD,
+    })
+
+
+def _write_partitions(intervals: tuple, partitions: int, directory: Path, tag: str):
+    """Append one chunk's intervals to the person-id partition files."""
+    part = intervals[0] % partitions
+    for p in np.unique(part):
+        rows = part == p
+        np.savez(directory / f'p{p:05d}-{tag}.npz',
+                 **{name: a[rows] for name, a in zip(_ARRAYS, intervals)})
+
+
+def _scan_range(path: Path, schema: dict, offset: int, end: int, index: int,
+                ingredient_sets: dict, partitions: int, directory: Path) -> int:
+    """Process-pool task: partition one byte range of drug_exposure.csv."""
+    exposures = 0
+    chunks = read_csv_typed(path, schema, usecols=EXPOSURE_COLUMNS,
+                            chunksize=READ_CHUNK_ROWS, offset=offset, end=end)
+    for c, chunk in enumerate(chunks):
+        intervals = exposure_intervals(chunk, ingredient_sets)
+        _write_partitions(intervals, partitions, directory, f'{index:05d}-{c:05d}')
+        exposures += len(intervals[0])
+    return exposures
+
+
+def _build_partition(directory: Path, p: int, gap_days: int, period: tuple) -> tuple:
+    """Process-pool task: eras and PDC of one partition; removes its files."""
+    files = sorted(directory.glob(f'p{p:05d}-*.npz'))
+    pieces = []
+    for file in files:
+        with np.load(file) as piece:
+            pieces.append(tuple(piece[name] for name in _ARRAYS))
+        file.unlink()
+    if pieces:
+        intervals = tuple(np.concatenate([piece[k] for piece in pieces]) for k in range(4))
+    else:
+        intervals = tuple(np.zeros(0, dtype=np.int64) for _ in range(4))
+    eras = build_eras(*intervals, gap_days=gap_days)
+    pdc = proportion_of_days_covered(*intervals, *period) if period else None
+    return eras, pdc
+
+
+def iter_drug_eras(data_dir: Path, gap_days: int = GAP_DAYS, period: tuple = None,
+                   workers: int = None, partitions: int = None, work_dir: Path = None,
+                   cache_dir: Path = None, ingredient_sets: dict = None):
+    """
+    Yield (eras, pdc) per person partition of drug_exposure.csv.
+
+    Args:
+        data_dir: Directory holding drug_exposure.csv
+        gap_days: Persistence window between exposures of one era
+        period: Optional (start, end) dates for PDC; pdc is None without it
+        workers: Worker processes (default: all CPUs; 1 runs in this process)
+        partitions: Person-id partitions (default: one per PARTITION_BYTES
+            of CSV, and at least one per worker)
+        work_dir: Directory for the partition files (default: system temp)
+        cache_dir: Optional columnar cache; the table is then read from
+            the cache in this process instead of scanned by range
+        ingredient_sets: Optional {ingredient: KeyIndex} drug roll-up
+
+    Yields:
+        (eras, pdc) DataFrames, eras without drug_era_id
+    """
+    path = Path(data_dir) / 'drug_exposure.csv'
+    schema = load_schema(Path(data_dir))
+    workers = workers or os.cpu_count() or 1
+    size = os.path.getsize(path)
+    partitions = partitions or max(workers, -(-size // PARTITION_BYTES))
+
+    directory = Path(tempfile.mkdtemp(prefix='drug_eras-', dir=work_dir))
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        if cache_dir is not None:
+            df = load_table(path, schema, cache_dir, usecols=EXPOSURE_COLUMNS)
+            _write_partitions(exposure_intervals(df, ingredient_sets), partitions,
+                              directory, 'cache')
+            del df
+        else:
+            ranges = csv_byte_ranges(path, max(workers * RANGES_PER_WORKER if pool else 1,
+                                               -(-size // RANGE_BYTES)))
+            tasks = [(path, schema, *r, i, ingredient_sets, partitions, directory)
+                     for i, r in enumerate(ranges)]
+            if pool:
+                list(pool.map(_scan_range, *zip(*tasks)))
+            else:
+                for task in tasks:
+                    _scan_range(*task)
+
+        tasks = [(directory, p, gap_days, period) for p in range(partitions)]
+        if pool:
+            yield from pool.map(_build_partition, *zip(*tasks))
+        else:
+            for task in tasks:
+                yield _build_partition(*task)
+    finally:
+        if pool:
+            pool.shutdown()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def build_drug_eras(data_dir: Path, gap_days: int = GAP_DAYS, period: tuple = None,
+                    **options) -> tuple:
+    """
+    drug_era rows (and PDC) for a whole extract; see iter_drug_eras().
+
+    Returns:
+        (eras, pdc): eras with ERA_COLUMNS sorted by person, ingredient
+        and start date, numbered from 1; pdc as from
+        proportion_of_days_covered(), or None without a period
+    """
+    parts = list(iter_drug_eras(data_dir, gap_days, period, **options))
+    eras = pd.concat([p[0] for p in parts], ignore_index=True)
+    eras = eras.sort_values(['person_id', 'drug_concept_id', 'drug_era_start_date'],
+                            ignore_index=True)
+    eras.insert(0, 'drug_era_id', np.arange(1, len(eras) + 1))
+    pdc = None
+    if period:
+        pdc = pd.concat([p[1] for p in parts], ignore_index=True).sort_values(
+            ['person_id', 'drug_concept_id'], ignore_index=True)
+    return eras, pdc
+
+
+def ingredient_concept_sets(ingredients, vocabulary: ConceptAncestorIndex) -> dict:
+    """{ingredient: KeyIndex of the ingredient and its descendant drugs}."""
+    return expand_concept_sets({int(i): (int(i),) for i in ingredients}, vocabulary)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Drug era builder")
+    parser.add_argument('--data-dir', type=Path,
+                        default=Path(__file__).resolve().parents[3] / 'data' / 'csv')
+    parser.add_argument('--output', type=Path, default=None,
+                        help="Write drug_era rows to this CSV")
+    parser.add_argument('--pdc-output', type=Path, default=None,
+                        help="Write proportion of days covered to this CSV")
+    parser.add_argument('--gap-days', type=int, default=GAP_DAYS)
+    parser.add_argument('--as-of', type=date.fromisoformat, default=None,
+                        help=f"End of the {PERIOD_DAYS}-day PDC period (default: today)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Worker processes (default: all CPUs)")
+    parser.add_argument('--partitions', type=int, default=None,
+                        help="Person-id partitions (default: by file size)")
+    parser.add_argument('--work-dir', type=Path, default=None,
+                        help="Directory for partition files")
+    parser.add_argument('--cache-dir', type=Path, default=None,
+                        help="Read drug_exposure through the columnar cache")
+    parser.add_argument('--concept-ancestor', type=Path, default=None,
+                        help="concept_ancestor extract for the ingredient roll-up")
+    parser.add_argument('--ingredients', type=int, nargs='+', default=None,
+                        help="Ingredient concept ids to roll drugs up to "
+                             "(with --concept-ancestor)")
+    args = parser.parse_args()
+
+    as_of = args.as_of or date.today()
+    period = (as_of - timedelta(days=PERIOD_DAYS - 1), as_of)
+    ingredient_sets = None
+    if args.concept_ancestor and args.ingredients:
+        vocabulary = load_concept_ancestor(args.concept_ancestor, args.cache_dir)
+        ingredient_sets = ingredient_concept_sets(args.ingredients, vocabulary)
+
+    # Partitions are written out as they complete, so memory stays at
+    # about one partition however large the extract
+    start = time.perf_counter()
+    era_count = exposures = pairs = adherent = 0
+    anticoagulants = {concept_id: [0, 0.0] for concept_id in ANTICOAGULANTS}
+    maria = []
+    for eras, pdc in iter_drug_eras(args.data_dir, args.gap_days, period,
+                                    workers=args.workers, partitions=args.partitions,
+                                    work_dir=args.work_dir, cache_dir=args.cache_dir,
+                                    ingredient_sets=ingredient_sets):
+        eras.insert(0, 'drug_era_id', np.arange(era_count + 1, era_count + len(eras) + 1))
+        if args.output:
+            eras.to_csv(args.output, index=False, mode='a' if era_count else 'w',
+                        header=not era_count)
+        if args.pdc_output:
+            pdc.to_csv(args.pdc_output, index=False, mode='a' if pairs else 'w',
+                       header=not pairs)
+        era_count += len(eras)
+        exposures += int(eras['drug_exposure_count'].sum())
+        pairs += len(pdc)
+        adherent += int(pdc['adherent'].sum())
+        for concept_id, totals in anticoagulants.items():
+            drug = pdc.loc[pdc['drug_concept_id'] == concept_id, 'pdc']
+            totals[0] += len(drug)
+            totals[1] += drug.sum()
+        maria.append(eras[eras['person_id'] == 12345])
+    seconds = time.perf_counter() - start
+
+    print("=" * 60)
+    print("Drug Era Builder")
+    print("=" * 60)
+    print(f"{era_count:,} drug eras from {exposures:,} exposures "
+          f"in {seconds:.3f}s (gap {args.gap_days} days)")
+    print(f"PDC period {period[0]} to {period[1]}: {pairs:,} person-drug pairs, "
+          f"{adherent / max(1, pairs):.1%} adherent (PDC >= {ADHERENCE_THRESHOLD:.0%})")
+    for concept_id, (patients, total) in anticoagulants.items():
+        if patients:
+            print(f"  {ANTICOAGULANTS[concept_id]:<12} {patients:>8,} patients, "
+                  f"mean PDC {total / patients:.2f}")
+
+    for row in pd.concat(maria).itertuples(index=False):
+        print(f"Person 12345 drug {row.drug_concept_id}: {row.drug_era_start_date:%Y-%m-%d}"
+              f" to {row.drug_era_end_date:%Y-%m-%d}, {row.drug_exposure_count} exposures,"
+              f" {row.gap_days} gap days")
+
+    if args.output:
+        print(f"Drug eras written to {args.output}")
+    if args.pdc_output:
+        print(f"PDC written to {args.pdc_output}")
+    print("=" * 60)
@@ -0,0 +1,531 @@
+#!/usr/bin/env python3
+# ============================================================================
+# Script: quality_measures.py
+# Chapter: 7 - Quality Measurement & Population Health
+# Textbook Section: 7.2 HEDIS Quality Measure Implementation
+#
+# Description:
+#   Declarative HEDIS-style care-gap engine. 01_hedis_quality_gaps.sql
+#   implements one measure (diabetes eye exam) as its own CTE pipeline;
+#   here a measure is data - a denominator, a numerator and exclusions,
+#   each a list of Criterion objects (concept set or source codes, event
+#   table, lookback window, optional result-value range) - and any
+#   number of measures are compiled into one shared pass over the event
+#   tables.
+#
+#   Compilation gives every distinct criterion a bit. Scanning a table,
+#   each distinct concept id and source code is classified once into a
+#   bit mask, each row's mask is narrowed by its lookback windows and
+#   values, and the masks are OR'ed into one bitset per person. Every
+#   measure is then a few bit tests per person. Each referenced table is
+#   read once however many measures use it, and tables are scanned in
+#   parallel byte ranges.
+#
+#   Criteria with latest=True test the most recent event in the window
+#   (e.g. the last HbA1c below 8%) rather than any event; of several
+#   events on that day the lowest value counts.
+#
+# Prerequisites:
+#   - Python 3.8+
+#   - numpy, pandas (pip install -r requirements.txt)
+#
+# Usage:
+#   python quality_measures.py [--data-dir DIR] [--as-of 2026-01-13]
+#                              [--measures CDC-EYE CBP ...] [--output gaps.csv]
+#                              [--workers N] [--cache-dir DIR]
+#                              [--concept-ancestor CONCEPT_ANCESTOR.csv]
+#
+# Expected Results:
+#   For Maria Rodriguez (teaching dataset, --as-of 2026-01-13): GAP for
+#   the diabetes eye exam (no eye exam on record), as in the SQL, and
+#   GAP for blood pressure control (148/92 at her last visit).
+# ============================================================================
+
+"""
+HEDIS Quality Measure Engine
+Declarative care-gap measures evaluated in one scan of the event tables
+"""
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'utilities'))
+
+from omop_loader import csv_byte_ranges, load_schema, load_table, read_csv_typed  # noqa: E402
+from vocabulary import (  # noqa: E402
+    ConceptAncestorIndex, expand_concept_sets, load_concept_ancestor,
+)
+
+
+class EventTable(NamedTuple):
+    """Columns of an OMOP event table that criteria are evaluated on."""
+    table: str
+    concept: str
+    source: str
+    date: str
+    value: Optional[str] = None
+
+
+EVENT_TABLES = {
+    'condition': EventTable('condition_occurrence', 'condition_concept_id',
+                            'condition_source_value', 'condition_start_date'),
+    'procedure': EventTable('procedure_occurrence', 'procedure_concept_id',
+                            'procedure_source_value', 'procedure_date'),
+    'measurement': EventTable('measurement', 'measurement_concept_id',
+                              'measurement_source_value', 'measurement_date',
+                              'value_as_number'),
+    'drug': EventTable('drug_exposure', 'drug_concept_id', 'drug_source_value',
+                       'drug_exposure_start_date'),
+}
+
+
+@dataclass(frozen=True)
+class Criterion:
+    """
+    Events of one concept set in one table, within a lookback window.
+
+    An event matches when its standard concept is in ``concepts`` (with
+    descendants, given a vocabulary) or its source value is in
+    ``codes``, it falls within ``lookback_days`` before the as-of date
+    (None: any time up to it) and, if a range is set, its value is in
+    [min_value, max_value). With ``latest`` only the person's most
+    recent matching event in the window is tested against the range.
+    """
+    table: str
+    concepts: Tuple[int, ...] = ()
+    codes: Tuple[str, ...] = ()
+    lookback_days: Optional[int] = None
+    min_value: Optional[float] = None
+    max_value: Optional[float] = None
+    latest: bool = False
+
+    @property
+    def has_range(self) -> bool:
+        return self.min_value is not None or self.max_value is not None
+
+
+@dataclass(frozen=True)
+class Measure:
+    """
+    A care-gap measure.
+
+    Persons meeting every denominator criterion and the age range are
+    eligible; eligible persons meeting any exclusion are EXCLUDED, the
+    rest are MET if they meet every numerator criterion and GAP if not.
+    """
+    measure_id: str
+    name: str
+    denominator: Tuple[Criterion, ...]
+    numerator: Tuple[Criterion, ...]
+    exclusions: Tuple[Criterion, ...] = ()
+    min_age: int = 18
+    max_age: int = 75
+    outreach: str = ''
+
+
+# Shared criteria
+DIABETES = Criterion('condition', concepts=(201826, 201254))    # T2DM, T1DM
+HYPERTENSION = Criterion('condition', concepts=(320128, 316866))
+AFIB = Criterion('condition', concepts=(313217,))
+ASCVD = Criterion('condition', concepts=(317576, 321052, 443454))  # CAD, PVD, stroke
+ESRD = Criterion('condition', concepts=(193782,), codes=('N18.6',))
+
+EYE_EXAM_CODES = ('92002', '92004', '92012', '92014', '92250', '2022F', '2024F',
+                  '2026F', '67028', '67030', '67031')
+HBA1C = dict(concepts=(3004410,), codes=('4548-4',))
+SYSTOLIC = dict(concepts=(3004249,), codes=('8480-6',))
+DIASTOLIC = dict(concepts=(3012888,), codes=('8462-4',))
+EGFR = dict(concepts=(3049187,), codes=('33914-3', '62238-1', '98979-8'))
+
+MEASURES = (
+    Measure('CDC-EYE', 'Diabetes care: eye exam',
+            denominator=(DIABETES,),
+            numerator=(Criterion('procedure', codes=EYE_EXAM_CODES, lookback_days=365),),
+            outreach='Diabetic eye exam needed'),
+    Measure('CDC-A1C-TEST', 'Diabetes care: HbA1c testing',
+            denominator=(DIABETES,),
+            numerator=(Criterion('measurement', lookback_days=365, **HBA1C),),
+            outreach='HbA1c test needed'),
+    Measure('CDC-A1C-CONTROL', 'Diabetes care: HbA1c control (<8.0%)',
+            denominator=(DIABETES,),
+            numerator=(Criterion('measurement', lookback_days=365, max_value=8.0,
+                                 latest=True, **HBA1C),),
+            outreach='HbA1c above 8% or not tested'),
+    Measure('KED', 'Kidney health evaluation for diabetes (eGFR)',
+            denominator=(DIABETES,),
+            numerator=(Criterion('measurement', lookback_days=365, **EGFR),),
+            exclusions=(ESRD,), max_age=85,
+            outreach='eGFR needed'),
+    Measure('CBP', 'Controlling high blood pressure (<140/90)',
+            denominator=(HYPERTENSION,),
+            numerator=(Criterion('measurement', lookback_days=365, max_value=140,
+                                 latest=True, **SYSTOLIC),
+                       Criterion('measurement', lookback_days=365, max_value=90,
+                                 latest=True, **DIASTOLIC)),
+            exclusions=(ESRD,), max_age=85,
+            outreach='Blood pressure not controlled'),
+    Measure('SPC', 'Statin therapy for cardiovascular disease',
+            denominator=(ASCVD,),
+            numerator=(Criterion('drug', concepts=(1545958,), lookback_days=365),),
+            min_age=21,
+            outreach='Statin therapy not dispensed'),
+    Measure('AF-OAC', 'Anticoagulation for atrial fibrillation',
+            denominator=(AFIB,),
+            numerator=(Criterion('drug', concepts=(40228152, 1310149), lookback_days=365),),
+            max_age=120,
+            outreach='Anticoagulant not dispensed'),
+)
+
+MET, GAP, EXCLUDED = 'MET', 'GAP', 'EXCLUDED'
+STATUSES = (MET, GAP, EXCLUDED)
+PERSON_COLUMNS = ['person_id', 'year_of_birth', 'person_source_value']
+
+# Byte ranges per worker: more, smaller ranges even out the load
+RANGES_PER_WORKER = 4
+
+_ALL_BITS = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+@dataclass
+class MeasurePlan:
+    """Measures compiled to criterion bits, ready for scanning."""
+    measures: tuple
+    criteria: tuple                 # bit i <-> criteria[i]
+    words: int                      # uint64 words per person bitset
+    concept_sets: dict              # criterion index -> KeyIndex
+    as_of_day: int                  # as-of date, days since the epoch
+
+    def table_criteria(self, table: str) -> list:
+        return [i for i, c in enumerate(self.criteria) if c.table == table]
+
+    def tables(self) -> list:
+        return [t for t in EVENT_TABLES if self.table_criteria(t)]
+
+    def columns(self, table: str) -> list:
+        spec = EVENT_TABLES[table]
+        columns = ['person_id', spec.concept, spec.source, spec.date]
+        if any(self.criteria[i].has_range for i in self.table_criteria(table)):
+            columns.append(spec.value)
+        return columns
+
+
+def compile_measures(measures, as_of: date, vocabulary: ConceptAncestorIndex = None
+                     ) -> MeasurePlan:
+    """Assign a bit to each distinct criterion and expand its concept set."""
+    criteria = []
+    for measure in measures:
+        for criterion in measure.denominator + measure.numerator + measure.exclusions:
+            if criterion.table not in EVENT_TABLES:
+                raise ValueError(f"{measure.measure_id}: unknown table {criterion.table!r}")
+            if criterion not in criteria:
+                criteria.append(criterion)
+    concept_sets = expand_concept_sets(
+        {i: c.concepts for i, c in enumerate(criteria)}, vocabulary)
+    return MeasurePlan(
+        measures=tuple(measures),
+        criteria=tuple(criteria),
+        words=max(1, -(-len(criteria) // 64)),
+        concept_sets=concept_sets,
+        as_of_day=int(np.datetime64(as_of, 'D').astype(np.int64)),
+    )
+
+
+def _bit(i: int) -> tuple:
+    return i // 64, np.uint64(1) << np.uint64(i % 64)
+
+
+def _or_by_person(person: np.ndarray, bits: np.ndarray) -> tuple:
+    """OR row bitsets (rows x words) per person; returns (ids, bitsets)."""
+    owner, ids = pd.factorize(person)
+    merged = np.zeros((len(ids), bits.shape[1]), dtype=np.uint64)
+    for w in range(bits.shape[1]):
+        np.bitwise_or.at(merged[:, w], owner, bits[:, w])
+    return ids, merged
+
+
+def _latest(person: np.ndarray, day: np.ndarray, value: np.ndarray) -> tuple:
+    """
+    Most recent (person, day, value) per person.
+
+    Several events on the latest day keep the lowest value, as HEDIS
+    does for same-day blood pressure readings; missing values lose.
+    """
+    order = np.lexsort((np.where(np.isnan(value), -np.inf, -value), day, person))
+    person, day, value = person[order], day[order], value[order]
+    last = np.ones(len(person), dtype=bool)
+    last[:-1] = person[1:] != person[:-1]
+    return person[last], day[last], value[last]
+
+
+def table_bitsets(df: pd.DataFrame, table: str, plan: MeasurePlan) -> tuple:
+    """
+    Criterion bitsets per person for one chunk of an event table.
+
+    Returns:
+        (person_ids, uint64 bitsets of shape (persons, plan.words),
+        {criterion index: latest (person, day, value)} for latest criteria)
+    """
+    spec = EVENT_TABLES[table]
+    indexes = plan.table_criteria(table)
+    person = df['person_id'].to_numpy(dtype=np.int64, na_value=-1)
+    dates = df[spec.date].to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+    valid = (person >= 0) & ~np.isnat(dates)
+    before = plan.as_of_day - dates.astype(np.int64)
+    valid &= before >= 0
+    df, person, before = df[valid], person[valid], before[valid]
+    rows = len(person)
+
+    # Concept and source-code bits, classified once per distinct value
+    concept_codes, concepts = pd.factorize(df[spec.concept])
+    concepts = np.asarray(concepts, dtype=np.int64)
+    source_codes, sources = pd.factorize(df[spec.source].astype(object))
+    sources = np.asarray(sources, dtype=object)
+    concept_bits = np.zeros((len(concepts) + 1, plan.words), dtype=np.uint64)
+    source_bits = np.zeros((len(sources) + 1, plan.words), dtype=np.uint64)
+    for i in indexes:
+        word, bit = _bit(i)
+        concept_bits[:-1, word][plan.concept_sets[i].contains(concepts)] |= bit
+        if plan.criteria[i].codes:
+            source_bits[:-1, word][np.isin(sources, plan.criteria[i].codes)] |= bit
+    bits = concept_bits[concept_codes] | source_bits[source_codes]
+
+    # Lookback windows: a row satisfies every criterion whose window is at
+    # least its age, i.e. a suffix of the criteria sorted by window
+    windows = sorted({plan.criteria[i].lookback_days for i in indexes},
+                     key=lambda days: np.inf if days is None else days)
+    window_bits = np.zeros((len(windows) + 1, plan.words), dtype=np.uint64)
+    for k, days in enumerate(windows):
+        for i in indexes:
+            if plan.criteria[i].lookback_days == days:
+                word, bit = _bit(i)
+                window_bits[:k + 1, word] |= bit
+    limits = np.array([np.inf if days is None else days for days in windows])
+    bits &= window_bits[np.searchsorted(limits, before, side='left')]
+
+    latest = {}
+    value = df[spec.value].to_numpy(dtype=np.float64, na_value=np.nan) \
+        if spec.value in df else np.full(rows, np.nan)
+    for i in indexes:
+        criterion = plan.criteria[i]
+        if not criterion.has_range:
+            continue
+        word, bit = _bit(i)
+        matched = (bits[:, word] & bit) != 0
+        if criterion.latest:
+            # Decided after the scan, from the latest event in the window
+            latest[i] = _latest(person[matched], before[matched] * -1, value[matched])
+            bits[:, word] &= ~bit
+        else:
+            bits[matched & ~_in_range(value, criterion), word] &= ~bit
+
+    hit = bits.any(axis=1)
+    ids, bitsets = _or_by_person(person[hit], bits[hit])
+    return ids, bitsets, latest
+
+
+def _in_range(value: np.ndarray, criterion: Criterion) -> np.ndarray:
+    ok = ~np.isnan(value)
+    if criterion.min_value is not None:
+        ok &= value >= criterion.min_value
+    if criterion.max_value is not None:
+        ok &= value < criterion.max_value
+    return ok
+
+
+def _scan_range(path: Path, schema: dict, offset: int, end: int, table: str,
+                plan: MeasurePlan) -> tuple:
+    """Process-pool task: table_bitsets() of one byte range."""
+    df = read_csv_typed(path, schema, usecols=plan.columns(table), offset=offset, end=end)
+    return table_bitsets(df, table, plan)
+
+
+def scan_bitsets(data_dir: Path, plan: MeasurePlan, workers: int = None,
+                 cache_dir: Path = None) -> tuple:
+    """
+    Scan every table the plan references once; criterion bitsets per person.
+
+    Returns:
+        (person_ids, uint64 bitsets of shape (persons, plan.words))
+    """
+    data_dir = Path(data_dir)
+    schema = load_schema(data_dir)
+    workers = workers or os.cpu_count() or 1
+    paths = {t: data_dir / f'{EVENT_TABLES[t].table}.csv' for t in plan.tables()}
+    paths = {t: p for t, p in paths.items() if p.exists()}
+
+    if cache_dir is not None:
+        parts = [table_bitsets(load_table(path, schema, cache_dir, usecols=plan.columns(t)),
+                               t, plan) for t, path in paths.items()]
+    else:
+        tasks = [(path, schema, *r, t, plan) for t, path in paths.items()
+                 for r in csv_byte_ranges(path, workers * RANGES_PER_WORKER
+                                          if workers > 1 else 1)]
+        if workers == 1:
+            parts = [_scan_range(*task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                parts = list(pool.map(_scan_range, *zip(*tasks)))
+
+    if not parts:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, plan.words), dtype=np.uint64)
+    ids, bitsets = _or_by_person(np.concatenate([p[0] for p in parts]),
+                                 np.concatenate([p[1] for p in parts]))
+
+    # Latest-event criteria: keep each person's most recent event across
+    # ranges and set the bit if its value is in range
+    extra_ids, extra_bits = [], []
+    for i, criterion in enumerate(plan.criteria):
+        pieces = [p[2][i] for p in parts if i in p[2]]
+        if not pieces:
+            continue
+        person, _, value = _latest(*(np.concatenate([piece[k] for piece in pieces])
+                                     for k in range(3)))
+        person = person[_in_range(value, criterion)]
+        word, bit = _bit(i)
+        rows = np.zeros((len(person), plan.words), dtype=np.uint64)
+        rows[:, word] = bit
+        extra_ids.append(person)
+        extra_bits.append(rows)
+    if extra_ids:
+        ids, bitsets = _or_by_person(np.concatenate([ids] + extra_ids),
+                                     np.concatenate([bitsets] + extra_bits))
+    return ids, bitsets
+
+
+def evaluate_measures(data_dir: Path, measures=MEASURES, as_of: date = None,
+                      workers: int = None, cache_dir: Path = None,
+                      vocabulary: ConceptAncestorIndex = None) -> tuple:
+    """
+    Evaluate measures for every person in an OMOP extract.
+
+    Args:
+        data_dir: Directory holding person.csv and the event tables
+        measures: Measure definitions (default: MEASURES)
+        as_of: End of the measurement period (default: today); age is
+            as_of.year - year_of_birth
+        workers: Worker processes for the scan (default: all CPUs)
+        cache_dir: Optional columnar cache directory
+        vocabulary: Optional concept_ancestor index for the concept sets
+
+    Returns:
+        (status, summary): status has one row per eligible person and
+        measure (person_id, mrn, measure_id, status, outreach); summary
+        one row per measure with denominator, exclusions, numerator,
+        gaps and rate
+    """
+    as_of = as_of or date.today()
+    plan = compile_measures(measures, as_of, vocabulary)
+    ids, bitsets = scan_bitsets(data_dir, plan, workers, cache_dir)
+
+    schema = load_schema(Path(data_dir))
+    person = load_table(Path(data_dir) / 'person.csv', schema, cache_dir,
+                        usecols=PERSON_COLUMNS)
+    person = person[person['person_id'].notna()].drop_duplicates('person_id')
+    person_ids = person['person_id'].to_numpy(dtype=np.int64)
+    position = pd.Index(ids).get_indexer(person_ids)
+    person_bits = np.zeros((len(person), plan.words), dtype=np.uint64)
+    person_bits[position >= 0] = bitsets[position[position >= 0]]
+    age = as_of.year - person['year_of_birth'].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    def met(criterion: Criterion) -> np.ndarray:
+        word, bit = _bit(plan.criteria.index(criterion))
+        return (person_bits[:, word] & bit) != 0
+
+    statuses, summary = [], []
+    for measure in plan.measures:
+        eligible = (age >= measure.min_age) & (age <= measure.max_age)
+        for criterion in measure.denominator:
+            eligible &= met(criterion)
+        excluded = np.zeros(len(person), dtype=bool)
+        for criterion in measure.exclusions:
+            excluded |= met(criterion)
+        numerator = np.ones(len(person), dtype=bool)
+        for criterion in measure.numerator:
+            numerator &= met(criterion)
+
+        rows = np.flatnonzero(eligible)
+        codes = np.where(excluded[rows], 2, np.where(numerator[rows], 0, 1)).astype(np.int8)
+        statuses.append(pd.DataFrame({
+            'person_id': person_ids[rows],
+            'mrn': person['person_source_value'].to_numpy()[rows],
+            'measure_id': measure.measure_id,
+            'status': pd.Categorical.from_codes(codes, categories=STATUSES),
+        }))
+        counts = np.bincount(codes, minlength=3)
+        denominator = int(counts[0] + counts[1])
+        summary.append({
+            'measure_id': measure.measure_id,
+            'name': measure.name,
+            'denominator': denominator,
+            'exclusions': int(counts[2]),
+            'numerator': int(counts[0]),
+            'gaps': int(counts[1]),
+            'rate': counts[0] / denominator if denominator else np.nan,
+        })
+
+    status = pd.concat(statuses, ignore_index=True)
+    outreach = {m.measure_id: m.outreach for m in plan.measures}
+    status['outreach'] = status['measure_id'].map(outreach).where(status['status'] == GAP)
+    status['measure_id'] = pd.Categorical(status['measure_id'],
+                                          categories=[m.measure_id for m in plan.measures])
+    return status, pd.DataFrame(summary)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="HEDIS quality measure engine")
+    parser.add_argument('--data-dir', type=Path,
+                        default=Path(__file__).resolve().parents[3] / 'data' / 'csv')
+    parser.add_argument('--as-of', type=date.fromisoformat, default=None,
+                        help="End of the measurement period (default: today)")
+    parser.add_argument('--measures', nargs='+', default=None,
+                        choices=[m.measure_id for m in MEASURES])
+    parser.add_argument('--output', type=Path, default=None,
+                        help="Write the care-gap list (GAP rows) to this CSV")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Worker processes (default: all CPUs)")
+    parser.add_argument('--cache-dir', type=Path, default=None,
+                        help="Read tables through the columnar cache")
+    parser.add_argument('--concept-ancestor', type=Path, default=None,
+                        help="concept_ancestor extract for concept-set expansion")
+    args = parser.parse_args()
+
+    measures = [m for m in MEASURES if args.measures is None or m.measure_id in args.measures]
+    as_of = args.as_of or date.today()
+    vocabulary = None
+    if args.concept_ancestor:
+        vocabulary = load_concept_ancestor(args.concept_ancestor, args.cache_dir)
+
+    start = time.perf_counter()
+    status, summary = evaluate_measures(args.data_dir, measures, as_of, args.workers,
+                                        args.cache_dir, vocabulary)
+    seconds = time.perf_counter() - start
+    if args.output:
+        gaps = status[status['status'] == GAP].sort_values(['measure_id', 'mrn'])
+        gaps.to_csv(args.output, index=False)
+
+    print("=" * 60)
+    print(f"HEDIS Quality Measures as of {as_of} - {len(measures)} measures, "
+          f"one scan")
+    print("=" * 60)
+    with pd.option_context('display.width', 120, 'display.max_columns', None):
+        print(summary.to_string(index=False, formatters={'rate': '{:.1%}'.format}))
+    print(f"Evaluated in {seconds:.3f}s")
+    maria = status[status['person_id'] == 12345]
+    for row in maria.itertuples(index=False):
+        print(f"Person 12345 {row.measure_id}: {row.status}"
+              + (f" - {row.outreach}" if pd.notna(row.outreach) else ""))
+
+    if args.output:
+        print(f"Care gaps written to {args.output}")
+    print("=" * 60)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# ============================================================================
+# Script: readmission_batch.py
+# Chapter: 10 - Outcomes, Research & Continuous Improvement
+# Textbook Section: 10.2 Patient-Level Prediction
+#
+# Description:
+#   Columnar (vectorized) 30-day readmission scoring for every discharge
+#   in a network. Produces the same risk score, risk category and
+#   contributing factors as predict_30day_readmission(), but computes
+#   log-odds, sigmoid and categories over whole arrays (one design-matrix
+#   product, see readmission_model.py) so the morning care-management
+#   run scores millions of discharges in one call.
+#
+# Prerequisites:
+#   - Python 3.8+
+#   - numpy, pandas (pip install -r requirements.txt)
+#
+# Usage:
+#   python readmission_batch.py [num_discharges]
+#
+# Expected Results:
+#   Batch results identical to the per-patient model for every
+#   discharge; one million discharges scored in well under a second.
+# ============================================================================
+
+"""
+Vectorized 30-Day Readmission Risk Prediction
+Population-scale scoring for care management
+"""
+
+from dataclasses import dataclass
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from readmission_model import ReadmissionModel, load_model
+from readmission_prediction import ReadmissionPrediction
+
+# Model inputs, in predict_30day_readmission() argument order
+FEATURES = (
+    'age', 'gender', 'num_diagnoses', 'num_medications', 'length_of_stay',
+    'prior_admissions_6mo', 'has_chf', 'has_diabetes', 'has_afib', 'eGFR',
+    'discharge_disposition',
+)
+
+
+@dataclass
+class BatchReadmissionPredictions:
+    """Columnar prediction result (one element per discharge)."""
+    log_odds: np.ndarray
+    risk_score: np.ndarray
+    risk_category: pd.Categorical
+    contributing_factors: Dict[str, np.ndarray]
+
+    def __len__(self) -> int:
+        return len(self.risk_score)
+
+    def __getitem__(self, i: int) -> ReadmissionPrediction:
+        """Materialize a single discharge's result as a ReadmissionPrediction."""
+        return ReadmissionPrediction(
+            risk_score=self.risk_score[i],
+            risk_category=self.risk_category[i],
+            contributing_factors={
+                name: float(weights[i])
+                for name, weights in self.contributing_factors.items()
+                if weights[i]
+            }
+        )
+
+    def to_frame(self, index=None) -> pd.DataFrame:
+        """Return the results as a DataFrame with one column per factor."""
+        columns = {
+            'log_odds': self.log_odds,
+            'risk_score': self.risk_score,
+            'risk_category': self.risk_category,
+        }
+        columns.update(self.contributing_factors)
+        return pd.DataFrame(columns, index=index)
+
+
+def predict_30day_readmission_batch(
+    age,
+    gender,
+    num_diagnoses,
+    num_medications,
+    length_of_stay,
+    prior_admissions_6mo,
+    has_chf,
+    has_diabetes,
+    has_afib,
+    eGFR,
+    discharge_disposition,
+    model: ReadmissionModel = None
+) -> BatchReadmissionPredictions:
+    """
+    Score many discharges at once.
+
+    Takes the same arguments as predict_30day_readmission(), each as an
+    array (or Series/Categorical) with one element per discharge, and
+    scores them through the same compiled coefficient specification, so
+    results match it exactly.
+
+    Returns:
+        BatchReadmissionPredictions with one element per discharge
+    """
+    model = model or load_model()
+    X, log_odds, risk, category = model.score({
+        'age': age,
+        'gender': gender,
+        'num_diagnoses': num_diagnoses,
+        'num_medications': num_medications,
+        'length_of_stay': length_of_stay,
+        'prior_admissions_6mo': prior_admissions_6mo,
+        'has_chf': has_chf,
+        'has_diabetes': has_diabetes,
+        'has_afib': has_afib,
+        'eGFR': eGFR,
+        'discharge_disposition': discharge_disposition,
+    })
+
+    return BatchReadmissionPredictions(
+        log_odds=log_odds,
+        risk_score=np.round(risk * 100, 1),
+        risk_category=pd.Categorical.from_codes(category, categories=model.categories),
+        contributing_factors={
+            name: X[:, j] * weight
+            for j, (name, weight) in enumerate(zip(model.names, model.weights))
+        }
+    )
+
+
+def predict_30day_readmission_frame(df: pd.DataFrame,
+                                    model: ReadmissionModel = None) -> pd.DataFrame:
+    """
+    Score a DataFrame with one column per model input (see FEATURES).
+    """
+    result = predict_30day_readmission_batch(*(df[name] for name in FEATURES),
+                                             model=model)
+    return result.to_frame(index=df.index)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    from readmission_prediction import predict_30day_readmission
+
+    num_discharges = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = np.random.default_rng(12345)
+
+    # Synthetic discharge cohort
+    discharges = pd.DataFrame({
+        'age': rng.integers(18, 100, num_discharges),
+        'gender': pd.Categorical.from_codes(
+            rng.integers(0, 2, num_discharges), categories=['male', 'female']),
+        'num_diagnoses': rng.integers(0, 15, num_discharges),
+        'num_medications': rng.integers(0, 20, num_discharges),
+        'length_of_stay': rng.integers(0, 15, num_discharges),
+        'prior_admissions_6mo': rng.poisson(0.4, num_discharges),
+        'has_chf': rng.random(num_discharges) < 0.15,
+        'has_diabetes': rng.random(num_discharges) < 0.25,
+        'has_afib': rng.random(num_discharges) < 0.10,
+        'eGFR': np.round(rng.uniform(5, 120, num_discharges), 1),
+        'discharge_disposition': pd.Categorical.from_codes(
+            rng.integers(0, 4, num_discharges),
+            categories=['home', 'snf', 'rehab', 'hospice']),
+    })
+
+    start = time.perf_counter()
+    batch = predict_30day_readmission_batch(*(discharges[name] for name in FEATURES))
+    batch_seconds = time.perf_counter() - start
+
+    # Compare against the per-patient model on a sample
+    sample = rng.choice(num_discharges, min(num_discharges, 20_000), replace=False)
+    rows = discharges.iloc[sample].to_dict('records')
+    start = time.perf_counter()
+    expected = [predict_30day_readmission(**row) for row in rows]
+    scalar_seconds = time.perf_counter() - start
+
+    mismatches = sum(batch[i] != result for i, result in zip(sample, expected))
+    batch_per_discharge = batch_seconds / num_discharges
+    scalar_per_discharge = scalar_seconds / len(sample)
+
+    print("=" * 60)
+    print("30-Day Readmission Batch Scoring - Synthetic Discharges")
+    print("=" * 60)
+    print(f"Discharges scored: {num_discharges:,}")
+    print(f"Batch time: {batch_seconds:.3f}s "
+          f"({batch_per_discharge * 1e9:.0f} ns/discharge)")
+    print(f"Scalar time: {scalar_per_discharge * 1e9:.0f} ns/discharge")
+    print(f"Speedup: {scalar_per_discharge / batch_per_discharge:.0f}x")
+    print(f"Mismatches vs predict_30day_readmission: {mismatches} / {len(sample):,}")
+    counts = batch.risk_category.value_counts()
+    print("Risk categories: " + ", ".join(f"{c} {n:,}" for c, n in counts.items()))
+    print("=" * 60)
@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+# ============================================================================
+# Script: readmission_features.py
+# Chapter: 10 - Outcomes, Research & Continuous Improvement
+# Textbook Section: 10.2 Patient-Level Prediction
+#
+# Description:
+#   Feature extraction from OMOP CDM tables to the inputs of the 30-day
+#   readmission model. Every discharge is featurized in one pass over
+#   visit_occurrence, condition_occurrence, drug_exposure and measurement
+#   using grouped/windowed operations (merges, as-of joins and sorted
+#   window counts) rather than filtering the tables patient by patient.
+#   An optional cache keeps each person's features plus a hash of their
+#   events per table, so the daily run only rereads source files whose
+#   size or mtime changed and only recomputes persons whose events did.
+#
+# Prerequisites:
+#   - Python 3.8+
+#   - numpy, pandas (pip install -r requirements.txt)
+#
+# Usage:
+#   python readmission_features.py [--data-dir DIR] [--cache-dir DIR]
+#                                  [--all-visits]
+#
+# Expected Results:
+#   For Maria Rodriguez (teaching dataset, --all-visits): age 46,
+#   4 active diagnoses, 3-4 active medications and eGFR 65 at each of
+#   her 4 visits.
+# ============================================================================
+
+"""
+Readmission Feature Extraction
+OMOP CDM tables to readmission model inputs
+"""
+
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Iterable, Tuple
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'utilities'))
+
+from omop_loader import CACHE_FORMAT, load_schema, read_csv_typed  # noqa: E402
+from readmission_batch import FEATURES  # noqa: E402
+
+# Visits that count as admissions (Inpatient Visit, ER and Inpatient Visit)
+INPATIENT_VISIT_CONCEPTS = (9201, 262)
+
+# Standard concepts for the comorbidity flags
+CHF_CONCEPTS = (316139,)        # Heart failure
+DIABETES_CONCEPTS = (201826,)   # Type 2 diabetes mellitus
+AFIB_CONCEPTS = (313217,)       # Atrial fibrillation
+
+# eGFR results, by measurement concept or by LOINC source code
+EGFR_CONCEPTS = (3049187,)
+EGFR_LOINC = ('33914-3', '62238-1', '98979-8')
+
+GENDERS = {8507: 'male', 8532: 'female'}
+DISPOSITIONS = {8536: 'home', 8863: 'snf', 8920: 'rehab', 8546: 'hospice'}
+
+PRIOR_ADMISSION_DAYS = 182
+
+# Bump when feature definitions change, to invalidate caches
+FEATURE_VERSION = 3
+
+# Columns each table contributes to the features (and to the per-person
+# change signature used by the cache)
+SOURCE_COLUMNS = {
+    'person': ['person_id', 'gender_concept_id', 'year_of_birth',
+               'month_of_birth', 'day_of_birth', 'birth_datetime'],
+    'visit_occurrence': ['visit_occurrence_id', 'person_id', 'visit_concept_id',
+                         'visit_start_date', 'visit_end_date',
+                         'discharged_to_concept_id'],
+    'condition_occurrence': ['person_id', 'condition_concept_id',
+                             'condition_start_date', 'condition_end_date'],
+    'drug_exposure': ['person_id', 'drug_concept_id', 'drug_exposure_start_date',
+                      'drug_exposure_end_date', 'verbatim_end_date', 'days_supply'],
+    'measurement': ['person_id', 'measurement_concept_id', 'measurement_date',
+                    'value_as_number', 'measurement_source_value'],
+}
+
+
+def _table(data: dict, table: str, persons=None) -> pd.DataFrame:
+    """The columns of a table used for features (missing ones as nulls)."""
+    columns = SOURCE_COLUMNS[table]
+    df = data.get(table)
+    if df is None:
+        df = pd.DataFrame(columns=columns)
+    df = df.reindex(columns=columns)
+    if persons is not None:
+        df = df[df['person_id'].isin(persons)]
+    return df
+
+
+def _day(values: pd.Series) -> pd.Series:
+    """Dates/datetimes (typed or text) truncated to the day."""
+    if not pd.api.types.is_datetime64_any_dtype(values):
+        if values.isna().all():
+            return pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+        values = pd.to_datetime(values, format='ISO8601', errors='coerce')
+    return values.dt.normalize()
+
+
+def _count_in_window(group: np.ndarray, day: np.ndarray, events_group: np.ndarray,
+                     events_day: np.ndarray, days: int) -> np.ndarray:
+    """
+    Count events of the same group in [day - days, day) for each query.
+
+    Group codes and days are packed into one sortable int64 key, so all
+    windows are answered with two binary searches over the sorted events.
+    Days must all be known (no NaT), or the keys overflow.
+    """
+    if not len(day):
+        return np.zeros(0, dtype=np.int64)
+    first = min(day.min(), events_day.min()) if len(events_day) else day.min()
+    last = max(day.max(), events_day.max()) if len(events_day) else day.max()
+    span = int(last - first) + 1
+    keys = np.sort(events_group * span + (events_day - first))
+    upper = group * span + (day - first)
+    lower = group * span + np.maximum(day - first - days, 0)
+    return np.searchsorted(keys, upper) - np.searchsorted(keys, lower)
+
+
+def discharges(data: dict, visit_concepts: Iterable[int] = INPATIENT_VISIT_CONCEPTS,
+               persons=None) -> pd.DataFrame:
+    """
+    Qualifying visits with admission and discharge dates.
+
+    Args:
+        data: Tables as loaded by validate_data.load_csv_files()
+        visit_concepts: visit_concept_ids that count as admissions, or
+            None for every visit
+        persons: Optional person_ids to restrict to
+
+    Returns:
+        DataFrame with visit_occurrence_id, person_id, admit_date,
+        discharge_date and discharged_to_concept_id
+    """
+    visits = _table(data, 'visit_occurrence', persons)
+    if visit_concepts is not None:
+        visits = visits[visits['visit_concept_id'].isin(list(visit_concepts))]
+    admit = _day(visits['visit_start_date'])
+    return pd.DataFrame({
+        'visit_occurrence_id': visits['visit_occurrence_id'].to_numpy(),
+        'person_id': visits['person_id'].to_numpy(),
+        'admit_date': admit.to_numpy(),
+        'discharge_date': _day(visits['visit_end_date']).fillna(admit).to_numpy(),
+        'discharged_to_concept_id': visits['discharged_to_concept_id'].to_numpy(),
+    })
+
+
+def extract_features(data: dict,
+                     visit_concepts: Iterable[int] = INPATIENT_VISIT_CONCEPTS,
+                     persons=None) -> pd.DataFrame:
+    """
+    Compute readmission model inputs for every discharge.
+
+    Args:
+        data: Tables as loaded by validate_data.load_csv_files()
+        visit_concepts: visit_concept_ids that count as admissions, or
+            None to featurize every visit
+        persons: Optional person_ids to restrict to (used by the cache to
+            recompute only changed persons)
+
+    Returns:
+        DataFrame indexed by visit_occurrence_id with person_id,
+        discharge_date and one column per model input (see FEATURES);
+        age is nullable (Int64), NA for stays of persons missing from
+        person or without a usable birth date
+    """
+    stays = discharges(data, visit_concepts, persons)
+    stay_keys = stays[['visit_occurrence_id', 'person_id', 'discharge_date']]
+    features = stays[['visit_occurrence_id', 'person_id', 'discharge_date']].copy()
+
+    # Demographics at discharge
+    person = _table(data, 'person', persons).drop_duplicates('person_id')
+    birth = _day(person['birth_datetime'])
+    # Else year/month/day of birth; only rows with a year are converted
+    year = pd.to_numeric(person['year_of_birth'], errors='coerce')
+    has_year = year.notna().to_numpy()
+    fallback = pd.Series(pd.NaT, index=person.index, dtype='datetime64[ns]')
+    fallback[has_year] = pd.to_datetime(pd.DataFrame({
+        part: pd.to_numeric(person[column], errors='coerce')[has_year]
+        .fillna(default).to_numpy(dtype=np.int64)
+        for part, column, default in (('year', 'year_of_birth', 0),
+                                      ('month', 'month_of_birth', 1),
+                                      ('day', 'day_of_birth', 1))
+    }), errors='coerce').to_numpy()
+    person = pd.DataFrame({
+        'person_id': person['person_id'].to_numpy(),
+        'birth_date': birth.fillna(fallback).to_numpy(),
+        'gender': person['gender_concept_id'].map(GENDERS).fillna('unknown').to_numpy(),
+    })
+    demographics = stays[['person_id', 'discharge_date']].merge(person, on='person_id',
+                                                               how='left')
+    discharged, born = demographics['discharge_date'].dt, demographics['birth_date'].dt
+    # Unknown (NA) when the person or their birth date is missing
+    features['age'] = (
+        discharged.year - born.year
+        - ((discharged.month * 32 + discharged.day) < (born.month * 32 + born.day))
+    ).astype('Int64').array
+    features['gender'] = demographics['gender'].fillna('unknown').to_numpy()
+
+    # Diagnoses active at discharge, and comorbidity history
+    conditions = _table(data, 'condition_occurrence', persons)
+    conditions = pd.DataFrame({
+        'person_id': conditions['person_id'].to_numpy(),
+        'concept_id': conditions['condition_concept_id'].to_numpy(),
+        'start': _day(conditions['condition_start_date']).to_numpy(),
+        'end': _day(conditions['condition_end_date']).to_numpy(),
+    })
+    history = stay_keys.merge(conditions, on='person_id')
+    history = history[history['start'] <= history['discharge_date']]
+    active = history[history['end'].isna() | (history['end'] >= history['discharge_date'])]
+    by_stay = features['visit_occurrence_id']
+    features['num_diagnoses'] = by_stay.map(
+        active.groupby('visit_occurrence_id')['concept_id'].nunique()).fillna(0)
+    for column, concepts in (('has_chf', CHF_CONCEPTS),
+                             ('has_diabetes', DIABETES_CONCEPTS),
+                             ('has_afib', AFIB_CONCEPTS)):
+        with_condition = history.loc[history['concept_id'].isin(concepts),
+                                     'visit_occurrence_id']
+        features[column] = by_stay.isin(with_condition)
+
+    # Medications active at discharge: end date, else the verbatim end
+    # date, else the days supplied
+    drugs = _table(data, 'drug_exposure', persons)
+    start = _day(drugs['drug_exposure_start_date'])
+    supplied = start + pd.to_timedelta(
+        pd.to_numeric(drugs['days_supply'], errors='coerce').fillna(1) - 1, unit='D')
+    drugs = pd.DataFrame({
+        'person_id': drugs['person_id'].to_numpy(),
+        'concept_id': drugs['drug_concept_id'].to_numpy(),
+        'start': start.to_numpy(),
+        'end': _day(drugs['drug_exposure_end_date'])
+                  .fillna(_day(drugs['verbatim_end_date'])).fillna(supplied).to_numpy(),
+    })
+    on_drug = stay_keys.merge(drugs, on='person_id')
+    on_drug = on_drug[(on_drug['start'] <= on_drug['discharge_date'])
+                      & (on_drug['end'] >= on_drug['discharge_date'])]
+    features['num_medications'] = by_stay.map(
+        on_drug.groupby('visit_occurrence_id')['concept_id'].nunique()).fillna(0)
+
+    features['length_of_stay'] = (
+        (stays['discharge_date'] - stays['admit_date']).dt.days.fillna(0).to_numpy())
+
+    # Admissions of the same person in the 6 months before this one
+    person_ids, admit_days = stays['person_id'], stays['admit_date']
+    group, _ = pd.factorize(person_ids)
+    day = admit_days.to_numpy().astype('datetime64[D]').astype(np.int64)
+    known = ~admit_days.isna().to_numpy()
+    # Stays without an admit date count 0 and are left out of the window
+    # queries, whose keys are only valid for known days
+    prior = np.zeros(len(day), dtype=np.int64)
+    prior[known] = _count_in_window(group[known], day[known], group[known], day[known],
+                                    PRIOR_ADMISSION_DAYS)
+    features['prior_admissions_6mo'] = prior
+
+    # Most recent eGFR on or before discharge
+    labs = _table(data, 'measurement', persons)
+    is_egfr = (labs['measurement_concept_id'].isin(EGFR_CONCEPTS)
+               | labs['measurement_source_value'].isin(EGFR_LOINC))
+    labs = labs[is_egfr.fillna(False).to_numpy(dtype=bool)]
+    egfr = pd.DataFrame({
+        'person_id': labs['person_id'].to_numpy(dtype=np.int64),
+        'date': _day(labs['measurement_date']).to_numpy(),
+        'eGFR': pd.to_numeric(labs['value_as_number'], errors='coerce').to_numpy(),
+    }).dropna().sort_values('date')
+    lookup = stay_keys.assign(person_id=stay_keys['person_id'].astype(np.int64))
+    lookup = lookup.dropna(subset=['discharge_date']).sort_values('discharge_date')
+    latest = pd.merge_asof(lookup, egfr, left_on='discharge_date', right_on='date',
+                           by='person_id', direction='backward')
+    features['eGFR'] = by_stay.map(
+        latest.set_index('visit_occurrence_id')['eGFR']).astype(float)
+
+    features['discharge_disposition'] = (
+        stays['discharged_to_concept_id'].map(DISPOSITIONS).fillna('other').to_numpy())
+
+    for column in ('num_diagnoses', 'num_medications', 'length_of_stay',
+                   'prior_admissions_6mo'):
+        features[column] = features[column].astype(np.int64)
+    return features.set_index('visit_occurrence_id')[
+        ['person_id', 'discharge_date', *FEATURES]]
+
+
+def _table_signature(df: pd.DataFrame, table: str) -> pd.Series:
+    """Per-person sum of the row hashes of one table's feature columns."""
+    df = df.reindex(columns=SOURCE_COLUMNS[table])
+    hashes = pd.util.hash_pandas_object(df, index=False)
+    return pd.Series(hashes.to_numpy(), name=table).groupby(df['person_id'].to_numpy()).sum()
+
+
+def person_signatures(data: dict) -> pd.DataFrame:
+    """
+    Per-person hash of every row the features depend on, one column per
+    table. A person whose signature changed (or who is new) has new,
+    edited or deleted events and must be featurized again.
+    """
+    signatures = pd.concat([_table_signature(_table(data, table), table)
+                            for table in SOURCE_COLUMNS], axis=1)
+    signatures = signatures.fillna(0).astype(np.uint64)
+    signatures.index.name = 'person_id'
+    return signatures
+
+
+def _load_source(path: Path, table: str, schema: dict) -> pd.DataFrame:
+    """The feature columns of one source CSV (those the file has)."""
+    if not path.exists():
+        return pd.DataFrame(columns=SOURCE_COLUMNS[table])
+    header = pd.read_csv(path, nrows=0).columns
+    return read_csv_typed(path, schema,
+                          usecols=[c for c in SOURCE_COLUMNS[table] if c in header])
+
+
+def _file_state(path: Path):
+    """(size, mtime) of a source file, or None if it does not exist."""
+    if not path.exists():
+        return None
+    stat = path.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _read(path: Path) -> pd.DataFrame:
+    return pd.read_parquet(path) if CACHE_FORMAT == 'parquet' else pd.read_pickle(path)
+
+
+def _write(df: pd.DataFrame, path: Path):
+    # Write then rename, so an interrupted run never leaves a partial file
+    partial = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    if CACHE_FORMAT == 'parquet':
+        df.to_parquet(partial)
+    else:
+        df.to_pickle(partial)
+    os.replace(partial, path)
+
+
+def extract_features_cached(data_dir: Path, cache_dir: Path,
+                            visit_concepts: Iterable[int] = INPATIENT_VISIT_CONCEPTS,
+                            schema: dict = None) -> Tuple[pd.DataFrame, int]:
+    """
+    extract_features() over the CSVs in ``data_dir``, recomputing only
+    persons whose events changed.
+
+    The cache holds every stay's features, each person's signature per
+    source table (person_signatures) and each source file's size and
+    mtime. A file whose size and mtime are unchanged is neither read nor
+    hashed; when no file changed the cached features are returned as
+    they are. Otherwise only the changed files are hashed again, and
+    only persons whose signature differs (or who are new) are featurized
+    again, from the tables loaded for them.
+
+    Returns:
+        (features, number of persons recomputed)
+    """
+    data_dir, cache_dir = Path(data_dir), Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    meta_path = cache_dir / 'readmission_features.json'
+    features_path = cache_dir / f'readmission_features.{CACHE_FORMAT}'
+    signatures_path = cache_dir / f'readmission_signatures.{CACHE_FORMAT}'
+    meta = {
+        'feature_version': FEATURE_VERSION,
+        'visit_concepts': None if visit_concepts is None else sorted(visit_concepts),
+    }
+    paths = {table: data_dir / f'{table}.csv' for table in SOURCE_COLUMNS}
+    files = {table: _file_state(path) for table, path in paths.items()}
+
+    stored = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+    valid = (stored.get('meta') == meta and features_path.exists()
+             and signatures_path.exists())
+    changed_tables = [table for table in SOURCE_COLUMNS
+                      if not valid or stored['files'].get(table) != files[table]]
+    if not changed_tables:
+        return _read(features_path), 0
+
+    schema = schema if schema is not None else load_schema(data_dir)
+    data = {table: _load_source(paths[table], table, schema) for table in changed_tables}
+    if valid:
+        old_signatures = _read(signatures_path)
+        signatures = pd.concat(
+            [_table_signature(data[table], table) if table in data
+             else old_signatures[table] for table in SOURCE_COLUMNS], axis=1)
+        signatures = signatures.fillna(0).astype(np.uint64)
+        signatures.index.name = 'person_id'
+        previous = old_signatures.reindex(signatures.index)
+        differs = (previous.isna() | (previous != signatures)).any(axis=1)
+        changed = signatures.index[differs.to_numpy()]
+    else:
+        signatures = person_signatures(data)
+        changed = signatures.index
+
+    if len(changed):
+        data.update((table, _load_source(paths[table], table, schema))
+                    for table in SOURCE_COLUMNS if table not in data)
+    if valid:
+        cached = _read(features_path)
+        kept = cached[cached['person_id'].isin(signatures.index)
+                      & ~cached['person_id'].isin(changed)]
+        recomputed = extract_features(data, visit_concepts, changed) if len(changed) \
+            else cached.iloc[:0]
+        features = pd.concat([kept, recomputed]).sort_index()
+    else:
+        features = extract_features(data, visit_concepts)
+
+    _write(features, features_path)
+    _write(signatures, signatures_path)
+    # Written last, so an interrupted run does not trust partial files
+    meta_path.write_text(json.dumps({'meta': meta, 'files': files}))
+    return features, len(changed)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from readmission_batch import predict_30day_readmission_frame
+    from validate_data import load_csv_files
+
+    parser = argparse.ArgumentParser(description="Readmission feature extraction")
+    parser.add_argument('--data-dir', type=Path,
+                        default=Path(__file__).resolve().parents[3] / 'data' / 'csv')
+    parser.add_argument('--cache-dir', type=Path, default=None,
+                        help="Cache per-person features between runs")
+    parser.add_argument('--all-visits', action='store_true',
+                        help="Featurize every visit, not only inpatient stays")
+    args = parser.parse_args()
+
+    visit_concepts = None if args.all_visits else INPATIENT_VISIT_CONCEPTS
+
+    # Timed from loading, which the cache skips for unchanged files
+    start = time.perf_counter()
+    if args.cache_dir:
+        features, recomputed = extract_features_cached(args.data_dir, args.cache_dir,
+                                                       visit_concepts)
+    else:
+        data = load_csv_files(args.data_dir)
+        features = extract_features(data, visit_concepts)
+        recomputed = features['person_id'].nunique()
+    seconds = time.perf_counter() - start
+    scores = predict_30day_readmission_frame(features)
+
+    print("=" * 60)
+    print("Readmission Features from OMOP CDM")
+    print("=" * 60)
+    print(f"Discharges featurized: {len(features):,} "
+          f"({recomputed:,} persons computed) in {seconds:.3f}s")
+    with pd.option_context('display.width', 120, 'display.max_columns', None):
+        print(features[list(FEATURES)].head(10))
+        print(scores[['risk_score', 'risk_category']].head(10))
+    print("=" * 60)
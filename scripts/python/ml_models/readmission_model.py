@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# ============================================================================
+# Script: readmission_model.py
+# Chapter: 10 - Outcomes, Research & Continuous Improvement
+# Textbook Section: 10.2 Patient-Level Prediction
+#
+# Description:
+#   Data-driven coefficient specification for the 30-day readmission
+#   model. Weights, thresholds and risk categories live in a versioned
+#   JSON file (readmission_model_v1.json) that is loaded once and
+#   compiled into a design-matrix transform, so scoring is a single
+#   matrix-vector product and recalibrating means shipping a new file.
+#
+# Prerequisites:
+#   - Python 3.8+
+#   - numpy, pandas (pip install -r requirements.txt)
+#
+# Usage:
+#   python readmission_model.py [spec.json]
+#
+# Expected Results:
+#   Prints the model version, intercept and one line per term.
+# ============================================================================
+
+"""
+Readmission Model Specification
+Versioned coefficients compiled into a design matrix
+"""
+
+import json
+import math
+import operator
+import sys
+from bisect import bisect_right
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'utilities'))
+
+from factorize import factorize  # noqa: E402
+
+DEFAULT_SPEC = Path(__file__).with_name('readmission_model_v1.json')
+
+# Term keys that bound a numeric feature: key -> comparison (works on
+# scalars and arrays alike)
+_BOUNDS = {
+    'min': operator.ge,
+    'above': operator.gt,
+    'below': operator.lt,
+}
+
+
+def _matches(values, test) -> np.ndarray:
+    """Evaluate a string test once per distinct value and gather."""
+    ids, vocabulary = factorize(values)
+    matched = np.array([test(str(v)) for v in vocabulary] + [False], dtype=bool)
+    return matched[ids]
+
+
+class ReadmissionModel:
+    """
+    A compiled readmission model specification.
+
+    Each term in the spec becomes one design-matrix column:
+
+    - ``equals``: 1 where a string feature equals the value
+      (optionally ``ignore_case``)
+    - ``min`` / ``above`` / ``below``: 1 where a numeric feature lies
+      in the range (bounds combine, e.g. 30 <= eGFR < 60)
+    - neither: 1 where a boolean feature is true
+    - ``per_unit``: the feature value itself where the range holds,
+      instead of 1 (e.g. 0.5 per prior admission)
+
+    so log-odds = intercept + X @ weights, and each factor's
+    contribution is its column times its weight.
+    """
+
+    def __init__(self, spec: dict):
+        self.spec = spec
+        self.name = spec['model']
+        self.version = spec['version']
+        self.intercept = float(spec['intercept'])
+        self.terms: List[dict] = spec['terms']
+        self.names = [term['name'] for term in self.terms]
+        self.features = sorted({term['feature'] for term in self.terms})
+        self.weights = np.array([term['weight'] for term in self.terms], dtype=float)
+        self._weight_list = self.weights.tolist()
+
+        categories = spec['categories']
+        self.categories = tuple(c['name'] for c in categories)
+        self.category_bounds = np.array([c['below'] for c in categories[:-1]], dtype=float)
+        self._bound_list = self.category_bounds.tolist()
+
+        # (feature, string test, numeric bounds, per_unit) per term
+        self._compiled = []
+        for term in self.terms:
+            unknown = set(term) - {'name', 'feature', 'weight', 'equals',
+                                   'ignore_case', 'per_unit', *_BOUNDS}
+            if unknown:
+                raise ValueError(f"{term['name']}: unknown term keys {sorted(unknown)}")
+            test = None
+            if 'equals' in term:
+                target = term['equals']
+                if term.get('ignore_case'):
+                    target = target.lower()
+                    test = lambda v, target=target: v.lower() == target  # noqa: E731
+                else:
+                    test = lambda v, target=target: v == target  # noqa: E731
+            bounds = [(_BOUNDS[key], term[key]) for key in _BOUNDS if key in term]
+            self._compiled.append(
+                (term['feature'], test, bounds, bool(term.get('per_unit'))))
+
+    @staticmethod
+    def _column(test, bounds, per_unit, values) -> np.ndarray:
+        if test is not None:
+            return _matches(values, test)
+        if not bounds:
+            return np.asarray(values, dtype=bool)
+
+        values = np.asarray(values, dtype=float)
+        holds = np.ones(len(values), dtype=bool)
+        for compare, bound in bounds:
+            holds &= compare(values, bound)
+        if per_unit:
+            return np.where(holds, values, 0.0)
+        return holds
+
+    def design_matrix(self, columns: Dict[str, object]) -> np.ndarray:
+        """
+        Transform feature columns into the (discharges x terms) design matrix.
+
+        Args:
+            columns: Feature name -> array/Series with one value per
+                discharge (a DataFrame works too)
+
+        Returns:
+            float64 array, column-major so each term is written contiguously
+        """
+        n = len(columns[self.features[0]])
+        X = np.empty((n, len(self.terms)), order='F')
+        for j, (feature, test, bounds, per_unit) in enumerate(self._compiled):
+            X[:, j] = self._column(test, bounds, per_unit, columns[feature])
+        return X
+
+    def design_row(self, features: Dict[str, object]) -> List[float]:
+        """
+        design_matrix() for a single discharge, without array overhead.
+
+        Returns:
+            One float per term
+        """
+        row = []
+        for feature, test, bounds, per_unit in self._compiled:
+            value = features[feature]
+            if test is not None:
+                row.append(float(test(str(value))))
+            elif not bounds:
+                row.append(float(bool(value)))
+            else:
+                cell = float(value) if per_unit else 1.0
+                for compare, bound in bounds:
+                    if not compare(value, bound):
+                        cell = 0.0
+                        break
+                row.append(cell)
+        return row
+
+    def log_odds(self, X: np.ndarray) -> np.ndarray:
+        return X @ self.weights + self.intercept
+
+    def categorize(self, risk: np.ndarray) -> np.ndarray:
+        """Index into ``categories`` for each risk probability."""
+        return np.searchsorted(self.category_bounds, risk, side='right').astype(np.int8)
+
+    def score(self, columns: Dict[str, object] = None,
+              X: np.ndarray = None) -> Tuple[np.ndarray, ...]:
+        """
+        Score feature columns (or an already built design matrix).
+
+        Returns:
+            (design matrix, log-odds, risk probability, category index)
+        """
+        if X is None:
+            X = self.design_matrix(columns)
+        log_odds = self.log_odds(X)
+        risk = 1 / (1 + np.exp(-log_odds))
+        return X, log_odds, risk, self.categorize(risk)
+
+    def score_row(self, features: Dict[str, object]) -> Tuple[List[float], float, int]:
+        """
+        score() for a single discharge in plain Python (NumPy's per-call
+        overhead outweighs the arithmetic for one row).
+
+        Returns:
+            (contribution per term, risk probability, category index)
+        """
+        contributions = [cell * weight for cell, weight
+                         in zip(self.design_row(features), self._weight_list)]
+        log_odds = self.intercept + sum(contributions)
+        risk = 1 / (1 + math.exp(-log_odds))
+        return contributions, risk, bisect_right(self._bound_list, risk)
+
+
+@lru_cache(maxsize=None)
+def load_model(path: Path = DEFAULT_SPEC) -> ReadmissionModel:
+    """Load and compile a model specification (cached per path)."""
+    with open(path, encoding='utf-8') as f:
+        return ReadmissionModel(json.load(f))
+
+
+if __name__ == "__main__":
+    model = load_model(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SPEC)
+
+    print("=" * 60)
+    print(f"Readmission Model: {model.name} v{model.version}")
+    print("=" * 60)
+    print(f"Intercept (log-odds): {model.intercept:+.2f}")
+    for term, weight in zip(model.terms, model.weights):
+        condition = {k: v for k, v in term.items() if k not in ('name', 'feature', 'weight')}
+        print(f"  {term['name']:<22} {weight:+.2f}  {term['feature']} {condition or 'true'}")
+    print(f"Categories: {', '.join(model.categories)} "
+          f"(bounds {', '.join(f'{b:.0%}' for b in model.category_bounds)})")
+    print("=" * 60)
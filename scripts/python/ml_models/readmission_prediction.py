@@ -11,7 +11,7 @@
 #
 # Prerequisites:
 #   - Python 3.8+
-#   - numpy (pip install numpy)
+#   - numpy, pandas (pip install -r requirements.txt)
 #
 # Usage:
 #   python readmission_prediction.py
@@ -27,10 +27,11 @@
 Patient-level prediction for hospital readmission
 """
 
-import numpy as np
 from dataclasses import dataclass
 from typing import Dict
 
+from readmission_model import ReadmissionModel, load_model
+
 
 @dataclass
 class ReadmissionPrediction:
@@ -51,11 +52,15 @@ def predict_30day_readmission(
     has_diabetes: bool,
     has_afib: bool,
     eGFR: float,
-    discharge_disposition: str
+    discharge_disposition: str,
+    model: ReadmissionModel = None
 ) -> ReadmissionPrediction:
     """
     Simple logistic regression-style readmission prediction.
 
+    Weights and thresholds come from a versioned coefficient
+    specification rather than being hard-coded here.
+
     In production, this would use a trained ML model (e.g., XGBoost,
     Random Forest) with proper cross-validation and calibration.
 
@@ -83,6 +88,9 @@ def predict_30day_readmission(
         Estimated glomerular filtration rate (mL/min/1.73m2)
     discharge_disposition : str
         'home', 'snf', 'rehab', etc.
+    model : ReadmissionModel, optional
+        Compiled coefficient specification (default: the bundled
+        readmission_model_v1.json; see readmission_model.py)
 
     Returns:
     --------
@@ -90,86 +98,31 @@ def predict_30day_readmission(
         Risk score, category, and contributing factors
     """
 
-    # Baseline risk (log-odds)
-    log_odds = -3.5
-    factors = {}
-
-    # Age effect (increased risk with age)
-    if age >= 65:
-        log_odds += 0.3
-        factors['Age ≥65'] = 0.3
-    elif age >= 75:
-        log_odds += 0.6
-        factors['Age ≥75'] = 0.6
-
-    # Gender effect
-    if gender.lower() == 'male':
-        log_odds += 0.1
-        factors['Male'] = 0.1
-
-    # Comorbidity burden
-    if num_diagnoses > 5:
-        log_odds += 0.4
-        factors['Multiple diagnoses'] = 0.4
-
-    # Polypharmacy
-    if num_medications > 5:
-        log_odds += 0.2
-        factors['Polypharmacy'] = 0.2
-
-    # Length of stay
-    if length_of_stay > 3:
-        log_odds += 0.3
-        factors['Extended LOS'] = 0.3
-
-    # Prior admissions (strongest predictor)
-    if prior_admissions_6mo > 0:
-        log_odds += 0.5 * prior_admissions_6mo
-        factors['Prior admissions'] = 0.5 * prior_admissions_6mo
-
-    # Specific conditions
-    if has_chf:
-        log_odds += 0.6
-        factors['Heart failure'] = 0.6
-
-    if has_diabetes:
-        log_odds += 0.2
-        factors['Diabetes'] = 0.2
-
-    if has_afib:
-        log_odds += 0.15
-        factors['Atrial fibrillation'] = 0.15
-
-    # Renal function
-    if eGFR < 30:
-        log_odds += 0.5
-        factors['Severe CKD'] = 0.5
-    elif eGFR < 60:
-        log_odds += 0.2
-        factors['Moderate CKD'] = 0.2
-
-    # Discharge disposition
-    if discharge_disposition == 'home':
-        log_odds -= 0.1
-        factors['Discharge to home'] = -0.1
-    elif discharge_disposition == 'snf':
-        log_odds += 0.4
-        factors['Discharge to SNF'] = 0.4
-
-    # Convert log-odds to probability using sigmoid function
-    risk_score = 1 / (1 + np.exp(-log_odds))
-
-    # Categorize risk
-    if risk_score < 0.10:
-        risk_category = 'Low'
-    elif risk_score < 0.20:
-        risk_category = 'Moderate'
-    else:
-        risk_category = 'High'
+    model = model or load_model()
+    contributions, risk, category = model.score_row({
+        'age': age,
+        'gender': gender,
+        'num_diagnoses': num_diagnoses,
+        'num_medications': num_medications,
+        'length_of_stay': length_of_stay,
+        'prior_admissions_6mo': prior_admissions_6mo,
+        'has_chf': has_chf,
+        'has_diabetes': has_diabetes,
+        'has_afib': has_afib,
+        'eGFR': eGFR,
+        'discharge_disposition': discharge_disposition,
+    })
+
+    # Contribution of each term that applies, in specification order
+    factors = {
+        name: float(contribution)
+        for name, contribution in zip(model.names, contributions)
+        if contribution
+    }
 
     return ReadmissionPrediction(
-        risk_score=round(risk_score * 100, 1),
-        risk_category=risk_category,
+        risk_score=round(risk * 100, 1),
+        risk_category=model.categories[category],
         contributing_factors=factors
     )
 
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Bulk Patient Search Benchmark
+Throughput of RegistrationService.search_patients_bulk vs. concurrency
+
+Chapter: 1 - Patient Registration
+Textbook Section: 1.5 Python Implementation
+
+Starts a local MockFHIRServer (in its own process) with a fixed
+per-request latency and a small transient failure rate, then runs the
+same batch of demographics lookups at increasing concurrency limits.
+With latency-bound requests, throughput scales roughly linearly until
+the client saturates. On a single core that is around 16-32 connections:
+beyond that, the HTTP/1.1 connection pool's per-request bookkeeping
+(which grows with pool size) costs more than the extra parallelism buys.
+
+Prerequisites:
+    pip install httpx pydantic fhir.resources
+
+Usage:
+    python bulk_search_benchmark.py [--searches 2000] [--latency 0.02]
+                                    [--concurrency 1 2 4 8 16 32]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from datetime import date
+
+import httpx
+
+from mock_fhir_server import serve_in_process, synthetic_patients
+from patient_registration_service import PatientSearchQuery, RegistrationService
+
+
+def make_queries(patients: list, count: int, seed: int = 1) -> list:
+    """Lookups for known patients, with every fourth one a likely miss."""
+    rng = random.Random(seed)
+    queries = []
+    for i in range(count):
+        patient = rng.choice(patients)
+        name = patient["name"][0]
+        birth_date = date.fromisoformat(patient["birthDate"])
+        if i % 4 == 3:
+            birth_date = birth_date.replace(year=birth_date.year - 50)
+        queries.append(PatientSearchQuery(
+            last_name=name["family"],
+            date_of_birth=birth_date,
+            first_name=name["given"][0],
+        ))
+    return queries
+
+
+async def run(base_url: str, queries: list, concurrency: int) -> dict:
+    """Run one bulk search and return throughput statistics."""
+    limits = httpx.Limits(max_connections=concurrency,
+                          max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits) as client:
+        service = RegistrationService(client, base_url=base_url)
+        matched = errors = retries = 0
+        start = time.perf_counter()
+        async for result in service.search_patients_bulk(queries, concurrency=concurrency):
+            matched += bool(result.matches)
+            errors += result.error is not None
+            retries += result.attempts - 1
+        seconds = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "seconds": seconds,
+        "searches_per_sec": len(queries) / seconds,
+        "matched": matched,
+        "retries": retries,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--searches", type=int, default=2000)
+    parser.add_argument("--patients", type=int, default=50_000)
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="Mock server latency per request in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.01,
+                        help="Fraction of requests the mock server fails with 503")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    patients = synthetic_patients(args.patients)
+    queries = make_queries(patients, args.searches)
+
+    print("=" * 60)
+    print(f"Bulk patient search: {args.searches:,} searches, "
+          f"{args.latency * 1000:.0f} ms server latency, "
+          f"{args.failure_rate:.0%} transient failures")
+    print("=" * 60)
+    print(f"{'Concurrency':>11} {'Seconds':>9} {'Searches/s':>11} "
+          f"{'Matched':>8} {'Retries':>8} {'Errors':>7}")
+    baseline = None
+    with serve_in_process(args.patients, latency=args.latency,
+                          failure_rate=args.failure_rate) as base_url:
+        for concurrency in args.concurrency:
+            stats = asyncio.run(run(base_url, queries, concurrency))
+            baseline = baseline or stats["searches_per_sec"]
+            print(f"{stats['concurrency']:>11} {stats['seconds']:>9.2f} "
+                  f"{stats['searches_per_sec']:>11.0f} {stats['matched']:>8} "
+                  f"{stats['retries']:>8} {stats['errors']:>7}  "
+                  f"({stats['searches_per_sec'] / baseline:.1f}x)")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Eligibility Cache
+TTL / LRU cache for X12 270/271 eligibility responses
+
+Chapter: 1 - Patient Registration
+Textbook Section: 1.5 Python Implementation
+
+Eligibility is checked at every encounter, but a member's coverage for a
+given day rarely changes, and each clearinghouse transaction is slow and
+billed. EligibilityCache keeps responses keyed by
+(medicaid_id, service-date window) for a fixed time-to-live, evicts the
+least recently used entries beyond a size limit, and coalesces
+concurrent lookups: while a member's 270 is in flight, other callers
+for the same key await that request instead of sending their own.
+
+Failed lookups are not cached; every caller waiting on the failed
+request sees the error and the next lookup tries again.
+
+Usage:
+    cache = EligibilityCache(ttl=4 * 3600, max_entries=50_000)
+    service = RegistrationService(client, eligibility_cache=cache)
+
+    python eligibility_cache.py    # simulated front-desk burst
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+DEFAULT_TTL = 4 * 3600        # seconds
+DEFAULT_MAX_ENTRIES = 50_000
+DEFAULT_WINDOW_DAYS = 1       # service dates sharing a cached response
+
+
+class EligibilityCache:
+    """
+    Async TTL + LRU cache with in-flight request coalescing.
+
+    Args:
+        ttl: Seconds a response stays valid
+        max_entries: Entries kept before least recently used are evicted
+        window_days: Service dates within the same window (counted in
+            whole days from 0001-01-01) share a cache entry
+        clock: Monotonic time source in seconds (for tests)
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 window_days: int = DEFAULT_WINDOW_DAYS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.window_days = window_days
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires, value)
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0        # lookups that went upstream
+        self.coalesced = 0     # lookups that joined an in-flight request
+        self.evictions = 0
+        self.expirations = 0
+
+    def key(self, medicaid_id: str, service_date: date) -> tuple:
+        return medicaid_id, service_date.toordinal() // self.window_days
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(
+        self,
+        medicaid_id: str,
+        service_date: date,
+        fetch: Callable[[], Awaitable[dict]]
+    ) -> dict:
+        """
+        Cached response for the member and date, calling ``fetch()`` on a
+        miss.
+
+        Args:
+            medicaid_id: Member identifier
+            service_date: Date of service
+            fetch: Zero-argument coroutine function performing the
+                upstream 270/271 lookup
+
+        Returns:
+            The (shared, do not mutate) eligibility response
+        """
+        key = self.key(medicaid_id, service_date)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > self.clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._entries[key]
+            self.expirations += 1
+
+        request = self._inflight.get(key)
+        if request is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            request = asyncio.ensure_future(fetch())
+            self._inflight[key] = request
+            request.add_done_callback(lambda done, key=key: self._complete(key, done))
+        # Shielded: a cancelled caller must not cancel the shared request
+        return await asyncio.shield(request)
+
+    def _complete(self, key: Hashable, request: asyncio.Future):
+        self._inflight.pop(key, None)
+        if request.cancelled() or request.exception() is not None:
+            return
+        self._entries[key] = (self.clock() + self.ttl, request.result())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, medicaid_id: str, service_date: Optional[date] = None):
+        """Drop a member's cached responses (one window, or all of them)."""
+        if service_date is not None:
+            self._entries.pop(self.key(medicaid_id, service_date), None)
+            return
+        for key in [k for k in self._entries if k[0] == medicaid_id]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    @property
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
+
+
+if __name__ == "__main__":
+    import random
+
+    upstream_calls = 0
+
+    async def clearinghouse(medicaid_id: str) -> dict:
+        """Stand-in for a 270/271 round trip (~300 ms, billed per call)."""
+        global upstream_calls
+        upstream_calls += 1
+        await asyncio.sleep(0.3)
+        return {"status": "active", "medicaid_id": medicaid_id}
+
+    async def front_desk(cache: EligibilityCache, members: list, lookups: int):
+        rng = random.Random(0)
+        today = date.today()
+
+        async def check(medicaid_id: str):
+            await cache.get(medicaid_id, today, lambda: clearinghouse(medicaid_id))
+
+        # Bursts of concurrent check-ins, then repeat visits later in the day
+        for _ in range(lookups // 100):
+            await asyncio.gather(*(check(rng.choice(members)) for _ in range(100)))
+
+    members = [f"IL{i:09d}" for i in range(200)]
+    cache = EligibilityCache(ttl=3600, max_entries=1000)
+    start = time.perf_counter()
+    asyncio.run(front_desk(cache, members, lookups=2000))
+    seconds = time.perf_counter() - start
+
+    print("=" * 60)
+    print("Eligibility cache: 2,000 check-ins for 200 members, 300 ms upstream")
+    print("=" * 60)
+    print(f"Upstream 270/271 calls: {upstream_calls} (uncached: 2000)")
+    print(f"Elapsed:                {seconds:.2f}s (uncached, serial: {2000 * 0.3:.0f}s)")
+    for name, value in cache.stats.items():
+        print(f"  {name:<12} {value:.1%}" if name == "hit_rate" else f"  {name:<12} {value}")
+    print("=" * 60)
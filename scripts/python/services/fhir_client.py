@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+FHIR Client Factory
+Tuned httpx client and per-endpoint latency metrics
+
+Chapter: 1 - Patient Registration
+Textbook Section: 1.5 Python Implementation
+
+create_fhir_client() builds the AsyncClient the registration service
+uses when none is passed in:
+
+- connection pool sized for the front desk's concurrency, with idle
+  keep-alive connections reused instead of re-handshaking TLS. Large
+  HTTP/1.1 pools are split into shards of at most 16 connections:
+  httpcore rescans (and polls the socket of) every pooled connection
+  each time a request is queued or released, which costs more CPU than
+  the network time saved once a pool holds a few dozen connections
+- HTTP/2 multiplexing when the optional h2 package is installed
+  (pip install "httpx[http2]"); HTTP/1.1 otherwise
+- separate connect / read / write / pool timeouts, so a dead server
+  fails fast while a slow search may still complete
+- gzip / deflate response decompression (Accept-Encoding) and FHIR JSON
+  Accept header
+
+LatencyMetrics keeps a bounded window of request latencies per endpoint
+and reports count, errors and p50 / p90 / p99.
+
+Prerequisites:
+    pip install httpx
+"""
+
+import math
+import time
+from collections import deque
+from itertools import cycle
+from typing import Dict, Optional
+
+import httpx
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Pool defaults: enough connections for a busy registration desk plus
+# bulk jobs; idle connections are kept for reuse up to the expiry
+MAX_CONNECTIONS = 64
+MAX_KEEPALIVE_CONNECTIONS = 32
+KEEPALIVE_EXPIRY = 30.0      # seconds an idle connection is kept
+MAX_CONNECTIONS_PER_SHARD = 16
+
+# Timeouts in seconds
+CONNECT_TIMEOUT = 3.0
+READ_TIMEOUT = 15.0
+WRITE_TIMEOUT = 15.0
+POOL_TIMEOUT = 10.0          # waiting for a free pooled connection
+
+# Latency samples kept per endpoint for percentiles
+METRICS_WINDOW = 10_000
+
+
+def create_fhir_client(
+    max_connections: int = MAX_CONNECTIONS,
+    max_keepalive_connections: int = MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry: float = KEEPALIVE_EXPIRY,
+    http2: Optional[bool] = None,
+    connect_timeout: float = CONNECT_TIMEOUT,
+    read_timeout: float = READ_TIMEOUT,
+    write_timeout: float = WRITE_TIMEOUT,
+    pool_timeout: float = POOL_TIMEOUT,
+    pool_shards: Optional[int] = None,
+    headers: Optional[Dict[str, str]] = None,
+    **client_options
+) -> httpx.AsyncClient:
+    """
+    AsyncClient tuned for a FHIR server.
+
+    Args:
+        max_connections: Upper bound on open connections
+        max_keepalive_connections: Idle connections kept for reuse
+        keepalive_expiry: Seconds before an idle connection is closed
+        http2: Negotiate HTTP/2 (None: whenever h2 is installed).
+            HTTP/2 is negotiated over TLS; plain http:// stays HTTP/1.1
+        connect_timeout, read_timeout, write_timeout, pool_timeout:
+            Per-phase timeouts in seconds
+        pool_shards: Connection pools the connections are split over,
+            round-robin (None: one per MAX_CONNECTIONS_PER_SHARD
+            connections)
+        headers: Extra default headers
+        **client_options: Passed through to httpx.AsyncClient
+
+    Returns:
+        A client the caller must close (``await client.aclose()`` or
+        ``async with``)
+    """
+    if http2 is None:
+        http2 = HTTP2_AVAILABLE
+    elif http2 and not HTTP2_AVAILABLE:
+        raise ImportError('HTTP/2 needs the h2 package: pip install "httpx[http2]"')
+    if pool_shards is None:
+        # Also for http2=True: plain http:// URLs still speak HTTP/1.1
+        pool_shards = math.ceil(max_connections / MAX_CONNECTIONS_PER_SHARD)
+    pool_shards = max(1, min(pool_shards, max_connections))
+
+    limits = httpx.Limits(
+        max_connections=math.ceil(max_connections / pool_shards),
+        max_keepalive_connections=math.ceil(max_keepalive_connections / pool_shards),
+        keepalive_expiry=keepalive_expiry,
+    )
+    transports = [httpx.AsyncHTTPTransport(http2=http2, limits=limits)
+                  for _ in range(pool_shards)]
+
+    return httpx.AsyncClient(
+        transport=transports[0] if pool_shards == 1 else ShardedTransport(transports),
+        timeout=httpx.Timeout(
+            connect=connect_timeout,
+            read=read_timeout,
+            write=write_timeout,
+            pool=pool_timeout,
+        ),
+        headers={
+            "Accept": "application/fhir+json",
+            "Accept-Encoding": "gzip, deflate",
+            **(headers or {}),
+        },
+        **client_options
+    )
+
+
+class ShardedTransport(httpx.AsyncBaseTransport):
+    """Spread requests round-robin over several connection pools."""
+
+    def __init__(self, transports: list):
+        self.transports = transports
+        self._next = cycle(transports)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await next(self._next).handle_async_request(request)
+
+    async def aclose(self):
+        for transport in self.transports:
+            await transport.aclose()
+
+
+class LatencyMetrics:
+    """
+    Per-endpoint request latencies.
+
+    The most recent ``window`` samples per endpoint are kept for
+    percentiles; counts and errors are totals.
+    """
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, endpoint: str, seconds: float, error: bool = False):
+        samples = self._samples.get(endpoint)
+        if samples is None:
+            samples = self._samples[endpoint] = deque(maxlen=self.window)
+            self.counts[endpoint] = 0
+            self.errors[endpoint] = 0
+        samples.append(seconds)
+        self.counts[endpoint] += 1
+        self.errors[endpoint] += error
+
+    def timer(self, endpoint: str) -> "_Timer":
+        """Context manager recording the enclosed block's duration."""
+        return _Timer(self, endpoint)
+
+    def reset(self):
+        self._samples.clear()
+        self.counts.clear()
+        self.errors.clear()
+
+    def summary(self) -> Dict[str, dict]:
+        """Endpoint -> {count, errors, mean, p50, p90, p99, max} (seconds)."""
+        report = {}
+        for endpoint, samples in self._samples.items():
+            ordered = sorted(samples)
+            n = len(ordered)
+            report[endpoint] = {
+                "count": self.counts[endpoint],
+                "errors": self.errors[endpoint],
+                "mean": sum(ordered) / n,
+                "p50": _percentile(ordered, 0.50),
+                "p90": _percentile(ordered, 0.90),
+                "p99": _percentile(ordered, 0.99),
+                "max": ordered[-1],
+            }
+        return report
+
+
+class _Timer:
+    __slots__ = ("metrics", "endpoint", "start")
+
+    def __init__(self, metrics: LatencyMetrics, endpoint: str):
+        self.metrics = metrics
+        self.endpoint = endpoint
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.record(self.endpoint, time.perf_counter() - self.start,
+                            error=exc_type is not None)
+        return False
+
+
+def _percentile(ordered: list, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
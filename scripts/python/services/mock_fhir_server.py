@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Mock FHIR Server
+Local stand-in for the clinic FHIR endpoint, for benchmarks and demos
+
+Chapter: 1 - Patient Registration
+Textbook Section: 1.5 Python Implementation
+
+Serves Patient searches (family / birthdate / given, paged with _count
+and next links) over a synthetic patient population, resource creates (POST /Patient, /Coverage, ...)
+and transaction Bundles (POST to the base URL, with urn:uuid references
+resolved) from a background thread. Response latency, transient
+failure rate and gzip response compression are configurable so
+client-side concurrency, timeouts, retries and round-trip counts can be
+exercised without a real server.
+Uses the standard library only.
+
+Usage:
+    with MockFHIRServer(synthetic_patients(10_000), latency=0.02) as server:
+        service = RegistrationService(client, base_url=server.base_url)
+
+    with serve_in_process(10_000, latency=0.02) as base_url:
+        ...
+
+    python mock_fhir_server.py [port]    # serve until interrupted
+"""
+
+import gzip
+import json
+import multiprocessing
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+FAMILY_NAMES = [
+    "Rodriguez", "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia",
+    "Miller", "Davis", "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson",
+    "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin", "Lee",
+    "Perez", "Thompson", "White", "Harris", "Sanchez", "Clark", "Ramirez",
+    "Lewis", "Robinson", "Walker", "Young", "Allen", "King", "Wright", "Nguyen",
+]
+GIVEN_NAMES = {
+    "female": ["Maria", "Jennifer", "Linda", "Patricia", "Elizabeth", "Susan",
+               "Jessica", "Sarah", "Karen", "Lisa", "Nancy", "Ana", "Rosa"],
+    "male": ["James", "Robert", "John", "Michael", "David", "William", "Jose",
+             "Richard", "Joseph", "Thomas", "Carlos", "Luis", "Daniel"],
+}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Default backlog of 5 drops connections when clients open many at once
+    request_queue_size = 256
+
+
+def synthetic_patients(count: int, seed: int = 0) -> List[dict]:
+    """
+    Deterministic synthetic FHIR Patient resources.
+
+    Birth dates are drawn from a narrow range so that family + birthdate
+    searches return a handful of candidates, as they would in an MPI.
+    """
+    rng = random.Random(seed)
+    start = date(1940, 1, 1)
+    patients = [{
+        "resourceType": "Patient",
+        "id": "maria-rodriguez",
+        "identifier": [{
+            "type": {"coding": [{"code": "MR"}]},
+            "value": "MRN-2024-78432",
+        }],
+        "name": [{"use": "official", "family": "Rodriguez", "given": ["Maria"]}],
+        "gender": "female",
+        "birthDate": "1979-03-15",
+        "address": [{"postalCode": "62701"}],
+    }]
+    for i in range(1, count):
+        gender = rng.choice(("female", "male"))
+        patients.append({
+            "resourceType": "Patient",
+            "id": f"pat-{i}",
+            "identifier": [{
+                "type": {"coding": [{"code": "MR"}]},
+                "value": f"MRN-{i:08d}",
+            }],
+            "name": [{
+                "use": "official",
+                "family": rng.choice(FAMILY_NAMES),
+                "given": [rng.choice(GIVEN_NAMES[gender])],
+            }],
+            "gender": gender,
+            "birthDate": (start + timedelta(days=rng.randrange(365 * 3))).isoformat(),
+            "address": [{"postalCode": f"62{rng.randrange(1000):03d}"}],
+        })
+    return patients
+
+
+class MockFHIRServer:
+    """
+    Threaded HTTP/1.1 (keep-alive) FHIR stub.
+
+    Args:
+        patients: Patient resources to serve (see synthetic_patients())
+        latency: Seconds each response is delayed, simulating server and
+            network time
+        failure_rate: Fraction of requests answered with 503 and
+            Retry-After: 0, to exercise client retries
+        gzip_min_size: Gzip response bodies of at least this many bytes
+            when the client accepts it (None: never compress)
+        host, port: Bind address (port 0 picks a free port)
+        seed: Seed for the failure injection
+    """
+
+    def __init__(self, patients: Optional[List[dict]] = None, latency: float = 0.0,
+                 failure_rate: float = 0.0, host: str = "127.0.0.1", port: int = 0,
+                 seed: int = 0, gzip_min_size: Optional[int] = None):
+        self.patients = {p["id"]: p for p in (patients or [])}
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.gzip_min_size = gzip_min_size
+        self.request_count = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._index = {}
+        for patient in self.patients.values():
+            self._index.setdefault(self._key(patient), []).append(patient)
+        self.created = {}  # resource type -> {id: resource}
+        self._next_id = 0
+
+        self._server = _Server((host, port), self._handler_class())
+        self._thread = None
+        host, port = self._server.server_address[:2]
+        self.base_url = f"http://{host}:{port}/fhir"
+
+    @staticmethod
+    def _key(patient: dict) -> tuple:
+        return patient["name"][0].get("family", "").lower(), patient.get("birthDate")
+
+    def search(self, params: dict) -> dict:
+        """
+        Answer a Patient search with a searchset Bundle.
+
+        With ``_count`` the matches are paged: each page links to the
+        next through ``link[relation=next]`` (an ``_offset`` URL).
+        """
+        family = params.get("family", "").lower()
+        matches = self._index.get((family, params.get("birthdate")), [])
+        given = params.get("given", "").lower()
+        if given:
+            matches = [p for p in matches
+                       if given in (g.lower() for g in p["name"][0].get("given", []))]
+
+        count = int(params.get("_count") or 0)
+        offset = int(params.get("_offset") or 0)
+        page = matches[offset:offset + count] if count else matches
+        links = [{"relation": "self",
+                  "url": f"{self.base_url}/Patient?{urlencode(params)}"}]
+        if count and offset + count < len(matches):
+            links.append({"relation": "next", "url": f"{self.base_url}/Patient?"
+                          f"{urlencode(dict(params, _offset=offset + count))}"})
+        return {
+            "resourceType": "Bundle",
+            "type": "searchset",
+            "total": len(matches),
+            "link": links,
+            "entry": [{"fullUrl": f"{self.base_url}/Patient/{p['id']}", "resource": p,
+                       "search": {"mode": "match"}}
+                      for p in page],
+        }
+
+    def _assign_id(self, resource: dict) -> str:
+        resource_type = resource.get("resourceType")
+        if not resource_type:
+            raise ValueError("resource has no resourceType")
+        with self._lock:
+            self._next_id += 1
+            return f"{resource_type.lower()}-{self._next_id}"
+
+    def create(self, resource: dict, resource_id: Optional[str] = None) -> dict:
+        """Store a new resource under a server-assigned id."""
+        resource_id = resource_id or self._assign_id(resource)
+        resource = dict(resource, id=resource_id, meta={"versionId": "1"})
+        resource_type = resource["resourceType"]
+        with self._lock:
+            self.created.setdefault(resource_type, {})[resource["id"]] = resource
+            if resource_type == "Patient" and resource.get("name"):
+                self.patients[resource["id"]] = resource
+                self._index.setdefault(self._key(resource), []).append(resource)
+        return resource
+
+    def transaction(self, bundle: dict, minimal: bool = False) -> dict:
+        """
+        Process a transaction Bundle of POST entries.
+
+        Ids are assigned up front and urn:uuid references rewritten to
+        them before anything is stored, so entries may reference each
+        other in any order. Only creates are supported.
+        """
+        if bundle.get("type") != "transaction":
+            raise ValueError("expected a transaction Bundle")
+        entries = bundle.get("entry", [])
+        for entry in entries:
+            if entry.get("request", {}).get("method") != "POST":
+                raise ValueError("only POST entries are supported")
+
+        resources = [entry["resource"] for entry in entries]
+        ids = [self._assign_id(resource) for resource in resources]
+        assigned = {entry["fullUrl"]: f"{resource['resourceType']}/{resource_id}"
+                    for entry, resource, resource_id in zip(entries, resources, ids)
+                    if entry.get("fullUrl", "").startswith("urn:uuid:")}
+        if assigned:
+            for i, resource in enumerate(resources):
+                text = json.dumps(resource)
+                for placeholder, reference in assigned.items():
+                    text = text.replace(f'"{placeholder}"', f'"{reference}"')
+                resources[i] = json.loads(text)
+        created = [self.create(resource, resource_id)
+                   for resource, resource_id in zip(resources, ids)]
+
+        replies = []
+        for resource in created:
+            reply = {"response": {
+                "status": "201 Created",
+                "location": f"{resource['resourceType']}/{resource['id']}/_history/1",
+            }}
+            if not minimal:
+                reply["resource"] = resource
+            replies.append(reply)
+        return {"resourceType": "Bundle", "type": "transaction-response", "entry": replies}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Send headers and body in one segment: with Nagle's algorithm
+            # separate writes stall ~40 ms on the client's delayed ACK
+            disable_nagle_algorithm = True
+            wbufsize = 1 << 16
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: dict = None, headers: dict = None):
+                payload = json.dumps(body).encode() if body is not None else b""
+                compress = (server.gzip_min_size is not None
+                            and len(payload) >= server.gzip_min_size
+                            and "gzip" in self.headers.get("Accept-Encoding", ""))
+                if compress:
+                    payload = gzip.compress(payload, compresslevel=1)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/fhir+json")
+                if compress:
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _begin(self) -> bool:
+                """Count, delay and maybe fail a request; False if it failed."""
+                with server._lock:
+                    server.request_count += 1
+                    fail = server._rng.random() < server.failure_rate
+                if server.latency:
+                    time.sleep(server.latency)
+                if fail:
+                    self._send(503, {"resourceType": "OperationOutcome"},
+                               {"Retry-After": "0"})
+                return not fail
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if not self._begin():
+                    return
+                if url.path.rstrip("/").endswith("/Patient"):
+                    params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                    self._send(200, server.search(params))
+                else:
+                    self._send(404, {"resourceType": "OperationOutcome"})
+
+            def do_POST(self):
+                url = urlsplit(self.path)
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if not self._begin():
+                    return
+                minimal = "return=minimal" in self.headers.get("Prefer", "")
+                try:
+                    resource = json.loads(body)
+                    if resource.get("resourceType") == "Bundle":
+                        self._send(200, server.transaction(resource, minimal))
+                    else:
+                        created = server.create(resource)
+                        location = (f"{server.base_url}/{created['resourceType']}/"
+                                    f"{created['id']}/_history/1")
+                        self._send(201, None if minimal else created,
+                                   {"Location": location})
+                except (ValueError, KeyError, AttributeError) as exc:
+                    self._send(400, {
+                        "resourceType": "OperationOutcome",
+                        "issue": [{"severity": "error", "code": "invalid",
+                                   "diagnostics": str(exc)}],
+                    })
+
+        return Handler
+
+    def start(self) -> "MockFHIRServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockFHIRServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _serve(connection, patient_count: int, options: dict):
+    server = MockFHIRServer(synthetic_patients(patient_count), **options).start()
+    connection.send(server.base_url)
+    connection.recv()  # block until asked to stop
+    server.stop()
+
+
+@contextmanager
+def serve_in_process(patient_count: int, **options):
+    """
+    Run a MockFHIRServer over synthetic_patients(patient_count) in a
+    separate process, so benchmarks do not share the client's GIL.
+
+    Yields:
+        The server's base URL
+    """
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_serve, args=(child, patient_count, options),
+                                      daemon=True)
+    process.start()
+    try:
+        yield parent.recv()
+    finally:
+        parent.send(None)
+        process.join(timeout=5)
+
+
+if __name__ == "__main__":
+    import sys
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+    server = MockFHIRServer(synthetic_patients(10_000), port=port)
+    print(f"Mock FHIR server at {server.base_url} (Ctrl+C to stop)")
+    server.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+"""
+Patient Matcher
+In-process master patient index (MPI) matching
+
+Chapter: 1 - Patient Registration
+Textbook Section: 1.5 Python Implementation
+
+Probabilistic (Fellegi-Sunter) record linkage over an in-memory patient
+snapshot, so duplicate checks at registration do not need a round trip
+to the FHIR server for every candidate:
+
+- Each patient is reduced once to normalized comparison tokens
+  (uppercase ASCII names and their Soundex codes, ISO birth date,
+  5-digit postal code, 10-digit phone).
+- Blocking: candidates are the patients sharing at least one blocking
+  key with the query -- (surname Soundex, birth date), (surname Soundex,
+  postal code) or (birth date, postal code) -- so a typo in the surname,
+  a transposed birth date or a married-name change still finds the
+  record. Each key set is a sorted int64 hash array searched with
+  binary search.
+- Scoring: every compared field adds its agreement, partial-agreement
+  or disagreement weight, log2(m / u); surname and given-name agreement
+  weights come from their frequency in the snapshot, so agreeing on
+  "Smith" counts for less than agreeing on "Przybylski". Missing values
+  contribute nothing. Given names are compared pairwise (all of each
+  patient's given names, e.g. first and middle) and the best agreement
+  counts.
+
+Prerequisites:
+    pip install numpy
+
+Usage:
+    matcher = PatientMatcher.from_fhir(patients)
+    matcher.top_k(make_record(None, "Rodriguez", "Maria", "1979-03-15"))
+
+    python patient_matcher.py [num_patients]    # latency / recall demo
+"""
+
+import heapq
+import re
+import sys
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from itertools import chain
+from math import log2
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# (m, u, partial m, partial u) per field: the probability that the field
+# agrees (fully / partially) for a true match (m) and for a random
+# non-matching pair (u). Surname and given-name u are replaced by the
+# value's frequency once the snapshot is large enough to estimate it.
+FIELD_PROBABILITIES = {
+    "family": (0.92, 0.01, 0.05, 0.02),        # partial: same Soundex
+    "given": (0.90, 0.02, 0.06, 0.05),         # partial: prefix or same Soundex
+    "birth_date": (0.95, 0.0005, 0.04, 0.003), # partial: one part off or D/M swap
+    "gender": (0.98, 0.5, 0.0, 0.0),
+    "postal_code": (0.85, 0.01, 0.07, 0.1),    # partial: same 3-digit prefix
+    "phone": (0.70, 0.0001, 0.0, 0.0),
+}
+
+# Snapshot size below which name frequencies are too noisy to use
+FREQUENCY_MIN_RECORDS = 1000
+
+# Classification thresholds on the total weight (log2 likelihood ratio)
+MATCH_WEIGHT = 15.0
+REVIEW_WEIGHT = 7.0
+
+# Prior odds that a blocked candidate pair is a true match; turns a
+# weight into a probability comparable with PatientSearchResult scores
+DEFAULT_PRIOR_ODDS = 1e-4
+
+
+def _field_weights(m: float, u: float, partial_m: float, partial_u: float) -> tuple:
+    """(agree, partial, disagree) weights for one field."""
+    partial = log2(partial_m / partial_u) if partial_m and partial_u else 0.0
+    return log2(m / u), partial, log2((1 - m - partial_m) / (1 - u - partial_u))
+
+
+WEIGHTS = {field: _field_weights(*p) for field, p in FIELD_PROBABILITIES.items()}
+
+_FAMILY_AGREE, _FAMILY_PARTIAL, _FAMILY_DISAGREE = WEIGHTS["family"]
+_GIVEN_AGREE, _GIVEN_PARTIAL, _GIVEN_DISAGREE = WEIGHTS["given"]
+_DOB_AGREE, _DOB_PARTIAL, _DOB_DISAGREE = WEIGHTS["birth_date"]
+_GENDER_AGREE, _, _GENDER_DISAGREE = WEIGHTS["gender"]
+_POSTAL_AGREE, _POSTAL_PARTIAL, _POSTAL_DISAGREE = WEIGHTS["postal_code"]
+_PHONE_AGREE, _, _PHONE_DISAGREE = WEIGHTS["phone"]
+
+_SOUNDEX_CODES = {letter: digit for digit, letters in (
+    ("1", "BFPV"), ("2", "CGJKQSXZ"), ("3", "DT"), ("4", "L"), ("5", "MN"), ("6", "R")
+) for letter in letters}
+_NOT_LETTER = re.compile(r"[^A-Z]")
+_NOT_DIGIT = re.compile(r"\D")
+
+
+class MatchRecord(NamedTuple):
+    """Normalized comparison tokens for one patient ('' when unknown)."""
+    patient_id: Optional[str]
+    family: str
+    family_code: str
+    given: str
+    given_code: str
+    birth_date: str
+    gender: str
+    postal_code: str
+    phone: str
+    other_given: Tuple[str, ...] = ()  # normalized given names after the first
+
+
+class MatchCandidate(NamedTuple):
+    """A scored candidate from PatientMatcher.top_k()."""
+    patient_id: str
+    weight: float
+    probability: float
+    status: str  # "match", "review" or "non-match"
+
+
+@lru_cache(maxsize=65536)
+def normalize_name(name: Optional[str]) -> str:
+    """Uppercase ASCII letters only: 'José-María' -> 'JOSEMARIA'."""
+    if not name:
+        return ""
+    ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    return _NOT_LETTER.sub("", ascii_name.upper())
+
+
+@lru_cache(maxsize=65536)
+def soundex(name: str) -> str:
+    """American Soundex code of a normalized name ('' for an empty name)."""
+    if not name:
+        return ""
+    code = name[0]
+    last = _SOUNDEX_CODES.get(name[0], "")
+    for letter in name[1:]:
+        digit = _SOUNDEX_CODES.get(letter, "")
+        if digit and digit != last:
+            code += digit
+            if len(code) == 4:
+                return code
+        if letter not in "HW":  # H and W do not separate equal codes
+            last = digit
+    return code.ljust(4, "0")
+
+
+def make_record(
+    patient_id: Optional[str],
+    family: Optional[str],
+    given: Union[str, Sequence[str], None],
+    birth_date=None,
+    gender: Optional[str] = None,
+    postal_code: Optional[str] = None,
+    phone: Optional[str] = None
+) -> MatchRecord:
+    """
+    Normalize raw demographics into a MatchRecord.
+
+    ``given`` may be one name or all given names in order (FHIR
+    HumanName.given). ``birth_date`` may be a date or an ISO string.
+    ``gender`` values of "unknown" are treated as missing.
+    """
+    family = normalize_name(family)
+    if given is None or isinstance(given, str):
+        given, other_given = normalize_name(given), ()
+    else:
+        names = [name for name in map(normalize_name, given) if name]
+        given, other_given = (names[0], tuple(names[1:])) if names else ("", ())
+    if birth_date and not isinstance(birth_date, str):
+        birth_date = birth_date.isoformat()
+    gender = (gender or "").lower()
+    # Interned: dates, postal codes and genders repeat across a snapshot
+    return MatchRecord(
+        patient_id, family, soundex(family), given, soundex(given),
+        sys.intern((birth_date or "")[:10]),
+        sys.intern("" if gender == "unknown" else gender),
+        sys.intern(_NOT_DIGIT.sub("", postal_code or "")[:5]),
+        _NOT_DIGIT.sub("", phone or "")[-10:],
+        other_given
+    )
+
+
+def record_from_fhir(patient: dict) -> MatchRecord:
+    """MatchRecord for a FHIR Patient resource (as a dict)."""
+    names = patient.get("name") or [{}]
+    name = next((n for n in names if n.get("use") == "official"), names[0])
+    address = (patient.get("address") or [{}])[0]
+    phone = next((t.get("value") for t in patient.get("telecom", [])
+                  if t.get("system") == "phone"), None)
+    return make_record(
+        patient.get("id"),
+        name.get("family"),
+        name.get("given"),
+        patient.get("birthDate"),
+        patient.get("gender"),
+        address.get("postalCode"),
+        phone
+    )
+
+
+def _dob_partial(a: str, b: str) -> bool:
+    """Birth dates differing in exactly one part, or with day/month swapped."""
+    year, month, day = a[:4] != b[:4], a[5:7] != b[5:7], a[8:10] != b[8:10]
+    return year + month + day == 1 or (
+        not year and a[5:7] == b[8:10] and a[8:10] == b[5:7]
+    )
+
+
+def _given_weight(a: str, a_code: str, b: str, b_code: str,
+                  given_weights: Optional[Dict[str, float]]) -> float:
+    """Weight of one pair of normalized given names."""
+    if a == b:
+        return (given_weights or {}).get(a, _GIVEN_AGREE)
+    if a_code == b_code or a.startswith(b) or b.startswith(a):
+        return _GIVEN_PARTIAL
+    return _GIVEN_DISAGREE
+
+
+def match_weight(
+    query: MatchRecord,
+    candidate: MatchRecord,
+    family_weights: Optional[Dict[str, float]] = None,
+    given_weights: Optional[Dict[str, float]] = None
+) -> float:
+    """
+    Fellegi-Sunter total weight (log2 likelihood ratio) of a pair.
+
+    Args:
+        query, candidate: Normalized records
+        family_weights, given_weights: Optional value-specific agreement
+            weights (PatientMatcher supplies frequency-based ones)
+    """
+    weight = 0.0
+    if query.family and candidate.family:
+        if query.family == candidate.family:
+            weight += (family_weights or {}).get(query.family, _FAMILY_AGREE)
+        elif query.family_code == candidate.family_code:
+            weight += _FAMILY_PARTIAL
+        else:
+            weight += _FAMILY_DISAGREE
+    if query.given and candidate.given:
+        if query.other_given or candidate.other_given:
+            # Best agreement over every pair of given names, so "Maria"
+            # matches a patient registered as "Ana Maria"
+            weight += max(
+                _given_weight(a, soundex(a), b, soundex(b), given_weights)
+                for a in (query.given, *query.other_given)
+                for b in (candidate.given, *candidate.other_given)
+            )
+        else:
+            weight += _given_weight(query.given, query.given_code,
+                                    candidate.given, candidate.given_code, given_weights)
+    if query.birth_date and candidate.birth_date:
+        if query.birth_date == candidate.birth_date:
+            weight += _DOB_AGREE
+        elif _dob_partial(query.birth_date, candidate.birth_date):
+            weight += _DOB_PARTIAL
+        else:
+            weight += _DOB_DISAGREE
+    if query.gender and candidate.gender:
+        weight += _GENDER_AGREE if query.gender == candidate.gender else _GENDER_DISAGREE
+    if query.postal_code and candidate.postal_code:
+        if query.postal_code == candidate.postal_code:
+            weight += _POSTAL_AGREE
+        elif query.postal_code[:3] == candidate.postal_code[:3]:
+            weight += _POSTAL_PARTIAL
+        else:
+            weight += _POSTAL_DISAGREE
+    if query.phone and candidate.phone:
+        weight += _PHONE_AGREE if query.phone == candidate.phone else _PHONE_DISAGREE
+    return weight
+
+
+def match_probability(weight: float, prior_odds: float = DEFAULT_PRIOR_ODDS) -> float:
+    """Posterior match probability for a total weight."""
+    if weight > 1000:
+        return 1.0
+    odds = prior_odds * 2.0 ** weight
+    return odds / (1 + odds)
+
+
+def classify(weight: float) -> str:
+    """Fellegi-Sunter decision: "match", "review" or "non-match"."""
+    if weight >= MATCH_WEIGHT:
+        return "match"
+    if weight >= REVIEW_WEIGHT:
+        return "review"
+    return "non-match"
+
+
+_NO_KEY = 0
+_BLOCKING_PASSES = 3
+
+
+def _blocking_keys(record: MatchRecord) -> tuple:
+    """Hash of each blocking key, or _NO_KEY where a part is missing."""
+    return (
+        hash((record.family_code, record.birth_date))
+        if record.family_code and record.birth_date else _NO_KEY,
+        hash((record.family_code, record.postal_code, 1))
+        if record.family_code and record.postal_code else _NO_KEY,
+        hash((record.birth_date, record.postal_code, 2))
+        if record.birth_date and record.postal_code else _NO_KEY,
+    )
+
+
+class PatientMatcher:
+    """
+    Blocking index plus Fellegi-Sunter scoring over a patient snapshot.
+
+    Records added after construction go into a small overflow index and
+    are searchable immediately; rebuild() folds them into the sorted
+    arrays and refreshes the name-frequency weights.
+
+    Args:
+        records: MatchRecord per patient (see make_record / record_from_fhir)
+        prior_odds: Prior match odds used for candidate probabilities
+    """
+
+    def __init__(self, records: Iterable[MatchRecord] = (),
+                 prior_odds: float = DEFAULT_PRIOR_ODDS):
+        self.records: List[MatchRecord] = list(records)
+        self.prior_odds = prior_odds
+        self.rebuild()
+
+    @classmethod
+    def from_fhir(cls, patients: Iterable[dict], **options) -> "PatientMatcher":
+        return cls((record_from_fhir(p) for p in patients), **options)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def rebuild(self):
+        """(Re)build the blocking arrays and frequency-based name weights."""
+        self._blocks = []
+        n = len(self.records)
+        hashes = np.fromiter(
+            chain.from_iterable(map(_blocking_keys, self.records)),
+            dtype=np.int64, count=n * _BLOCKING_PASSES
+        ).reshape(n, _BLOCKING_PASSES)
+        for position in range(_BLOCKING_PASSES):
+            keys = hashes[:, position]
+            rows = np.flatnonzero(keys != _NO_KEY)
+            order = rows[np.argsort(keys[rows], kind="stable")]
+            self._blocks.append((keys[order], order))
+        del hashes
+        self._overflow: Dict[int, List[int]] = {}
+
+        self.family_weights: Dict[str, float] = {}
+        self.given_weights: Dict[str, float] = {}
+        if n >= FREQUENCY_MIN_RECORDS:
+            for field, weights, (m, *_) in (
+                ("family", self.family_weights, FIELD_PROBABILITIES["family"]),
+                ("given", self.given_weights, FIELD_PROBABILITIES["given"]),
+            ):
+                counts = Counter(getattr(record, field) for record in self.records)
+                counts.pop("", None)
+                weights.update((value, log2(m * n / count)) for value, count in counts.items())
+
+    def add(self, record: MatchRecord):
+        """Add a newly registered patient without rebuilding the index."""
+        row = len(self.records)
+        self.records.append(record)
+        for key in _blocking_keys(record):
+            if key != _NO_KEY:
+                self._overflow.setdefault(key, []).append(row)
+
+    def candidates(self, query: MatchRecord) -> set:
+        """Rows sharing at least one blocking key with ``query``."""
+        rows = set()
+        for key, (keys, block_rows) in zip(_blocking_keys(query), self._blocks):
+            if key == _NO_KEY:
+                continue
+            start = keys.searchsorted(key)
+            stop = start
+            while stop < len(keys) and keys[stop] == key:
+                stop += 1
+            rows.update(block_rows[start:stop].tolist())
+            rows.update(self._overflow.get(key, ()))
+        return rows
+
+    def top_k(self, query: MatchRecord, k: int = 5,
+              min_weight: float = REVIEW_WEIGHT) -> List[MatchCandidate]:
+        """
+        Best ``k`` candidates for ``query`` with weight >= ``min_weight``.
+
+        Returns:
+            MatchCandidate list, highest weight first
+        """
+        records = self.records
+        family_weights, given_weights = self.family_weights, self.given_weights
+        scored = []
+        for row in self.candidates(query):
+            weight = match_weight(query, records[row], family_weights, given_weights)
+            if weight >= min_weight:
+                scored.append((weight, row))
+        return [
+            MatchCandidate(records[row].patient_id, weight,
+                           match_probability(weight, self.prior_odds), classify(weight))
+            for weight, row in heapq.nlargest(k, scored)
+        ]
+
+
+def _synthetic_records(count: int, seed: int = 0) -> List[MatchRecord]:
+    """Snapshot with a few thousand distinct surnames, as in a regional MPI."""
+    import random
+    from datetime import date, timedelta
+
+    rng = random.Random(seed)
+    stems = ["GAR", "ROD", "MAR", "HER", "LOP", "GON", "WIL", "AND", "THO", "TAY",
+             "JOH", "SMI", "BRO", "DAV", "MIL", "MOO", "JAC", "WHI", "HAR", "CLA",
+             "LEW", "ROB", "WAL", "YOU", "ALL", "KIN", "WRI", "SCO", "TOR", "NGU",
+             "HIL", "FLO", "GRE", "ADA", "NEL", "BAK", "HAL", "RIV", "CAM", "MIT"]
+    endings = ["CIA", "RIGUEZ", "TINEZ", "NANDEZ", "EZ", "ZALEZ", "SON", "ERSON",
+               "MAS", "LOR", "TH", "WN", "IS", "LER", "RE", "KSON", "TE", "RIS",
+               "RK", "IS", "INS", "KER", "NG", "GHT", "TT", "RES", "YEN", "L", "ES",
+               "EN", "AMS", "SON", "ER", "L", "ERA", "PBELL", "CHELL", "OWSKI", "ANO", "ETTI"]
+    surnames = [stem + ending for stem in stems for ending in endings]
+    given = ["MARIA", "JAMES", "ROBERT", "JENNIFER", "LINDA", "MICHAEL", "DAVID",
+             "ELIZABETH", "JOSE", "SUSAN", "CARLOS", "ANA", "THOMAS", "SARAH",
+             "KAREN", "LUIS", "NANCY", "DANIEL", "ROSA", "JOHN", "LISA", "PAUL",
+             "EMILY", "KEVIN", "LAURA", "BRIAN", "AMY", "JASON", "ANNA", "ERIC"]
+    start = date(1930, 1, 1)
+    records = []
+    for i in range(count):
+        records.append(make_record(
+            f"pat-{i}",
+            rng.choice(surnames),
+            rng.choice(given),
+            start + timedelta(days=rng.randrange(365 * 90)),
+            rng.choice(("female", "male")),
+            f"6{rng.randrange(3000):04d}",
+            f"217555{rng.randrange(10000):04d}" if rng.random() < 0.6 else None,
+        ))
+    return records
+
+
+def _perturb(record: MatchRecord, rng) -> MatchRecord:
+    """A registration-desk version of a known patient: typo, swap, omission."""
+    family, given, dob = record.family, record.given, record.birth_date
+    change = rng.randrange(5)
+    if change == 0 and len(family) > 3:   # typo in surname
+        i = rng.randrange(1, len(family))
+        family = family[:i] + rng.choice("AEIOURSTLN") + family[i + 1:]
+    elif change == 1 and int(dob[8:10]) <= 12:  # day and month swapped
+        dob = f"{dob[:4]}-{dob[8:10]}-{dob[5:7]}"
+    elif change == 2:  # married-name change
+        family = "NEWNAME"
+    elif change == 3:  # nickname / initial only
+        given = given[0]
+    return make_record(None, family, given, dob, record.gender, record.postal_code,
+                       record.phone if rng.random() < 0.5 else None)
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    start = time.perf_counter()
+    records = _synthetic_records(count)
+    matcher = PatientMatcher(records)
+    build_seconds = time.perf_counter() - start
+
+    rng = random.Random(1)
+    targets = rng.sample(range(count), 2000)
+    latencies, found, candidate_counts = [], 0, 0
+    for row in targets:
+        query = _perturb(records[row], rng)
+        begin = time.perf_counter()
+        top = matcher.top_k(query, k=5)
+        latencies.append(time.perf_counter() - begin)
+        found += any(c.patient_id == records[row].patient_id for c in top)
+        candidate_counts += len(matcher.candidates(query))
+    latencies.sort()
+
+    print("=" * 60)
+    print(f"Patient matcher: {count:,} patients, {len(targets):,} perturbed queries")
+    print("=" * 60)
+    print(f"Snapshot + index build: {build_seconds:.1f}s")
+    print(f"Candidates per query:   {candidate_counts / len(targets):.1f}")
+    print(f"Top-5 recall:           {found / len(targets):.1%}")
+    print(f"Latency p50 / p99:      {latencies[len(latencies) // 2] * 1e3:.3f} ms / "
+          f"{latencies[int(len(latencies) * 0.99)] * 1e3:.3f} ms")
+
+    maria = make_record(None, "Rodríguez", "Maria", "1979-03-15", "female", "62701")
+    matcher.add(make_record("maria-rodriguez", "Rodriguez", "Maria", "1979-03-15",
+                            "female", "62701", "217-555-1234"))
+    print(f"Maria Rodriguez lookup: {matcher.top_k(maria, k=1)}")
+    ana_maria = record_from_fhir({
+        "id": "ana-maria-rodriguez", "name": [{"family": "Rodriguez", "given": ["Ana", "Maria"]}],
+        "birthDate": "1979-03-15", "gender": "female"})
+    print(f"Maria vs Ana Maria:     {match_weight(maria, ana_maria):+.2f} "
+          f"(first given name only: "
+          f"{match_weight(maria, ana_maria._replace(other_given=())):+.2f})")
+    print("=" * 60)
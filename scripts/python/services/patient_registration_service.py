@@ -9,8 +9,11 @@ Textbook Section: 1.5 Python Implementation
 This module handles patient registration operations including:
 - Patient search and matching
 - New patient creation
-- Insurance eligibility verification
+- Transaction-bundle registration (Patient + Coverage + Encounter in
+  one round trip) and bulk onboarding
+- Insurance eligibility verification (cached, see eligibility_cache)
 - Encounter initialization
+- Tuned HTTP client and per-endpoint latency metrics (see fhir_client)
 
 Prerequisites:
     pip install httpx pydantic fhir.resources
@@ -19,27 +22,103 @@ Usage:
     python patient_registration_service.py
 """
 
+import asyncio
+import heapq
+import json
+import random
+import time
+import uuid
 from datetime import date, datetime
-from typing import Optional, List
+from typing import (
+    AsyncIterator, Awaitable, Callable, Dict, Iterable, NamedTuple, Optional, List, Union
+)
+from urllib.parse import urljoin
 from pydantic import BaseModel, Field
 import httpx
+from fhir.resources.bundle import Bundle
 from fhir.resources.patient import Patient
 from fhir.resources.coverage import Coverage
 from fhir.resources.encounter import Encounter
 
+from eligibility_cache import EligibilityCache
+from fhir_client import LatencyMetrics, create_fhir_client
+from patient_matcher import (
+    MatchRecord, make_record, match_probability, match_weight, record_from_fhir
+)
+
 # Configuration
 FHIR_SERVER_URL = "https://fhir.communityhealthclinic.org/fhir"
 
+# match_score at which a search result is taken to be the patient
+AUTO_LINK_THRESHOLD = 0.85
+
+# Entries requested per searchset page (_count)
+SEARCH_PAGE_SIZE = 50
+
+# Bulk search defaults (see RegistrationService.search_patients_bulk)
+BULK_SEARCH_CONCURRENCY = 16
+BULK_SEARCH_TIMEOUT = 10.0     # seconds per request
+BULK_SEARCH_RETRIES = 3
+BULK_SEARCH_BACKOFF = 0.25     # seconds, doubled per retry
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUS = {429, 502, 503, 504}
+
+# Registrations per transaction Bundle in bulk onboarding
+TRANSACTION_BATCH_SIZE = 100
+
+FHIR_JSON = "application/fhir+json"
+
+# How created resources are sent and returned (see RegistrationService):
+# strict  - payloads and responses validated with fhir.resources models
+# lazy    - template-built JSON; responses parsed on first use past id/meta
+# minimal - as lazy, but the server is asked for Prefer: return=minimal
+#           and only the id and version come back (ResourceRef)
+VALIDATE_STRICT = "strict"
+VALIDATE_LAZY = "lazy"
+VALIDATE_MINIMAL = "minimal"
+VALIDATION_MODES = (VALIDATE_STRICT, VALIDATE_LAZY, VALIDATE_MINIMAL)
+
+# Fixed parts of the registration payloads, shared by every request
+MEDICAID_SYSTEM = "http://illinois.gov/medicaid"
+_MEDICAID_TYPE = {
+    "coding": [{
+        "system": "http://terminology.hl7.org/CodeSystem/v3-ActCode",
+        "code": "SUBSIDMC"
+    }]
+}
+_MEDICAID_PAYOR = [{"display": "Illinois Medicaid"}]
+_AMBULATORY_CLASS = {
+    "system": "http://terminology.hl7.org/CodeSystem/v3-ActCode",
+    "code": "AMB",
+    "display": "ambulatory"
+}
+_ATTENDER_TYPE = [{
+    "coding": [{
+        "system": "http://terminology.hl7.org/CodeSystem/v3-ParticipationType",
+        "code": "ATND"
+    }]
+}]
+
+_RESOURCE_CLASSES = {"Patient": Patient, "Coverage": Coverage, "Encounter": Encounter}
+
+
+def _validation_mode(mode: str) -> str:
+    """``mode`` if it is one of VALIDATION_MODES, else ValueError."""
+    if mode not in VALIDATION_MODES:
+        raise ValueError(f"validation must be one of {VALIDATION_MODES}, not {mode!r}")
+    return mode
+
 
 class PatientDemographics(BaseModel):
     """Demographics input for patient registration."""
     first_name: str = Field(..., min_length=1, max_length=100)
     last_name: str = Field(..., min_length=1, max_length=100)
     date_of_birth: date
-    gender: str = Field(..., pattern="^(male|female|other|unknown)$")
+    gender: str = Field(..., regex="^(male|female|other|unknown)$")
     address_line: Optional[str] = None
     city: Optional[str] = None
-    state: Optional[str] = Field(None, pattern="^[A-Z]{2}$")
+    state: Optional[str] = Field(None, regex="^[A-Z]{2}$")
     postal_code: Optional[str] = None
     phone_home: Optional[str] = None
     phone_work: Optional[str] = None
@@ -55,6 +134,102 @@ class PatientSearchResult(BaseModel):
     match_score: float = Field(..., ge=0, le=1)
 
 
+class PatientSearchQuery(BaseModel):
+    """One demographics record to look up in a bulk search."""
+    last_name: str
+    date_of_birth: date
+    first_name: Optional[str] = None
+
+
+class BulkSearchResult(BaseModel):
+    """Outcome of one query in a bulk search."""
+    index: int
+    query: PatientSearchQuery
+    matches: List[PatientSearchResult] = []
+    error: Optional[str] = None
+    attempts: int = 1
+
+
+class RegistrationRequest(BaseModel):
+    """One registration for a transaction Bundle, optionally with a visit."""
+    demographics: PatientDemographics
+    provider_id: Optional[str] = None
+    reason: Optional[str] = None
+
+
+class ResourceRef(NamedTuple):
+    """Identity of a created resource (VALIDATE_MINIMAL responses)."""
+    resource_type: str
+    id: str
+    version_id: Optional[str] = None
+
+
+class LazyResource:
+    """
+    A created resource as returned by the server, validated on demand
+    (VALIDATE_LAZY responses).
+
+    ``id``, ``meta`` and ``resource_type`` are read from the JSON; any
+    other attribute parses the full fhir.resources model once, so
+    callers that only need the id skip validation entirely.
+    """
+
+    __slots__ = ("raw", "_model")
+
+    def __init__(self, raw: dict):
+        self.raw = raw
+        self._model = None
+
+    @property
+    def resource_type(self) -> str:
+        return self.raw["resourceType"]
+
+    @property
+    def id(self) -> Optional[str]:
+        return self.raw.get("id")
+
+    @property
+    def meta(self) -> dict:
+        return self.raw.get("meta", {})
+
+    def model(self):
+        """The fully validated fhir.resources model."""
+        if self._model is None:
+            self._model = _RESOURCE_CLASSES[self.resource_type].parse_obj(self.raw)
+        return self._model
+
+    def __repr__(self) -> str:
+        return f"LazyResource({self.resource_type}/{self.id})"
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.model(), name)
+
+
+def _resource_ref(location: str, resource: Optional[dict] = None) -> ResourceRef:
+    """ResourceRef from a returned resource, else a Location such as
+    Patient/123/_history/1 (relative or absolute)."""
+    if resource and resource.get("id"):
+        return ResourceRef(resource["resourceType"], resource["id"],
+                           resource.get("meta", {}).get("versionId"))
+    path, _, version = location.partition("/_history/")
+    parts = path.rstrip("/").split("/")
+    if len(parts) < 2 or not parts[-1]:
+        raise ValueError(f"Cannot identify created resource from {location!r}")
+    return ResourceRef(parts[-2], parts[-1], version.strip("/") or None)
+
+
+class RegistrationResult(BaseModel):
+    """Resources created by one registration in a transaction Bundle."""
+    patient: Union[Patient, LazyResource, ResourceRef]
+    coverage: Optional[Union[Coverage, LazyResource, ResourceRef]] = None
+    encounter: Optional[Union[Encounter, LazyResource, ResourceRef]] = None
+
+    class Config:
+        arbitrary_types_allowed = True
+
+
 class RegistrationService:
     """
     Handles patient registration workflow.
@@ -64,128 +239,497 @@ class RegistrationService:
     2. New patient creation
     3. Insurance eligibility verification
     4. Encounter initialization
+
+    ``validation`` (one of VALIDATION_MODES) sets how created resources
+    are sent and returned; the registration methods accept it per call
+    too. The default, strict, validates everything with the
+    fhir.resources models. lazy and minimal skip that work on the hot
+    path (searches then also skip re-validating their result models).
+
+    Without ``fhir_client`` the service creates (and closes, on
+    aclose() or leaving ``async with``) a tuned client from
+    create_fhir_client(**client_options); passing both a client and
+    client options is a ValueError. Every request's latency is recorded
+    per endpoint in ``metrics``.
     """
 
-    def __init__(self, fhir_client: httpx.AsyncClient):
-        self.client = fhir_client
-        self.base_url = FHIR_SERVER_URL
+    def __init__(self, fhir_client: Optional[httpx.AsyncClient] = None,
+                 base_url: str = FHIR_SERVER_URL,
+                 eligibility_cache: Optional[EligibilityCache] = None,
+                 validation: str = VALIDATE_STRICT,
+                 metrics: Optional[LatencyMetrics] = None,
+                 **client_options):
+        if fhir_client is not None and client_options:
+            raise ValueError(
+                f"client options {sorted(client_options)} only apply when the "
+                "service creates its own client; configure fhir_client instead"
+            )
+        self._owns_client = fhir_client is None
+        self.client = fhir_client or create_fhir_client(**client_options)
+        self.base_url = base_url
+        self.metrics = metrics or LatencyMetrics()
+        # Share one cache across service instances to share its entries
+        self.eligibility_cache = eligibility_cache or EligibilityCache()
+        self.validation = _validation_mode(validation)
+
+    async def __aenter__(self) -> "RegistrationService":
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        """Close the HTTP client if the service created it."""
+        if self._owns_client:
+            await self.client.aclose()
+
+    async def _request(self, endpoint: str, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request, recording its latency under ``endpoint``."""
+        start = time.perf_counter()
+        failed = True
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            failed = response.is_error
+            return response
+        finally:
+            self.metrics.record(endpoint, time.perf_counter() - start, failed)
 
     async def search_patient(
         self,
         last_name: str,
         date_of_birth: date,
-        first_name: Optional[str] = None
+        first_name: Optional[str] = None,
+        k: Optional[int] = None,
+        stop_at: Optional[float] = None,
+        page_size: Optional[int] = SEARCH_PAGE_SIZE,
+        max_pages: Optional[int] = None
     ) -> List[PatientSearchResult]:
         """
         Search for existing patient in MPI.
 
+        Follows the searchset's ``next`` links, scoring each page as it
+        arrives and keeping only the ``k`` best matches in a heap.
+
         Args:
             last_name: Patient's family name
             date_of_birth: Patient's birth date
             first_name: Optional given name for narrower search
+            k: Return at most this many matches (None for all)
+            stop_at: Stop fetching pages once a match scores at least
+                this much (e.g. AUTO_LINK_THRESHOLD)
+            page_size: Entries per page requested from the server
+            max_pages: Stop after this many pages
 
         Returns:
-            List of potential matches with confidence scores
+            List of potential matches with confidence scores, best first
         """
+        return await self._best_matches(
+            self._search_pages(last_name, date_of_birth, first_name, page_size, max_pages),
+            k, stop_at
+        )
+
+    @staticmethod
+    async def _best_matches(
+        pages: AsyncIterator[List[PatientSearchResult]],
+        k: Optional[int],
+        stop_at: Optional[float]
+    ) -> List[PatientSearchResult]:
+        """The ``k`` best results of a page stream, best first (see search_patient)."""
+        best = []  # min-heap of (score, -arrival, result)
+        arrival = 0
+        async for page in pages:
+            for result in page:
+                arrival += 1
+                item = (result.match_score, -arrival, result)
+                if k is None or len(best) < k:
+                    heapq.heappush(best, item)
+                elif item > best[0]:
+                    heapq.heapreplace(best, item)
+            if stop_at is not None and best and max(best)[0] >= stop_at:
+                break
+
+        return [result for _, _, result in sorted(best, reverse=True)]
+
+    async def iter_patient_search(
+        self,
+        last_name: str,
+        date_of_birth: date,
+        first_name: Optional[str] = None,
+        page_size: Optional[int] = SEARCH_PAGE_SIZE,
+        max_pages: Optional[int] = None
+    ) -> AsyncIterator[PatientSearchResult]:
+        """
+        Yield scored matches page by page, in server order.
+
+        The next page is only requested once the consumer has taken the
+        current one, so breaking out of the loop (e.g. at the first
+        result above AUTO_LINK_THRESHOLD) skips the remaining pages.
+        """
+        async for page in self._search_pages(
+            last_name, date_of_birth, first_name, page_size, max_pages
+        ):
+            for result in page:
+                yield result
+
+    async def _search_pages(
+        self,
+        last_name: str,
+        date_of_birth: date,
+        first_name: Optional[str],
+        page_size: Optional[int],
+        max_pages: Optional[int],
+        get: Optional[Callable[[str, Optional[dict]], Awaitable[httpx.Response]]] = None
+    ) -> AsyncIterator[List[PatientSearchResult]]:
+        """
+        Scored results of each searchset page, following ``next`` links.
+
+        ``get(url, params)`` fetches one page (default: a single GET that
+        raises for error statuses).
+        """
+        query = make_record(None, last_name, first_name, date_of_birth)
+        url = f"{self.base_url}/Patient"
+        params = self._search_params(last_name, date_of_birth, first_name)
+        if page_size:
+            params["_count"] = page_size
+        get = get or self._get_page
+        pages = 0
+
+        while url:
+            bundle = (await get(url, params)).json()
+            yield list(self._score_entries(bundle.get("entry", []), query))
+
+            pages += 1
+            if max_pages is not None and pages >= max_pages:
+                return
+            url = self._next_link(bundle)
+            params = None  # the next link carries the query
+
+    async def _get_page(self, url: str, params: Optional[dict]) -> httpx.Response:
+        response = await self._request("search Patient", "GET", url, params=params)
+        response.raise_for_status()
+        return response
+
+    def _next_link(self, bundle: dict) -> Optional[str]:
+        """Absolute URL of a Bundle's ``next`` page, if any."""
+        for link in bundle.get("link", []):
+            if link.get("relation") == "next" and link.get("url"):
+                return urljoin(f"{self.base_url}/", link["url"])
+        return None
+
+    async def search_patients_bulk(
+        self,
+        queries: Iterable[PatientSearchQuery],
+        k: Optional[int] = None,
+        stop_at: Optional[float] = None,
+        page_size: Optional[int] = SEARCH_PAGE_SIZE,
+        max_pages: Optional[int] = None,
+        concurrency: int = BULK_SEARCH_CONCURRENCY,
+        timeout: float = BULK_SEARCH_TIMEOUT,
+        retries: int = BULK_SEARCH_RETRIES,
+        backoff: float = BULK_SEARCH_BACKOFF
+    ) -> AsyncIterator[BulkSearchResult]:
+        """
+        Run many patient searches concurrently on the shared client.
+
+        At most ``concurrency`` requests are in flight; queries are drawn
+        from ``queries`` lazily, so it can be a generator over a large
+        reconciliation file. Results are yielded as each search
+        completes (not in input order; use ``index`` to correlate).
+
+        Each query is paged and bounded exactly like search_patient().
+        Timeouts, connection errors and 429/5xx responses are retried up
+        to ``retries`` times per page with exponential backoff and jitter
+        (honouring Retry-After). A query that still fails, or whose
+        results cannot be read (e.g. a Patient without a name), is
+        yielded with ``error`` set instead of aborting the whole run.
+
+        Args:
+            queries: PatientSearchQuery records
+            k, stop_at, page_size, max_pages: As for search_patient()
+            concurrency: Maximum simultaneous requests
+            timeout: Per-request timeout in seconds
+            retries: Retries per query after the first attempt
+            backoff: Initial backoff in seconds (doubles per retry)
+
+        Yields:
+            BulkSearchResult per query, in completion order
+        """
+        pending = enumerate(queries)
+        make_result = BulkSearchResult if self.validation == VALIDATE_STRICT \
+            else BulkSearchResult.construct
+        # Bounded, so a slow consumer pauses the workers instead of
+        # letting finished results pile up in memory
+        results: asyncio.Queue = asyncio.Queue(maxsize=2 * max(1, concurrency))
+
+        async def worker():
+            for index, query in pending:
+                attempts = 0
+
+                async def get(url: str, params: Optional[dict]) -> httpx.Response:
+                    nonlocal attempts
+                    try:
+                        response, tries = await self._get_with_retry(
+                            url, params, timeout, retries, backoff
+                        )
+                    except _RequestFailed as failure:
+                        failure.attempts += attempts
+                        raise
+                    attempts += tries
+                    return response
+
+                try:
+                    matches = await self._best_matches(
+                        self._search_pages(
+                            query.last_name, query.date_of_birth, query.first_name,
+                            page_size, max_pages, get
+                        ),
+                        k, stop_at
+                    )
+                    await results.put(make_result(
+                        index=index, query=query, matches=matches,
+                        attempts=attempts
+                    ))
+                except _RequestFailed as failure:
+                    await results.put(make_result(
+                        index=index, query=query, error=str(failure.error),
+                        attempts=failure.attempts
+                    ))
+                except Exception as error:
+                    # e.g. a Patient the result models reject; only this
+                    # query fails, the others keep running
+                    await results.put(make_result(
+                        index=index, query=query,
+                        error=f"{type(error).__name__}: {error}", attempts=attempts
+                    ))
+
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+        done = asyncio.gather(*workers)
+        try:
+            while True:
+                getter = asyncio.ensure_future(results.get())
+                await asyncio.wait({getter, done}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                    continue
+                getter.cancel()
+                while not results.empty():
+                    yield results.get_nowait()
+                await done  # re-raise unexpected worker errors
+                return
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _get_with_retry(
+        self,
+        url: str,
+        params: Optional[dict],
+        timeout: float,
+        retries: int,
+        backoff: float
+    ):
+        """GET with retries; returns (response, attempts) or raises _RequestFailed."""
+        for attempt in range(retries + 1):
+            delay = backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+            try:
+                response = await self._request(
+                    "search Patient", "GET", url, params=params, timeout=timeout
+                )
+                if response.status_code not in RETRYABLE_STATUS:
+                    response.raise_for_status()
+                    return response, attempt + 1
+                error = httpx.HTTPStatusError(
+                    f"{response.status_code} from {url}",
+                    request=response.request, response=response
+                )
+                retry_after = response.headers.get("Retry-After", "")
+                if retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+            except (httpx.TimeoutException, httpx.TransportError) as exc:
+                error = exc
+            except httpx.HTTPStatusError as exc:
+                raise _RequestFailed(exc, attempt + 1)
+            if attempt < retries:
+                await asyncio.sleep(delay)
+        raise _RequestFailed(error, retries + 1)
+
+    @staticmethod
+    def _search_params(
+        last_name: str,
+        date_of_birth: date,
+        first_name: Optional[str]
+    ) -> dict:
+        """FHIR Patient search parameters for a demographics lookup."""
         params = {
             "family": last_name,
             "birthdate": date_of_birth.isoformat()
         }
         if first_name:
             params["given"] = first_name
+        return params
 
-        response = await self.client.get(
-            f"{self.base_url}/Patient",
-            params=params
-        )
-        response.raise_for_status()
-
-        bundle = response.json()
-        results = []
+    def _score_entries(
+        self,
+        entries: List[dict],
+        query: MatchRecord
+    ) -> Iterable[PatientSearchResult]:
+        """PatientSearchResult per Patient entry (skipping included/outcome entries)."""
+        # Every field is computed here, so only strict mode re-validates
+        make_result = PatientSearchResult if self.validation == VALIDATE_STRICT \
+            else PatientSearchResult.construct
 
-        for entry in bundle.get("entry", []):
-            patient = entry["resource"]
+        for entry in entries:
+            patient = entry.get("resource", {})
+            if patient.get("resourceType") != "Patient":
+                continue
             # Calculate match score based on field matching
-            score = self._calculate_match_score(
-                patient, last_name, date_of_birth, first_name
-            )
+            score = self._calculate_match_score(patient, query)
 
-            results.append(PatientSearchResult(
+            yield make_result(
                 patient_id=patient["id"],
                 name=self._format_name(patient["name"][0]),
                 date_of_birth=date.fromisoformat(patient["birthDate"]),
                 mrn=self._extract_mrn(patient),
                 match_score=score
-            ))
-
-        return sorted(results, key=lambda x: x.match_score, reverse=True)
+            )
 
     async def register_patient(
         self,
-        demographics: PatientDemographics
-    ) -> Patient:
+        demographics: PatientDemographics,
+        validation: Optional[str] = None
+    ) -> Union[Patient, LazyResource, ResourceRef]:
         """
         Register a new patient in the EHR.
 
         Args:
             demographics: Patient demographic information
+            validation: Override the service's validation mode
 
         Returns:
-            Created FHIR Patient resource
+            Created FHIR Patient resource (a LazyResource or ResourceRef
+            in lazy / minimal mode)
         """
-        patient = Patient(
-            name=[{
+        mode = self._mode(validation)
+        created_patient = await self._create(self._patient_payload(demographics), mode)
+
+        # If Medicaid ID provided, create coverage resource
+        if demographics.medicaid_id:
+            await self._create_medicaid_coverage(
+                created_patient.id,
+                demographics.medicaid_id,
+                mode
+            )
+
+        return created_patient
+
+    async def register_patient_transaction(
+        self,
+        demographics: PatientDemographics,
+        provider_id: Optional[str] = None,
+        reason: Optional[str] = None,
+        validation: Optional[str] = None
+    ) -> RegistrationResult:
+        """
+        Register a patient in a single FHIR transaction.
+
+        Patient, Medicaid Coverage (if ``medicaid_id`` is set) and, when
+        ``provider_id`` is given, the visit Encounter are submitted as
+        one transaction Bundle, replacing the register_patient() ->
+        _create_medicaid_coverage() -> create_encounter() chain of three
+        sequential round trips. The server creates all or none of them.
+
+        Args:
+            demographics: Patient demographic information
+            provider_id: FHIR Practitioner resource ID for the encounter
+            reason: Chief complaint or reason for visit
+            validation: Override the service's validation mode
+
+        Returns:
+            The created Patient, Coverage and Encounter resources
+        """
+        request = RegistrationRequest(
+            demographics=demographics, provider_id=provider_id, reason=reason
+        )
+        return (await self._submit_registrations([request], self._mode(validation)))[0]
+
+    async def register_patients_bulk(
+        self,
+        requests: Iterable[RegistrationRequest],
+        batch_size: int = TRANSACTION_BATCH_SIZE,
+        validation: Optional[str] = None
+    ) -> List[RegistrationResult]:
+        """
+        Onboard many patients (e.g. an acquired clinic's panel) with one
+        transaction Bundle per ``batch_size`` registrations.
+
+        Each Bundle is atomic: if the server rejects it, the error is
+        raised and none of that batch's resources exist, while earlier
+        batches stay committed. Smaller batches bound the work lost to
+        one bad record; larger ones save round trips.
+
+        Args:
+            requests: RegistrationRequest records
+            batch_size: Registrations per transaction Bundle
+            validation: Override the service's validation mode
+
+        Returns:
+            RegistrationResult per request, in input order
+        """
+        mode = self._mode(validation)
+        results = []
+        batch = []
+        for request in requests:
+            batch.append(request)
+            if len(batch) == batch_size:
+                results.extend(await self._submit_registrations(batch, mode))
+                batch = []
+        if batch:
+            results.extend(await self._submit_registrations(batch, mode))
+        return results
+
+    def _patient_payload(self, demographics: PatientDemographics) -> dict:
+        """FHIR Patient JSON for a new registration."""
+        patient = {
+            "resourceType": "Patient",
+            "name": [{
                 "use": "official",
                 "family": demographics.last_name,
                 "given": [demographics.first_name]
             }],
-            birthDate=demographics.date_of_birth.isoformat(),
-            gender=demographics.gender,
-            telecom=[],
-            address=[]
-        )
+            "gender": demographics.gender,
+            "birthDate": demographics.date_of_birth.isoformat()
+        }
 
         # Add phone numbers if provided
+        telecom = []
         if demographics.phone_home:
-            patient.telecom.append({
+            telecom.append({
                 "system": "phone",
                 "value": demographics.phone_home,
                 "use": "home"
             })
         if demographics.phone_work:
-            patient.telecom.append({
+            telecom.append({
                 "system": "phone",
                 "value": demographics.phone_work,
                 "use": "work"
             })
+        if telecom:
+            patient["telecom"] = telecom
 
         # Add address if provided
         if demographics.address_line:
-            patient.address.append({
+            address = {
                 "use": "home",
                 "line": [demographics.address_line],
                 "city": demographics.city,
                 "state": demographics.state,
                 "postalCode": demographics.postal_code
-            })
-
-        # Create patient in FHIR server
-        response = await self.client.post(
-            f"{self.base_url}/Patient",
-            json=patient.dict(exclude_none=True)
-        )
-        response.raise_for_status()
-
-        created_patient = Patient.parse_obj(response.json())
-
-        # If Medicaid ID provided, create coverage resource
-        if demographics.medicaid_id:
-            await self._create_medicaid_coverage(
-                created_patient.id,
-                demographics.medicaid_id
-            )
+            }
+            patient["address"] = [{k: v for k, v in address.items() if v is not None}]
 
-        return created_patient
+        return patient
 
     async def verify_eligibility(
         self,
@@ -195,6 +739,9 @@ class RegistrationService:
         """
         Verify Medicaid eligibility via X12 270/271.
 
+        Responses are cached per member and service date, and
+        concurrent checks for the same member share one request.
+
         Args:
             medicaid_id: Patient's Medicaid identifier
             service_date: Date of service for eligibility check
@@ -202,6 +749,18 @@ class RegistrationService:
         Returns:
             Eligibility response with coverage details
         """
+        response = await self.eligibility_cache.get(
+            medicaid_id, service_date,
+            lambda: self._query_clearinghouse(medicaid_id, service_date)
+        )
+        return dict(response)
+
+    async def _query_clearinghouse(
+        self,
+        medicaid_id: str,
+        service_date: date
+    ) -> dict:
+        """Uncached X12 270/271 eligibility request."""
         # In production, this would call an eligibility clearinghouse
         # For demonstration, a simulated response is returned
         return {
@@ -217,8 +776,9 @@ class RegistrationService:
         self,
         patient_id: str,
         provider_id: str,
-        reason: str
-    ) -> Encounter:
+        reason: str,
+        validation: Optional[str] = None
+    ) -> Union[Encounter, LazyResource, ResourceRef]:
         """
         Initialize an encounter for the patient visit.
 
@@ -226,71 +786,47 @@ class RegistrationService:
             patient_id: FHIR Patient resource ID
             provider_id: FHIR Practitioner resource ID
             reason: Chief complaint or reason for visit
+            validation: Override the service's validation mode
 
         Returns:
-            Created FHIR Encounter resource
+            Created FHIR Encounter resource (a LazyResource or
+            ResourceRef in lazy / minimal mode)
         """
-        encounter = Encounter(
-            status="arrived",
-            class_fhir={
-                "system": "http://terminology.hl7.org/CodeSystem/v3-ActCode",
-                "code": "AMB",
-                "display": "ambulatory"
-            },
-            subject={"reference": f"Patient/{patient_id}"},
-            participant=[{
-                "type": [{
-                    "coding": [{
-                        "system": "http://terminology.hl7.org/CodeSystem/v3-ParticipationType",
-                        "code": "ATND"
-                    }]
-                }],
-                "individual": {"reference": f"Practitioner/{provider_id}"}
-            }],
-            period={"start": datetime.now().isoformat()},
-            reasonCode=[{"text": reason}]
+        return await self._create(
+            self._encounter_payload(f"Patient/{patient_id}", provider_id, reason),
+            self._mode(validation)
         )
 
-        response = await self.client.post(
-            f"{self.base_url}/Encounter",
-            json=encounter.dict(exclude_none=True)
-        )
-        response.raise_for_status()
-
-        return Encounter.parse_obj(response.json())
-
-    def _calculate_match_score(
+    def _encounter_payload(
         self,
-        patient: dict,
-        last_name: str,
-        dob: date,
-        first_name: Optional[str]
-    ) -> float:
-        """Calculate probabilistic match score."""
-        score = 0.0
-
-        # Name matching (40% weight)
-        patient_name = patient["name"][0]
-        if patient_name.get("family", "").lower() == last_name.lower():
-            score += 0.25
-        if first_name and first_name.lower() in [
-            n.lower() for n in patient_name.get("given", [])
-        ]:
-            score += 0.15
-
-        # DOB matching (40% weight)
-        if patient["birthDate"] == dob.isoformat():
-            score += 0.40
-
-        # Gender consistency (10% weight)
-        if patient.get("gender"):
-            score += 0.10
+        patient_reference: str,
+        provider_id: str,
+        reason: Optional[str]
+    ) -> dict:
+        """FHIR Encounter JSON for an arriving ambulatory visit."""
+        encounter = {
+            "resourceType": "Encounter",
+            "status": "arrived",
+            "class": _AMBULATORY_CLASS,
+            "subject": {"reference": patient_reference},
+            "participant": [{
+                "type": _ATTENDER_TYPE,
+                "individual": {"reference": f"Practitioner/{provider_id}"}
+            }],
+            "period": {"start": datetime.now().astimezone().isoformat()}
+        }
+        if reason:
+            encounter["reasonCode"] = [{"text": reason}]
+        return encounter
 
-        # Has identifiers (10% weight)
-        if patient.get("identifier"):
-            score += 0.10
+    def _calculate_match_score(self, patient: dict, query: MatchRecord) -> float:
+        """
+        Probabilistic match score (Fellegi-Sunter, see patient_matcher).
 
-        return min(score, 1.0)
+        Only fields present on both sides count, so a candidate gains
+        nothing for merely having a gender or identifier.
+        """
+        return match_probability(match_weight(query, record_from_fhir(patient)))
 
     def _format_name(self, name: dict) -> str:
         """Format FHIR HumanName to display string."""
@@ -308,49 +844,182 @@ class RegistrationService:
     async def _create_medicaid_coverage(
         self,
         patient_id: str,
-        medicaid_id: str
-    ) -> Coverage:
+        medicaid_id: str,
+        validation: Optional[str] = None
+    ) -> Union[Coverage, LazyResource, ResourceRef]:
         """Create Coverage resource for Medicaid enrollment."""
-        coverage = Coverage(
-            status="active",
-            type={
-                "coding": [{
-                    "system": "http://terminology.hl7.org/CodeSystem/v3-ActCode",
-                    "code": "SUBSIDMC"
-                }]
-            },
-            subscriber={"reference": f"Patient/{patient_id}"},
-            beneficiary={"reference": f"Patient/{patient_id}"},
-            payor=[{"display": "Illinois Medicaid"}],
-            identifier=[{
-                "system": "http://illinois.gov/medicaid",
-                "value": medicaid_id
-            }]
+        return await self._create(
+            self._coverage_payload(f"Patient/{patient_id}", medicaid_id),
+            self._mode(validation)
+        )
+
+    def _coverage_payload(self, patient_reference: str, medicaid_id: str) -> dict:
+        """FHIR Coverage JSON for Medicaid enrollment."""
+        return {
+            "resourceType": "Coverage",
+            "identifier": [{"system": MEDICAID_SYSTEM, "value": medicaid_id}],
+            "status": "active",
+            "type": _MEDICAID_TYPE,
+            "subscriber": {"reference": patient_reference},
+            "beneficiary": {"reference": patient_reference},
+            "payor": _MEDICAID_PAYOR
+        }
+
+    def _mode(self, validation: Optional[str]) -> str:
+        """A per-call validation override, else the service default."""
+        return _validation_mode(validation or self.validation)
+
+    def _encode(self, resource: dict, mode: str) -> str:
+        """Request body; strict mode validates through the model first."""
+        if mode != VALIDATE_STRICT:
+            return json.dumps(resource)
+        model_class = Bundle if resource["resourceType"] == "Bundle" \
+            else _RESOURCE_CLASSES[resource["resourceType"]]
+        return model_class.parse_obj(resource).json(exclude_none=True)
+
+    def _decode(self, resource: dict, mode: str):
+        """A returned resource as the validation mode dictates."""
+        if mode == VALIDATE_STRICT:
+            return _RESOURCE_CLASSES[resource["resourceType"]].parse_obj(resource)
+        if mode == VALIDATE_LAZY:
+            return LazyResource(resource)
+        return _resource_ref("", resource)
+
+    async def _create(self, payload: dict, mode: str):
+        """POST a new resource and return it per ``mode``."""
+        headers = {"Content-Type": FHIR_JSON}
+        if mode == VALIDATE_MINIMAL:
+            headers["Prefer"] = "return=minimal"
+        response = await self._request(
+            f"create {payload['resourceType']}", "POST",
+            f"{self.base_url}/{payload['resourceType']}",
+            content=self._encode(payload, mode),
+            headers=headers
         )
+        response.raise_for_status()
+        if mode == VALIDATE_MINIMAL:
+            body = response.json() if response.content else None
+            return _resource_ref(response.headers.get("Location", ""), body)
+        return self._decode(response.json(), mode)
 
-        response = await self.client.post(
-            f"{self.base_url}/Coverage",
-            json=coverage.dict(exclude_none=True)
+    async def _submit_registrations(
+        self,
+        requests: List[RegistrationRequest],
+        mode: str
+    ) -> List[RegistrationResult]:
+        """POST one transaction Bundle for ``requests`` and parse the reply."""
+        entries = []
+        layout = []  # per request: entry positions of patient, coverage, encounter
+        for request in requests:
+            patient_url = f"urn:uuid:{uuid.uuid4()}"
+            payloads = [self._patient_payload(request.demographics), None, None]
+            if request.demographics.medicaid_id:
+                payloads[1] = self._coverage_payload(
+                    patient_url, request.demographics.medicaid_id
+                )
+            if request.provider_id:
+                payloads[2] = self._encounter_payload(
+                    patient_url, request.provider_id, request.reason
+                )
+            positions = []
+            for i, payload in enumerate(payloads):
+                if payload is None:
+                    positions.append(None)
+                    continue
+                positions.append(len(entries))
+                entries.append({
+                    "fullUrl": patient_url if i == 0 else f"urn:uuid:{uuid.uuid4()}",
+                    "resource": payload,
+                    "request": {"method": "POST", "url": payload["resourceType"]}
+                })
+            layout.append(positions)
+
+        bundle = {"resourceType": "Bundle", "type": "transaction", "entry": entries}
+        prefer = "return=minimal" if mode == VALIDATE_MINIMAL else "return=representation"
+        response = await self._request(
+            "transaction", "POST", self.base_url,
+            content=self._encode(bundle, mode),
+            headers={"Content-Type": FHIR_JSON, "Prefer": prefer}
         )
         response.raise_for_status()
 
-        return Coverage.parse_obj(response.json())
+        created = self._transaction_resources(entries, response.json(), mode)
+        # The resources are already validated (or deliberately not)
+        return [
+            RegistrationResult.construct(**{
+                field: created[position]
+                for field, position in zip(("patient", "coverage", "encounter"), positions)
+                if position is not None
+            })
+            for positions in layout
+        ]
+
+    def _transaction_resources(self, entries: List[dict], reply: dict, mode: str) -> list:
+        """
+        Created resources from a transaction-response, in request order.
+
+        Servers that honour ``Prefer: return=representation`` echo each
+        resource; otherwise only ``response.location`` comes back, so the
+        submitted resource is given the assigned id and its urn:uuid
+        references are rewritten to the assigned locations.
+        """
+        if reply.get("resourceType") != "Bundle" or reply.get("type") != "transaction-response":
+            raise ValueError("Expected a transaction-response Bundle")
+        replies = reply.get("entry", [])
+        if len(replies) != len(entries):
+            raise ValueError(
+                f"Transaction response has {len(replies)} entries, "
+                f"expected {len(entries)}"
+            )
+        locations = [answer.get("response", {}).get("location", "") for answer in replies]
+        if mode == VALIDATE_MINIMAL:
+            return [_resource_ref(location, answer.get("resource"))
+                    for location, answer in zip(locations, replies)]
+
+        # urn:uuid -> assigned "Type/id"
+        assigned: Dict[str, str] = {}
+        for entry, location in zip(entries, locations):
+            if location:
+                ref = _resource_ref(location)
+                assigned[entry["fullUrl"]] = f"{ref.resource_type}/{ref.id}"
+
+        resources = []
+        for entry, answer in zip(entries, replies):
+            resource = answer.get("resource")
+            if not resource:
+                if entry["fullUrl"] not in assigned:
+                    raise ValueError(f"No resource or location returned for {entry['fullUrl']}")
+                text = json.dumps(entry["resource"])
+                for placeholder, reference in assigned.items():
+                    text = text.replace(f'"{placeholder}"', f'"{reference}"')
+                resource = dict(json.loads(text), id=assigned[entry["fullUrl"]].split("/")[1])
+            resources.append(self._decode(resource, mode))
+        return resources
+
+
+class _RequestFailed(Exception):
+    """A request that failed after all retries."""
+
+    def __init__(self, error: Exception, attempts: int):
+        super().__init__(str(error))
+        self.error = error
+        self.attempts = attempts
 
 
 # Example usage
 async def main():
     """Demonstrate patient registration workflow."""
-    async with httpx.AsyncClient() as client:
-        service = RegistrationService(client)
-
+    async with RegistrationService() as service:
         # Search for existing patient
         results = await service.search_patient(
             last_name="Rodriguez",
             date_of_birth=date(1979, 3, 15),
-            first_name="Maria"
+            first_name="Maria",
+            k=5,
+            stop_at=AUTO_LINK_THRESHOLD
         )
 
-        if results and results[0].match_score > 0.85:
+        if results and results[0].match_score >= AUTO_LINK_THRESHOLD:
             print(f"Found existing patient: {results[0].name}")
             patient_id = results[0].patient_id
         else:
@@ -386,7 +1055,10 @@ async def main():
         )
         print(f"Created encounter: {encounter.id}")
 
+        for endpoint, stats in service.metrics.summary().items():
+            print(f"{endpoint}: {stats['count']} request(s), "
+                  f"p50 {stats['p50'] * 1000:.0f} ms")
+
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Registration Round-Trip Benchmark
+Sequential REST calls vs. FHIR transaction Bundles
+
+Chapter: 1 - Patient Registration
+Textbook Section: 1.5 Python Implementation
+
+Registers the same synthetic patients (each with Medicaid coverage and
+an arriving encounter) against a local MockFHIRServer three ways:
+
+- sequential: register_patient() + create_encounter(), three round trips
+- transaction: register_patient_transaction(), one Bundle per patient
+- bulk: register_patients_bulk(), one Bundle per --batch-size patients
+
+With a fixed per-request latency the front-desk path is dominated by
+round trips, so the transaction mode should be about 3x faster per
+registration and bulk onboarding far faster still. Each path is run in
+every --validation mode; with --latency 0 the table shows the client
+CPU cost of strict model validation versus the lazy / minimal fast paths.
+
+Prerequisites:
+    pip install httpx pydantic fhir.resources
+
+Usage:
+    python registration_benchmark.py [--registrations 200] [--latency 0.02]
+                                     [--batch-size 100]
+                                     [--validation strict lazy minimal]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from datetime import date, timedelta
+
+import httpx
+
+from mock_fhir_server import FAMILY_NAMES, GIVEN_NAMES, serve_in_process
+from patient_registration_service import (
+    VALIDATION_MODES,
+    PatientDemographics,
+    RegistrationRequest,
+    RegistrationService,
+)
+
+PROVIDER_ID = "dr-sarah-chen"
+REASON = "New patient visit"
+
+
+def make_registrations(count: int, seed: int = 1) -> list:
+    """Synthetic new-patient registrations, each with a Medicaid ID."""
+    rng = random.Random(seed)
+    registrations = []
+    for i in range(count):
+        gender = rng.choice(("female", "male"))
+        registrations.append(RegistrationRequest(
+            demographics=PatientDemographics(
+                first_name=rng.choice(GIVEN_NAMES[gender]),
+                last_name=rng.choice(FAMILY_NAMES),
+                date_of_birth=date(1940, 1, 1) + timedelta(days=rng.randrange(365 * 70)),
+                gender=gender,
+                address_line=f"{rng.randrange(1, 9999)} Main Street",
+                city="Springfield",
+                state="IL",
+                postal_code=f"62{rng.randrange(1000):03d}",
+                phone_home=f"217-555-{rng.randrange(10000):04d}",
+                medicaid_id=f"IL{i:09d}",
+            ),
+            provider_id=PROVIDER_ID,
+            reason=REASON,
+        ))
+    return registrations
+
+
+async def register_sequential(service: RegistrationService, registrations: list):
+    for request in registrations:
+        patient = await service.register_patient(request.demographics)
+        await service.create_encounter(patient.id, request.provider_id, request.reason)
+
+
+async def register_transaction(service: RegistrationService, registrations: list):
+    for request in registrations:
+        await service.register_patient_transaction(
+            request.demographics, request.provider_id, request.reason
+        )
+
+
+async def run(base_url: str, registrations: list, mode: str, batch_size: int,
+              validation: str) -> dict:
+    """Register all patients with one mode and return timing statistics."""
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        service = RegistrationService(client, base_url=base_url, validation=validation)
+        start = time.perf_counter()
+        if mode == "sequential":
+            await register_sequential(service, registrations)
+        elif mode == "transaction":
+            await register_transaction(service, registrations)
+        else:
+            await service.register_patients_bulk(registrations, batch_size=batch_size)
+        seconds = time.perf_counter() - start
+    return {
+        "mode": mode,
+        "validation": validation,
+        "seconds": seconds,
+        "ms_per_registration": seconds * 1000 / len(registrations),
+        "registrations_per_sec": len(registrations) / seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--registrations", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="Mock server latency per request in seconds")
+    parser.add_argument("--batch-size", type=int, default=100,
+                        help="Registrations per Bundle in bulk mode")
+    parser.add_argument("--validation", nargs="+", choices=VALIDATION_MODES,
+                        default=list(VALIDATION_MODES))
+    args = parser.parse_args()
+
+    registrations = make_registrations(args.registrations)
+
+    print("=" * 60)
+    print(f"Patient registration: {args.registrations:,} patients "
+          f"(Patient + Coverage + Encounter), "
+          f"{args.latency * 1000:.0f} ms server latency")
+    print("=" * 60)
+    print(f"{'Mode':<12} {'Validation':<10} {'Seconds':>9} {'ms/patient':>11} "
+          f"{'Patients/s':>11}")
+    baseline = None
+    with serve_in_process(0, latency=args.latency) as base_url:
+        for mode in ("sequential", "transaction", "bulk"):
+            for validation in args.validation:
+                stats = asyncio.run(run(base_url, registrations, mode,
+                                        args.batch_size, validation))
+                baseline = baseline or stats["registrations_per_sec"]
+                print(f"{stats['mode']:<12} {stats['validation']:<10} {stats['seconds']:>9.2f} "
+                      f"{stats['ms_per_registration']:>11.1f} "
+                      f"{stats['registrations_per_sec']:>11.0f}  "
+                      f"({stats['registrations_per_sec'] / baseline:.1f}x)")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Registration Load Test
+Search -> register -> encounter workflow against a mock FHIR server
+
+Chapter: 1 - Patient Registration
+Textbook Section: 1.5 Python Implementation
+
+Simulates a busy registration desk: --users concurrent clerks share one
+RegistrationService (and so one tuned client from create_fhir_client)
+and each repeatedly
+
+1. searches for the arriving patient (top 5, stopping at the
+   auto-link threshold),
+2. registers them (Patient + Medicaid Coverage) when no match is found,
+3. opens the visit Encounter.
+
+About 70% of arrivals are existing patients. The mock server runs in its
+own process with a fixed latency per request and gzip-compressed
+responses. Reports p50 / p99 latency per endpoint and for the whole
+workflow, plus workflows/sec and requests/sec.
+
+Prerequisites:
+    pip install httpx pydantic fhir.resources
+
+Usage:
+    python registration_load_test.py [--workflows 2000] [--users 32]
+                                     [--latency 0.02] [--connections 64]
+                                     [--keepalive 32] [--pool-shards N]
+                                     [--validation lazy]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from datetime import date
+
+from fhir_client import LatencyMetrics
+from mock_fhir_server import serve_in_process, synthetic_patients
+from patient_registration_service import (
+    AUTO_LINK_THRESHOLD,
+    VALIDATION_MODES,
+    PatientDemographics,
+    RegistrationService,
+)
+from registration_benchmark import make_registrations
+
+WORKFLOW = "workflow"
+
+
+def make_arrivals(patients: list, count: int, existing_share: float = 0.7,
+                  seed: int = 2) -> list:
+    """Demographics of arriving patients, mostly already registered."""
+    rng = random.Random(seed)
+    new_patients = iter(make_registrations(count, seed=seed))
+    arrivals = []
+    for _ in range(count):
+        if rng.random() < existing_share:
+            patient = rng.choice(patients)
+            name = patient["name"][0]
+            arrivals.append(PatientDemographics(
+                first_name=name["given"][0],
+                last_name=name["family"],
+                date_of_birth=date.fromisoformat(patient["birthDate"]),
+                gender=patient["gender"],
+                postal_code=patient["address"][0]["postalCode"],
+            ))
+        else:
+            arrivals.append(next(new_patients).demographics)
+    return arrivals
+
+
+async def arrive(service: RegistrationService, demographics: PatientDemographics) -> bool:
+    """One arrival; returns True if a new patient was registered."""
+    matches = await service.search_patient(
+        demographics.last_name, demographics.date_of_birth, demographics.first_name,
+        k=5, stop_at=AUTO_LINK_THRESHOLD
+    )
+    registered = not matches or matches[0].match_score < AUTO_LINK_THRESHOLD
+    if registered:
+        patient_id = (await service.register_patient(demographics)).id
+    else:
+        patient_id = matches[0].patient_id
+    await service.create_encounter(patient_id, "dr-sarah-chen", "Clinic visit")
+    return registered
+
+
+async def run(base_url: str, arrivals: list, users: int, validation: str,
+              client_options: dict) -> dict:
+    """Drive all arrivals through ``users`` concurrent clerks."""
+    pending = iter(arrivals)
+    registered = 0
+
+    async def clerk():
+        nonlocal registered
+        for demographics in pending:
+            with service.metrics.timer(WORKFLOW):
+                new_patient = await arrive(service, demographics)
+            registered += new_patient
+
+    async with RegistrationService(base_url=base_url, validation=validation,
+                                   metrics=LatencyMetrics(), **client_options) as service:
+        start = time.perf_counter()
+        await asyncio.gather(*(clerk() for _ in range(users)))
+        seconds = time.perf_counter() - start
+        summary = service.metrics.summary()
+
+    requests = sum(stats["count"] for endpoint, stats in summary.items()
+                   if endpoint != WORKFLOW)
+    return {
+        "seconds": seconds,
+        "workflows_per_sec": len(arrivals) / seconds,
+        "requests_per_sec": requests / seconds,
+        "registered": registered,
+        "endpoints": summary,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workflows", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=32,
+                        help="Concurrent registration clerks")
+    parser.add_argument("--patients", type=int, default=50_000)
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="Mock server latency per request in seconds")
+    parser.add_argument("--connections", type=int, default=64,
+                        help="Client pool max_connections")
+    parser.add_argument("--keepalive", type=int, default=32,
+                        help="Client pool max_keepalive_connections (0 disables reuse)")
+    parser.add_argument("--pool-shards", type=int, default=None,
+                        help="Connection pools to split the connections over "
+                             "(default: one per 16 connections)")
+    parser.add_argument("--gzip-min-size", type=int, default=1024,
+                        help="Server gzips responses at least this large")
+    parser.add_argument("--validation", choices=VALIDATION_MODES, default="lazy")
+    args = parser.parse_args()
+
+    patients = synthetic_patients(args.patients)
+    arrivals = make_arrivals(patients, args.workflows)
+    client_options = {"max_connections": args.connections,
+                      "max_keepalive_connections": args.keepalive,
+                      "pool_shards": args.pool_shards}
+
+    with serve_in_process(args.patients, latency=args.latency,
+                          gzip_min_size=args.gzip_min_size) as base_url:
+        stats = asyncio.run(run(base_url, arrivals, args.users, args.validation,
+                                client_options))
+
+    print("=" * 60)
+    print(f"Registration load test: {args.workflows:,} arrivals, {args.users} clerks, "
+          f"{args.latency * 1000:.0f} ms server latency")
+    print(f"Client pool: {args.connections} connections, {args.keepalive} keep-alive, "
+          f"{args.pool_shards or 'auto'} shards; validation: {args.validation}")
+    print("=" * 60)
+    print(f"{'Endpoint':<18} {'Requests':>9} {'Errors':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for endpoint, endpoint_stats in sorted(stats["endpoints"].items(),
+                                           key=lambda item: item[0] == WORKFLOW):
+        print(f"{endpoint:<18} {endpoint_stats['count']:>9} {endpoint_stats['errors']:>7} "
+              f"{endpoint_stats['p50'] * 1000:>8.1f} {endpoint_stats['p99'] * 1000:>8.1f}")
+    print("-" * 60)
+    print(f"New registrations: {stats['registered']:,} of {args.workflows:,}")
+    print(f"Throughput: {stats['workflows_per_sec']:.0f} workflows/s, "
+          f"{stats['requests_per_sec']:.0f} requests/s ({stats['seconds']:.1f}s)")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+Test configuration for the textbook scripts.
+
+The scripts are standalone modules rather than a package, so each
+script directory is put on sys.path the way the scripts themselves
+reach utilities/.
+"""
+
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent
+TEACHING_DATA = SCRIPTS_DIR.parents[1] / 'data' / 'csv'
+
+for directory in ('utilities', 'calculators', 'ml_models', 'services', 'cohorts'):
+    sys.path.insert(0, str(SCRIPTS_DIR / directory))
+
+
+@pytest.fixture
+def data_dir(tmp_path) -> Path:
+    """A writable copy of the teaching dataset."""
+    return Path(shutil.copytree(TEACHING_DATA, tmp_path / 'csv'))
+
+
+@pytest.fixture(scope='session')
+def synthetic_dir(tmp_path_factory) -> Path:
+    """A small synthetic OMOP extract shaped like the teaching dataset."""
+    from synthetic_omop import generate_tables, write_tables
+
+    out_dir = tmp_path_factory.mktemp('synthetic')
+    write_tables(generate_tables(2000, seed=0), out_dir)
+    return out_dir
@@ -0,0 +1,53 @@
+"""BP control trends (bp_control_trends)."""
+
+import numpy as np
+import pandas as pd
+
+from bp_control_trends import BPSeriesStore, add_trends, build_series, summarize
+from omop_loader import load_schema
+
+
+def _series(readings):
+    """Series for (person, systolic, diastolic) tuples, one reading per day."""
+    frame = pd.DataFrame(readings, columns=['person_id', 'systolic', 'diastolic'])
+    frame['visit_occurrence_id'] = np.arange(len(frame))
+    frame['measurement_date'] = (np.datetime64('2024-01-01')
+                                 + frame.groupby('person_id').cumcount().to_numpy()
+                                 * np.timedelta64(30, 'D'))
+    return frame[['person_id', 'measurement_date', 'visit_occurrence_id',
+                  'systolic', 'diastolic']].astype({'systolic': float, 'diastolic': float})
+
+
+def test_crossing_into_uncontrolled_is_worsening():
+    series = _series([(1, 128, 74), (1, 114, 92), (2, 150, 95), (2, 138, 85)])
+    trends = add_trends(series)['trend'].tolist()
+    assert trends == ['baseline', 'worsening', 'baseline', 'improving']
+    assert summarize(series)['trend'].tolist() == ['worsening', 'improving']
+
+
+def test_empty_series():
+    assert add_trends(_series([])).empty
+
+
+def test_refresh_rebuilds_after_same_size_edit(data_dir, tmp_path):
+    measurements = data_dir / 'measurement.csv'
+    header, *rows = measurements.read_text().splitlines(keepends=True)
+    # Enough rows that the edit lies beyond the first and last megabyte
+    copies = [row.replace('12345,', f'{person},', 1)
+              for person in range(20_000, 35_000) for row in rows]
+    measurements.write_text(header + ''.join(copies))
+    schema = load_schema(data_dir)
+    store = BPSeriesStore(tmp_path / 'store')
+    assert store.refresh(measurements, schema)['mode'] == 'rebuilt'
+
+    lines = measurements.read_text().splitlines(keepends=True)
+    middle = next(i for i in range(len(lines) // 2, len(lines))
+                  if ',3004249,' in lines[i] and ',148,' in lines[i])
+    lines[middle] = lines[middle].replace(',148,', ',188,')
+    size = measurements.stat().st_size
+    measurements.write_text(''.join(lines))
+    assert measurements.stat().st_size == size
+
+    assert store.refresh(measurements, schema)['mode'] == 'rebuilt'
+    expected = summarize(build_series(measurements, schema))
+    assert expected.equals(store.summary())
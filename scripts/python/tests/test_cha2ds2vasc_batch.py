@@ -0,0 +1,27 @@
+"""Vectorized CHA2DS2-VASc calculator (cha2ds2vasc_batch)."""
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cha2ds2vasc_batch import calculate_age_batch
+
+
+def test_age_at_reference_date():
+    births = np.array(['1950-06-15', '1950-06-16', '2000-02-29'], dtype='datetime64[D]')
+    ages = calculate_age_batch(births, reference_date=date(2025, 6, 15))
+    assert ages.tolist() == [75, 74, 25]
+
+
+def test_missing_birth_date_names_rows():
+    births = pd.Series([date(1950, 1, 1), None], index=['p1', 'p2'])
+    with pytest.raises(ValueError, match=r"Missing birth date in 1 row\(s\): p2$"):
+        calculate_age_batch(births)
+
+
+def test_missing_birth_date_positions():
+    births = np.array(['1950-01-01', 'NaT', 'NaT'], dtype='datetime64[D]')
+    with pytest.raises(ValueError, match=r"2 row\(s\): 1, 2$"):
+        calculate_age_batch(births)
@@ -0,0 +1,29 @@
+"""Population CHA2DS2-VASc scoring (cha2ds2vasc_population)."""
+
+from datetime import date
+
+import pandas as pd
+
+from cha2ds2vasc_population import score_population
+
+REFERENCE_DATE = date(2026, 1, 13)
+
+
+def test_teaching_patient(data_dir):
+    scores = score_population(data_dir, REFERENCE_DATE, workers=1)
+    assert scores.loc[12345, 'score'] == 3
+    assert scores.loc[12345, 'recommendation'] == 'Oral anticoagulation strongly recommended'
+
+
+def test_persons_without_birth_date_get_null_scores(data_dir):
+    person = pd.read_csv(data_dir / 'person.csv')
+    unknown = person.iloc[[0, 0]].assign(
+        person_id=[20001, 20002], year_of_birth=pd.NA, birth_datetime=pd.NA)
+    pd.concat([person, unknown]).to_csv(data_dir / 'person.csv', index=False)
+
+    scores = score_population(data_dir, REFERENCE_DATE, workers=1)
+
+    assert scores.index.tolist() == [12345, 20001, 20002]
+    assert scores.loc[12345, 'score'] == 3
+    assert scores.loc[[20001, 20002]].isna().all(axis=None)
+    assert scores['score'].dtype == 'Int64'
@@ -0,0 +1,56 @@
+"""Drug era builder (drug_eras)."""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from drug_eras import ERA_COLUMNS, EXPOSURE_COLUMNS, build_drug_eras, exposure_intervals
+
+
+def _reference_eras(data_dir: Path, gap_days: int) -> pd.DataFrame:
+    """Eras built one exposure at a time, per person and drug."""
+    df = pd.read_csv(Path(data_dir) / 'drug_exposure.csv', usecols=EXPOSURE_COLUMNS)
+    person, drug, start, end = exposure_intervals(df)
+    rows = []
+    for i in np.lexsort((start, drug, person)):
+        key = (person[i], drug[i])
+        if rows and tuple(rows[-1][:2]) == key and start[i] <= rows[-1][3] + gap_days:
+            era = rows[-1]
+            era[4] += max(0, end[i] - max(start[i], era[3]))
+            era[3] = max(era[3], end[i])
+            era[5] += 1
+        else:
+            rows.append([*key, start[i], end[i], end[i] - start[i], 1])
+    return pd.DataFrame({
+        'person_id': [r[0] for r in rows],
+        'drug_concept_id': [r[1] for r in rows],
+        'drug_era_start_date': np.array([r[2] for r in rows], dtype='datetime64[D]'),
+        'drug_era_end_date': np.array([r[3] for r in rows], dtype='datetime64[D]'),
+        'drug_exposure_count': [r[5] for r in rows],
+        'gap_days': [r[3] - r[2] - r[4] for r in rows],
+    })
+
+
+@pytest.mark.parametrize('workers, partitions', [(1, 1), (2, 3)])
+@pytest.mark.parametrize('gap_days', [0, 30])
+def test_matches_reference(synthetic_dir, gap_days, workers, partitions):
+    eras, _ = build_drug_eras(synthetic_dir, gap_days, workers=workers,
+                              partitions=partitions)
+    expected = _reference_eras(synthetic_dir, gap_days)
+
+    assert list(eras.columns) == ERA_COLUMNS
+    assert len(eras) == len(expected)
+    for column in expected:
+        np.testing.assert_array_equal(eras[column].to_numpy(), expected[column].to_numpy(),
+                                      err_msg=column)
+
+
+def test_teaching_patient(data_dir):
+    eras, _ = build_drug_eras(data_dir, workers=1)
+    maria = eras[eras['person_id'] == 12345]
+
+    assert len(maria) == 4
+    assert maria['drug_concept_id'].is_unique
+    assert (maria['gap_days'] == 0).all()
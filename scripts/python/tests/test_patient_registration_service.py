@@ -0,0 +1,79 @@
+"""Patient registration service (patient_registration_service)."""
+
+import asyncio
+from datetime import date
+
+import httpx
+import pytest
+from pydantic import ValidationError
+
+from patient_registration_service import (
+    FHIR_SERVER_URL, PatientDemographics, PatientSearchQuery, RegistrationService,
+)
+
+MARIA = {
+    "resourceType": "Patient", "id": "12345", "birthDate": "1979-03-15",
+    "name": [{"family": "Rodriguez", "given": ["Maria"]}],
+    "identifier": [{"type": {"coding": [{"code": "MR"}]}, "value": "MRN-12345"}],
+}
+
+DEMOGRAPHICS = dict(first_name="Maria", last_name="Rodriguez",
+                    date_of_birth=date(1979, 3, 15), gender="female", state="IL")
+
+
+def _searchset(*patients) -> dict:
+    return {"resourceType": "Bundle", "type": "searchset",
+            "entry": [{"resource": p} for p in patients]}
+
+
+def _search_server(request: httpx.Request) -> httpx.Response:
+    """Patients by family name; 'Nameless' finds a Patient without a name."""
+    family = request.url.params.get("family")
+    if family == "Nameless":
+        return httpx.Response(200, json=_searchset(
+            {"resourceType": "Patient", "id": "67890", "birthDate": "1979-03-15"}))
+    return httpx.Response(200, json=_searchset(*[MARIA] * (family == "Rodriguez")))
+
+
+def _bulk_search(queries: list, **options) -> list:
+    async def run():
+        transport = httpx.MockTransport(_search_server)
+        async with httpx.AsyncClient(transport=transport) as client:
+            service = RegistrationService(client, FHIR_SERVER_URL)
+            return [r async for r in service.search_patients_bulk(queries, **options)]
+    return sorted(asyncio.run(run()), key=lambda r: r.index)
+
+
+def test_bulk_search_isolates_unreadable_results():
+    queries = [
+        PatientSearchQuery(last_name=name, date_of_birth=date(1979, 3, 15),
+                           first_name="Maria")
+        for name in ("Rodriguez", "Nameless", "Smith", "Rodriguez")
+    ]
+    results = _bulk_search(queries, concurrency=2, backoff=0)
+
+    assert [r.index for r in results] == [0, 1, 2, 3]
+    assert results[1].error and results[1].matches == []
+    assert [r.error for r in results if r.index != 1] == [None, None, None]
+    assert [r.matches[0].patient_id for r in (results[0], results[3])] == ["12345", "12345"]
+    assert results[2].matches == []
+
+
+def test_demographics_accepts_valid():
+    assert PatientDemographics(**DEMOGRAPHICS).state == "IL"
+
+
+@pytest.mark.parametrize("invalid", [{"gender": "xyz"}, {"state": "illinois"}])
+def test_demographics_rejects_invalid(invalid):
+    with pytest.raises(ValidationError):
+        PatientDemographics(**{**DEMOGRAPHICS, **invalid})
+
+
+def test_client_options_need_an_owned_client():
+    async def run():
+        async with httpx.AsyncClient() as client:
+            with pytest.raises(ValueError, match="max_connections"):
+                RegistrationService(client, max_connections=10)
+            async with RegistrationService(max_connections=10) as service:
+                assert service.client is not client
+    asyncio.run(run())
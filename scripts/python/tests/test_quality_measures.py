@@ -0,0 +1,62 @@
+"""HEDIS care-gap engine (quality_measures)."""
+
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from quality_measures import (
+    EVENT_TABLES, EXCLUDED, GAP, MEASURES, MET, PERSON_COLUMNS, Criterion, Measure,
+    _in_range, evaluate_measures,
+)
+
+
+def _reference_status(data_dir: Path, measure: Measure, as_of: date) -> pd.Series:
+    """One measure evaluated with one pandas query per criterion."""
+    as_of = pd.Timestamp(as_of)
+
+    def persons(criterion: Criterion) -> set:
+        spec = EVENT_TABLES[criterion.table]
+        df = pd.read_csv(Path(data_dir) / f'{spec.table}.csv',
+                         parse_dates=[spec.date], dtype={spec.source: str})
+        age = (as_of - df[spec.date]).dt.days
+        hit = (df[spec.concept].isin(criterion.concepts) | df[spec.source].isin(criterion.codes))
+        hit &= age >= 0
+        if criterion.lookback_days is not None:
+            hit &= age <= criterion.lookback_days
+        df = df[hit]
+        if criterion.latest:
+            df = df.sort_values([spec.date, spec.value], ascending=[True, False],
+                                na_position='first').groupby('person_id').tail(1)
+        if criterion.has_range:
+            df = df[_in_range(df[spec.value].to_numpy(dtype=np.float64), criterion)]
+        return set(df['person_id'])
+
+    person = pd.read_csv(Path(data_dir) / 'person.csv', usecols=PERSON_COLUMNS)
+    age = as_of.year - person['year_of_birth']
+    eligible = person['person_id'][(age >= measure.min_age) & (age <= measure.max_age)]
+    eligible = set(eligible).intersection(*map(persons, measure.denominator))
+    excluded = set().union(*map(persons, measure.exclusions)) & eligible
+    numerator = eligible.intersection(*map(persons, measure.numerator)) - excluded
+    return pd.Series({p: EXCLUDED if p in excluded else MET if p in numerator else GAP
+                      for p in eligible}, dtype=object)
+
+
+def test_teaching_patient(data_dir):
+    status, _ = evaluate_measures(data_dir, MEASURES, date(2026, 1, 13), workers=1)
+    maria = status[status['person_id'] == 12345].set_index('measure_id')['status']
+    assert maria['CDC-EYE'] == GAP
+    assert maria['CBP'] == GAP
+    assert maria['KED'] == MET
+
+
+@pytest.mark.parametrize('measure', MEASURES, ids=lambda m: m.measure_id)
+def test_matches_per_measure_reference(synthetic_dir, measure):
+    as_of = date(2025, 12, 31)
+    status, _ = evaluate_measures(synthetic_dir, [measure], as_of, workers=1)
+    actual = dict(zip(status['person_id'], status['status'].astype(str)))
+    expected = _reference_status(synthetic_dir, measure, as_of).to_dict()
+    assert expected
+    assert actual == expected
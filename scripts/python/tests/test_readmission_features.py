@@ -0,0 +1,86 @@
+"""Readmission feature extraction (readmission_features)."""
+
+import pandas as pd
+import pytest
+
+from readmission_batch import predict_30day_readmission_frame
+from readmission_features import (
+    PRIOR_ADMISSION_DAYS, discharges, extract_features, extract_features_cached
+)
+from validate_data import load_csv_files
+
+
+@pytest.fixture
+def data(data_dir):
+    return load_csv_files(data_dir)
+
+
+def test_teaching_patient(data):
+    features = extract_features(data, visit_concepts=None)
+    assert features['age'].tolist() == [46, 46, 46, 46]
+    assert (features['eGFR'] == 65).all()
+
+
+def test_visit_of_unknown_person_has_no_age(data):
+    visits = data['visit_occurrence']
+    orphan = visits.iloc[[0]].assign(visit_occurrence_id=999_999, person_id=777)
+    data = {**data, 'visit_occurrence': pd.concat([visits, orphan], ignore_index=True)}
+
+    features = extract_features(data, visit_concepts=None)
+    assert str(features['age'].dtype) == 'Int64'
+    assert pd.isna(features.loc[999_999, 'age'])
+    assert features.drop(index=999_999)['age'].notna().all()
+    assert predict_30day_readmission_frame(features)['risk_score'].notna().all()
+
+
+def test_missing_year_of_birth_without_birth_datetime(data):
+    person = data['person'].assign(
+        year_of_birth=pd.array([pd.NA] * len(data['person']), dtype='Int64'),
+        birth_datetime=pd.NaT)
+    features = extract_features({**data, 'person': person}, visit_concepts=None)
+    assert features['age'].isna().all()
+
+
+def test_cache_recomputes_only_changed_persons(data_dir, tmp_path):
+    cache_dir = tmp_path / 'cache'
+    features, recomputed = extract_features_cached(data_dir, cache_dir, None)
+    assert recomputed == 1
+    cached, recomputed = extract_features_cached(data_dir, cache_dir, None)
+    assert recomputed == 0
+    pd.testing.assert_frame_equal(cached, features)
+
+    # A new person with one visit: only they are featurized
+    with open(data_dir / 'person.csv', 'a') as f:
+        f.write(open(data_dir / 'person.csv').read().splitlines()[1]
+                .replace('12345,', '54321,', 1) + '\n')
+    visits = (data_dir / 'visit_occurrence.csv').read_text().splitlines()
+    with open(data_dir / 'visit_occurrence.csv', 'a') as f:
+        f.write(visits[1].replace('1001,12345,', '9001,54321,', 1) + '\n')
+
+    features, recomputed = extract_features_cached(data_dir, cache_dir, None)
+    assert recomputed == 1
+    expected = extract_features(load_csv_files(data_dir), visit_concepts=None)
+    pd.testing.assert_frame_equal(features, expected, check_dtype=False)
+
+
+def _prior_admissions_reference(stays, days=PRIOR_ADMISSION_DAYS):
+    """prior_admissions_6mo by a self-join of the stays."""
+    stays = stays.dropna(subset=['admit_date'])
+    pairs = stays.merge(stays[['person_id', 'admit_date']], on='person_id',
+                        suffixes=('', '_prior'))
+    prior = pairs[(pairs['admit_date_prior'] < pairs['admit_date'])
+                  & (pairs['admit_date_prior'] >= pairs['admit_date'] - pd.Timedelta(days=days))]
+    return prior.groupby('visit_occurrence_id').size()
+
+
+def test_prior_admissions_with_a_missing_admit_date(data):
+    visits = data['visit_occurrence'].copy()
+    visits['visit_start_date'] = visits['visit_start_date'].mask(visits.index == 1)
+    data = {**data, 'visit_occurrence': visits}
+
+    actual = extract_features(data, visit_concepts=None)['prior_admissions_6mo']
+    expected = _prior_admissions_reference(discharges(data, visit_concepts=None))
+    expected = expected.reindex(actual.index, fill_value=0)
+    assert actual.tolist() == expected.tolist()
+    assert actual.loc[visits.loc[1, 'visit_occurrence_id']] == 0
+    assert actual.max() > 0
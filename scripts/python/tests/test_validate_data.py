@@ -0,0 +1,58 @@
+"""Incremental validation (validate_data.validate_incremental)."""
+
+from validate_data import validate_incremental
+
+
+def _grow_measurements(path, size=3 << 20):
+    """Repeat the teaching rows (new ids) until the file is ``size`` bytes."""
+    header, *rows = path.read_text().splitlines(keepends=True)
+    out, measurement_id, total = [header], 100_000, len(header)
+    while total < size:
+        for row in rows:
+            line = f"{measurement_id}{row[row.index(','):]}"
+            out.append(line)
+            total += len(line)
+            measurement_id += 1
+    path.write_text(''.join(out))
+
+
+def _edit_middle_person(path):
+    """Point one measurement in the middle of the file at person 99999."""
+    lines = path.read_text().splitlines(keepends=True)
+    middle = len(lines) // 2
+    lines[middle] = lines[middle].replace(',12345,', ',99999,', 1)
+    path.write_text(''.join(lines))
+    return lines
+
+
+def _unknown_persons(errors):
+    return [error for error in errors if 'Invalid person_id' in error]
+
+
+def test_same_size_edit_is_revalidated(data_dir, tmp_path):
+    state_dir = tmp_path / 'state'
+    path = data_dir / 'measurement.csv'
+    _grow_measurements(path)
+    errors, _ = validate_incremental(data_dir, state_dir)
+    assert not _unknown_persons(errors)
+
+    size = path.stat().st_size
+    _edit_middle_person(path)
+    assert path.stat().st_size == size
+
+    errors, _ = validate_incremental(data_dir, state_dir)
+    assert _unknown_persons(errors)
+
+
+def test_edit_plus_append_is_rescanned(data_dir, tmp_path):
+    state_dir = tmp_path / 'state'
+    path = data_dir / 'measurement.csv'
+    _grow_measurements(path)
+    validate_incremental(data_dir, state_dir)
+
+    lines = _edit_middle_person(path)
+    with open(path, 'a') as f:
+        f.write(lines[1].replace('100000,', '999999,', 1))
+
+    errors, _ = validate_incremental(data_dir, state_dir)
+    assert _unknown_persons(errors)
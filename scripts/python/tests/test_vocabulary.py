@@ -0,0 +1,33 @@
+"""Concept ancestor index (vocabulary)."""
+
+import numpy as np
+import pytest
+
+from vocabulary import ConceptAncestorIndex
+
+# 313217 (AFib) has two descendants; 201826 only itself
+PAIRS = [(313217, 313217), (313217, 4154290), (313217, 4108832), (201826, 201826)]
+
+
+@pytest.fixture(params=[False, True], ids=['in-memory', 'memory-mapped'])
+def index(request, tmp_path) -> ConceptAncestorIndex:
+    built = ConceptAncestorIndex.from_pairs(*zip(*PAIRS))
+    if not request.param:
+        return built
+    built.save(tmp_path)
+    return ConceptAncestorIndex.load(tmp_path)
+
+
+def test_descendants(index):
+    assert index.descendants(313217).tolist() == [313217, 4108832, 4154290]
+    assert index.descendants(201826).tolist() == [201826]
+    assert index.descendants(999).tolist() == [999]
+
+
+def test_descendants_dtype_is_consistent(index):
+    assert {index.descendants(c).dtype for c in (313217, 201826, 999)} == {np.dtype(np.int32)}
+
+
+def test_descendants_rejects_non_int32_ids(index):
+    with pytest.raises(ValueError):
+        index.descendants(1 << 40)
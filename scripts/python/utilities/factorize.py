@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# ============================================================================
+# Script: factorize.py
+# Chapter: Setup - Shared Utilities
+#
+# Description:
+#   Integer codes for string columns, reusing Categorical codes. Shared
+#   by the vectorized CHA2DS2-VASc calculator (cha2ds2vasc_batch.py) and
+#   the readmission model (readmission_model.py).
+#
+# Prerequisites:
+#   - Python 3.8+
+#   - numpy, pandas (pip install -r requirements.txt)
+#
+# Usage:
+#   Imported, like omop_loader.py, after putting utilities/ on the path:
+#
+#     sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'utilities'))
+#     from factorize import factorize  # noqa: E402
+# ============================================================================
+
+"""
+Factorize
+Integer codes for string columns, reusing Categorical codes.
+
+Per-value tests (ICD-10 prefixes, case-insensitive gender, discharge
+disposition) are evaluated once per distinct value and gathered back
+through the codes, so a column of millions of strings costs one Python
+call per distinct value. Missing values get code -1; appending one
+extra result to the per-value array makes them index it:
+
+    codes, distinct = factorize(values)
+    matched = np.array([test(v) for v in distinct] + [False])[codes]
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def factorize(values) -> tuple:
+    """Return (integer codes, distinct values); Categoricals are used as-is."""
+    if isinstance(values, pd.Series) and isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.array
+    if isinstance(values, pd.Categorical):
+        return values.codes, values.categories
+    return pd.factorize(np.asarray(values, dtype=object))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Key Index for Clinical Informatics Textbook
+Compact primary-key sets with vectorized membership tests.
+
+A parent table's keys (person_id, visit_occurrence_id, ...) are stored
+once, either as a packed bitmap over the key range or as a sorted int64
+array, whichever is smaller:
+
+    dense keys (range < 64 x count)  -> bitmap, 1 bit per value in range
+    sparse keys                      -> sorted array, binary search
+
+Membership of a whole column is then tested in one NumPy call instead of
+building Python sets of boxed integers.
+
+Usage:
+    from key_index import KeyIndex
+    persons = KeyIndex.from_values(person_df["person_id"])
+    valid = persons.contains(visit_df["person_id"])
+"""
+
+import numpy as np
+import pandas as pd
+
+BITMAP = "bitmap"
+SORTED = "sorted"
+
+# A bitmap costs range / 8 bytes, a sorted array 8 bytes per key
+_BITMAP_MAX_SPAN_PER_KEY = 64
+
+
+def as_int64(values) -> tuple:
+    """
+    Split a column into its integer values and a null mask.
+
+    Returns:
+        (int64 array of the non-null values, boolean mask of rows that
+        are null or not numeric)
+    """
+    numeric = pd.to_numeric(pd.Series(values), errors="coerce")
+    missing = numeric.isna().to_numpy()
+    present = numeric[~missing].to_numpy(dtype=np.int64) if missing.any() \
+        else numeric.to_numpy(dtype=np.int64)
+    return present, missing
+
+
+class KeyIndex:
+    """
+    Immutable set of int64 keys.
+
+    Construct with from_values() for an arbitrary column, or directly
+    from an array of sorted distinct keys. ``kind``, ``base`` and
+    ``data`` fully describe the index, so it can be rebuilt around a
+    shared-memory buffer with from_parts().
+    """
+
+    def __init__(self, keys: np.ndarray):
+        keys = np.asarray(keys, dtype=np.int64)
+        self.count = len(keys)
+        span = int(keys[-1] - keys[0]) + 1 if self.count else 0
+        if self.count and span < _BITMAP_MAX_SPAN_PER_KEY * self.count:
+            bits = np.zeros(span, dtype=bool)
+            bits[keys - keys[0]] = True
+            self.kind, self.base = BITMAP, int(keys[0])
+            self.data = np.packbits(bits, bitorder="little")
+        else:
+            self.kind, self.base, self.data = SORTED, 0, keys
+
+    @classmethod
+    def from_values(cls, values) -> "KeyIndex":
+        """Index the distinct non-null values of a column."""
+        present, _ = as_int64(values)
+        return cls(np.unique(present))
+
+    @classmethod
+    def from_parts(cls, kind: str, base: int, count: int, data: np.ndarray) -> "KeyIndex":
+        """Rebuild an index from its parts without copying ``data``."""
+        index = cls.__new__(cls)
+        index.kind, index.base, index.count, index.data = kind, base, count, data
+        return index
+
+    def parts(self) -> tuple:
+        """(kind, base, count) - with ``data``, the arguments to from_parts()."""
+        return self.kind, self.base, self.count
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
+
+    def keys(self) -> np.ndarray:
+        """The keys as a sorted int64 array."""
+        if self.kind == SORTED:
+            return self.data
+        bits = np.unpackbits(self.data, bitorder="little")
+        return np.flatnonzero(bits).astype(np.int64) + self.base
+
+    def union(self, values) -> "KeyIndex":
+        """A new index holding these keys plus the non-null values given."""
+        present, _ = as_int64(values)
+        return KeyIndex(np.union1d(self.keys(), present))
+
+    def contains(self, values) -> np.ndarray:
+        """
+        Vectorized membership test.
+
+        Args:
+            values: int64 array (see as_int64()) or any column; nulls
+                and non-numeric values are never members
+
+        Returns:
+            Boolean array, one entry per value
+        """
+        if isinstance(values, np.ndarray) and values.dtype == np.int64:
+            present, missing = values, None
+        else:
+            present, missing = as_int64(values)
+
+        found = np.zeros(len(present), dtype=bool)
+        if self.count and len(present):
+            if self.kind == BITMAP:
+                offset = present - self.base
+                inside = (offset >= 0) & (offset < len(self.data) * 8)
+                offset = offset[inside]
+                found[inside] = (self.data[offset >> 3] >> (offset & 7)) & 1
+            else:
+                # Foreign-key columns repeat each key many times; search
+                # each distinct value once rather than once per row
+                codes, distinct = pd.factorize(present)
+                position = np.searchsorted(self.data, distinct)
+                np.minimum(position, self.count - 1, out=position)
+                found = (self.data[position] == distinct)[codes]
+
+        if missing is None or not missing.any():
+            return found
+        result = np.zeros(len(missing), dtype=bool)
+        result[~missing] = found
+        return result
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Typed OMOP CSV Loader for Clinical Informatics Textbook
+Schema-driven dtypes and a columnar cache for the OMOP CDM extracts.
+
+Column types come from data/csv/data_dictionary.csv where a column is
+described there, and otherwise from OMOP naming conventions:
+
+    *_concept_id    -> Int32 (nullable)
+    *_source_value  -> category
+    *_id            -> Int64 (nullable)
+    *_date(time)    -> datetime64
+
+Parsed tables can be cached as Parquet (pickle if pyarrow is not
+installed), keyed by a hash of the CSV contents and of the dtypes used,
+so repeat runs over unchanged files skip CSV parsing entirely.
+"""
+
+import hashlib
+import importlib.util
+import io
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+
+DICTIONARY_FILE = "data_dictionary.csv"
+
+# Bump when the cached representation changes
+CACHE_VERSION = 1
+CACHE_FORMAT = "parquet" if importlib.util.find_spec("pyarrow") else "pkl"
+
+# Marker dtype for columns parsed as ISO 8601 dates/datetimes
+DATE = "date"
+
+# data_dictionary.csv data_type -> pandas dtype
+DATA_TYPES = {
+    "INTEGER": "Int64",
+    "FLOAT": "float64",
+    "VARCHAR": "string",
+    "TEXT": "string",
+    "DATE": DATE,
+}
+
+
+def load_schema(data_dir: Path) -> dict:
+    """
+    Read data_dictionary.csv into {table: {column: data_type}}.
+
+    Returns an empty schema if the dictionary is missing, in which case
+    only the naming conventions apply.
+    """
+    path = Path(data_dir) / DICTIONARY_FILE
+    if not path.exists():
+        return {}
+
+    schema = {}
+    dictionary = pd.read_csv(path, usecols=["table_name", "column_name", "data_type"])
+    for row in dictionary.itertuples(index=False):
+        schema.setdefault(row.table_name, {})[row.column_name] = row.data_type.upper()
+    return schema
+
+
+def column_dtype(table: str, column: str, schema: dict):
+    """Return the pandas dtype for a column, or None to let pandas infer it."""
+    if column.endswith("_concept_id"):
+        return "Int32"
+    if column.endswith("_source_value"):
+        return "category"
+
+    declared = schema.get(table, {}).get(column)
+    if declared in DATA_TYPES:
+        return DATA_TYPES[declared]
+
+    if column.endswith("_id"):
+        return "Int64"
+    if column.endswith(("_date", "_datetime")):
+        return DATE
+    return None
+
+
+def table_dtypes(path: Path, schema: dict) -> dict:
+    """Dtypes for every column in a CSV file's header."""
+    table = Path(path).stem
+    header = pd.read_csv(path, nrows=0).columns
+    return {column: column_dtype(table, column, schema) for column in header}
+
+
+# Nullable integer dtypes are applied after parsing: pandas parses plain
+# int64/float64 columns far faster than it parses straight into Int32/Int64
+_CAST_AFTER_PARSE = {"Int32", "Int64"}
+
+
+def _convert(df: pd.DataFrame, casts: dict) -> pd.DataFrame:
+    """Apply post-parse conversions (dates, nullable integers)."""
+    for column, dtype in casts.items():
+        if column not in df:
+            continue
+        if dtype == DATE:
+            df[column] = pd.to_datetime(df[column], format="ISO8601", errors="coerce")
+        else:
+            try:
+                df[column] = df[column].astype(dtype)
+            except (TypeError, ValueError):
+                # Leave malformed columns as parsed; validation reports them
+                pass
+    return df
+
+
+def read_csv_typed(path: Path, schema: dict, usecols: list = None,
+                   chunksize: int = None, offset: int = 0, end: int = None):
+    """
+    Read a CSV with schema-driven dtypes.
+
+    Args:
+        path: CSV file
+        schema: Output of load_schema(), or None to let pandas infer types
+        usecols: Optional subset of columns (names or positions)
+        chunksize: Optional rows per chunk; returns an iterator of
+            DataFrames instead of a single DataFrame
+        offset: Optional byte offset of a line boundary to start reading
+            from (e.g. the end of the file at the previous run); the
+            header is still taken from the first line
+        end: Optional byte offset of a line boundary to stop at; with
+            ``offset`` this reads one of the ranges from csv_byte_ranges()
+
+    Returns:
+        DataFrame, or an iterator of DataFrames when chunksize is given
+    """
+    if schema is None:
+        dtypes = {c: None for c in pd.read_csv(path, nrows=0).columns}
+    else:
+        dtypes = table_dtypes(path, schema)
+    header = list(dtypes)
+    if usecols is not None:
+        selected = {header[c] if isinstance(c, int) else c for c in usecols}
+        dtypes = {c: t for c, t in dtypes.items() if c in selected}
+
+    # Dates are read as text and converted after parsing, since the
+    # extracts mix date-only and date-time values in *_date columns
+    casts = {c: t for c, t in dtypes.items() if t == DATE or t in _CAST_AFTER_PARSE}
+    read_types = {c: ("string" if t == DATE else t)
+                  for c, t in dtypes.items()
+                  if t is not None and t not in _CAST_AFTER_PARSE}
+
+    if end is not None:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            source = io.BytesIO(f.read(max(0, end - offset)))
+        reader = pd.read_csv(source, header=None, names=header, usecols=usecols,
+                             dtype=read_types, chunksize=chunksize)
+    elif offset:
+        source = open(path, "rb")
+        source.seek(offset)
+        reader = pd.read_csv(source, header=None, names=header, usecols=usecols,
+                             dtype=read_types, chunksize=chunksize)
+    else:
+        source = None
+        reader = pd.read_csv(path, usecols=usecols, dtype=read_types,
+                             chunksize=chunksize)
+
+    if chunksize:
+        return _converted_chunks(reader, casts, source)
+    try:
+        return _convert(reader, casts)
+    finally:
+        if source is not None:
+            source.close()
+
+
+def csv_byte_ranges(path: Path, parts: int) -> list:
+    """
+    Split a CSV's data rows into about ``parts`` (offset, end) byte ranges.
+
+    Ranges start after the header and end on line boundaries, so each
+    can be parsed independently with read_csv_typed(offset=, end=).
+    Assumes no quoted field spans a line, which holds for the extracts.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        start = len(f.readline())
+        bounds = [start]
+        step = max(1, (size - start) // max(1, parts))
+        for target in range(start + step, size, step):
+            if target <= bounds[-1]:
+                continue
+            f.seek(target - 1)
+            f.readline()
+            if f.tell() >= size:
+                break
+            bounds.append(f.tell())
+    bounds.append(size)
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+
+def _converted_chunks(reader, casts: dict, source=None):
+    try:
+        for chunk in reader:
+            yield _convert(chunk, casts)
+    finally:
+        if source is not None:
+            source.close()
+
+
+def file_digest(path: Path) -> str:
+    """BLAKE2 digest of a file's contents (read in 1 MB blocks)."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_digests(path: Path, prefix: int, size: int) -> tuple:
+    """
+    BLAKE2 digests of a file's first ``prefix`` bytes and of its first
+    ``size`` bytes (prefix <= size), from a single read.
+
+    Comparing the first with the digest stored for a previous ``size``
+    proves the file only grew by appending; the second is the digest to
+    store for next time.
+    """
+    block = 1 << 20
+    digest = hashlib.blake2b(digest_size=16)
+    prefix_digest = None
+    position = 0
+    with open(path, "rb") as f:
+        for stop in (prefix, size):
+            while position < stop:
+                data = f.read(min(block, stop - position))
+                if not data:
+                    raise ValueError(f"{path} is shorter than {stop} bytes")
+                digest.update(data)
+                position += len(data)
+            if prefix_digest is None:
+                prefix_digest = digest.hexdigest()
+    return prefix_digest, digest.hexdigest()
+
+
+def ends_with_newline(path: Path, size: int) -> bool:
+    if size == 0:
+        return False
+    with open(path, "rb") as f:
+        f.seek(size - 1)
+        return f.read(1) == b"\n"
+
+
+def cache_path(path: Path, schema: dict, cache_dir: Path) -> Path:
+    """Cache file for a CSV, keyed by its content hash and dtypes."""
+    dtypes = json.dumps(table_dtypes(path, schema), sort_keys=True)
+    key = hashlib.blake2b(
+        f"{CACHE_VERSION}:{file_digest(path)}:{dtypes}".encode(), digest_size=16
+    ).hexdigest()
+    return Path(cache_dir) / f"{Path(path).stem}-{key}.{CACHE_FORMAT}"
+
+
+def load_table(path: Path, schema: dict, cache_dir: Path = None,
+               usecols: list = None) -> pd.DataFrame:
+    """
+    Load one OMOP table with typed columns, using the columnar cache.
+
+    On a cache miss the CSV is parsed in full, written to the cache (any
+    stale cache files for the same table are removed) and then the
+    requested columns are returned. On a hit only the requested columns
+    are read from the cache.
+    """
+    if cache_dir is None:
+        return read_csv_typed(path, schema, usecols=usecols)
+
+    cached = cache_path(path, schema, cache_dir)
+    columns = None
+    if usecols is not None:
+        header = list(pd.read_csv(path, nrows=0).columns)
+        columns = [header[c] if isinstance(c, int) else c for c in usecols]
+
+    if cached.exists():
+        if CACHE_FORMAT == "parquet":
+            return pd.read_parquet(cached, columns=columns)
+        df = pd.read_pickle(cached)
+        return df[columns] if columns else df
+
+    df = read_csv_typed(path, schema)
+    cached.parent.mkdir(parents=True, exist_ok=True)
+    for stale in cached.parent.glob(f"{Path(path).stem}-*.{CACHE_FORMAT}"):
+        if stale != cached:
+            stale.unlink(missing_ok=True)
+
+    # Write then rename, so concurrent loaders never see a partial file
+    partial = cached.with_name(f"{cached.name}.{os.getpid()}.tmp")
+    if CACHE_FORMAT == "parquet":
+        df.to_parquet(partial, index=False)
+    else:
+        df.to_pickle(partial)
+    os.replace(partial, cached)
+    return df[columns] if columns else df
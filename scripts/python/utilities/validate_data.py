@@ -2,53 +2,296 @@
 """
 Data Validation Script for Clinical Informatics Textbook
 Validates CSV files and checks referential integrity.
+
+Usage:
+    python validate_data.py                      # load tables fully
+    python validate_data.py --chunk-size 500000  # stream tables in chunks
+    python validate_data.py --workers 8          # validate tables in parallel
+    python validate_data.py --cache-dir .cache   # reuse parsed tables
+    python validate_data.py --state-dir .state   # only check what changed
 """
 
+import argparse
+import json
+import pickle
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+import os
 import pandas as pd
 from pathlib import Path
 import sys
 
-
-def load_csv_files(data_dir: Path) -> dict:
-    """Load all CSV files from the data directory."""
+from key_index import KeyIndex, as_int64
+from omop_loader import (
+    ends_with_newline, file_digests, load_schema, load_table, read_csv_typed,
+)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Parent tables whose primary keys are referenced by other tables
+KEY_COLUMNS = {
+    "person": "person_id",
+    "visit_occurrence": "visit_occurrence_id",
+    "care_site": "care_site_id",
+}
+
+# Parent tables each table's foreign-key checks need
+TABLE_DEPENDENCIES = {
+    "visit_occurrence": ("person",),
+    "condition_occurrence": ("person", "visit_occurrence"),
+    "measurement": ("person",),
+    "drug_exposure": ("person",),
+    "provider": ("care_site",),
+}
+
+# Incremental validation state (see validate_incremental)
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 3
+
+# Tables are streamed parents-first so key indexes exist before children,
+# then in the order main() reports errors for fully loaded data
+STREAMING_ORDER = ["person", "care_site", "visit_occurrence",
+                   "condition_occurrence", "measurement", "drug_exposure"]
+
+
+def load_csv_files(data_dir: Path, typed: bool = True,
+                   cache_dir: Path = None) -> dict:
+    """
+    Load all CSV files from the data directory.
+
+    Args:
+        data_dir: Directory containing the OMOP CSV files
+        typed: Use compact dtypes from data_dictionary.csv and OMOP naming
+            conventions (see omop_loader) instead of pandas inference
+        cache_dir: Optional columnar cache directory; unchanged files are
+            then read from the cache instead of being parsed again
+    """
+    schema = load_schema(data_dir) if typed else None
     csv_files = {}
     for csv_file in data_dir.glob("*.csv"):
         if csv_file.name != "data_dictionary.csv":
-            csv_files[csv_file.stem] = pd.read_csv(csv_file)
+            if typed:
+                csv_files[csv_file.stem] = load_table(csv_file, schema, cache_dir)
+            else:
+                csv_files[csv_file.stem] = pd.read_csv(csv_file)
             print(f"Loaded {csv_file.name}: {len(csv_files[csv_file.stem])} records")
     return csv_files
 
 
-def validate_person(df: pd.DataFrame) -> list:
-    """Validate person table."""
-    errors = []
-
-    # Check required fields
-    if df["person_id"].isnull().any():
-        errors.append("person: Missing person_id values")
-
-    # Check valid gender concept IDs
-    valid_genders = {8507, 8532}  # Male, Female
-    invalid_genders = set(df["gender_concept_id"].unique()) - valid_genders
-    if invalid_genders:
-        errors.append(f"person: Invalid gender_concept_id: {invalid_genders}")
+class _FlagCheck:
+    """Report a fixed message if any row in any chunk matches a predicate."""
+
+    def __init__(self, columns: list, predicate, message: str):
+        self.columns = columns
+        self.predicate = predicate
+        self.message = message
+        self.found = False
+
+    def update(self, chunk: pd.DataFrame):
+        if not self.found and self.predicate(chunk).any():
+            self.found = True
+
+    def errors(self) -> list:
+        return [self.message] if self.found else []
+
+    def get_state(self):
+        return self.found
+
+    def set_state(self, state):
+        self.found = state
+
+
+class _InvalidValuesCheck:
+    """
+    Count the values of a column that fall outside a set of allowed keys.
+
+    ``allowed`` is a KeyIndex (or a small set of literal values). Invalid
+    values are kept as a sorted int64 array with per-value row counts, so
+    memory grows with the number of distinct offending values only and
+    the error reports counts plus the first SAMPLE_SIZE of them.
+    """
+
+    SAMPLE_SIZE = 10
+
+    def __init__(self, column: str, allowed, message: str, dropna: bool = False):
+        self.columns = [column]
+        self.column = column
+        self.allowed = allowed if isinstance(allowed, KeyIndex) \
+            else KeyIndex.from_values(sorted(allowed))
+        self.message = message
+        self.dropna = dropna
+        self.values = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.null_rows = 0
+
+    def _add(self, values: np.ndarray, counts: np.ndarray):
+        values = np.concatenate([self.values, values])
+        counts = np.concatenate([self.counts, counts])
+        self.values, inverse = np.unique(values, return_inverse=True)
+        self.counts = np.bincount(inverse, weights=counts,
+                                  minlength=len(self.values)).astype(np.int64)
+
+    def update(self, chunk: pd.DataFrame):
+        present, missing = as_int64(chunk[self.column])
+        if not self.dropna:
+            # Nulls never match a key and are reported as invalid
+            self.null_rows += int(missing.sum())
+        invalid = present[~self.allowed.contains(present)]
+        if len(invalid):
+            self._add(*np.unique(invalid, return_counts=True))
+
+    def errors(self) -> list:
+        if not len(self.values) and not self.null_rows:
+            return []
+        parts = []
+        if len(self.values):
+            sample = ", ".join(str(v) for v in self.values[:self.SAMPLE_SIZE])
+            more = ", ..." if len(self.values) > self.SAMPLE_SIZE else ""
+            parts.append(f"{int(self.counts.sum())} row(s) with "
+                         f"{len(self.values)} unknown value(s) [{sample}{more}]")
+        if self.null_rows:
+            parts.append(f"{self.null_rows} null row(s)")
+        return [self.message.format("; ".join(parts))]
+
+    def get_state(self):
+        return self.values, self.counts, self.null_rows
+
+    def set_state(self, state):
+        # Values invalid last time may have become valid since (e.g. the
+        # parent table gained rows), so re-test them against the keys
+        values, counts, self.null_rows = state
+        still_invalid = ~self.allowed.contains(values)
+        self.values, self.counts = values[still_invalid], counts[still_invalid]
+
+
+class _KeyCollector:
+    """Accumulate a parent table's primary keys for foreign-key checks."""
+
+    def __init__(self, column: str):
+        self.columns = [column]
+        self.column = column
+        self._chunks = []
+
+    def update(self, chunk: pd.DataFrame):
+        present, _ = as_int64(chunk[self.column])
+        self._chunks.append(np.unique(present))
+
+    def keys(self) -> np.ndarray:
+        """Distinct keys seen so far as a sorted int64 array."""
+        if not self._chunks:
+            return np.empty(0, dtype=np.int64)
+        self._chunks = [np.unique(np.concatenate(self._chunks))]
+        return self._chunks[0]
+
+    def index(self) -> KeyIndex:
+        return KeyIndex(self.keys())
+
+    def errors(self) -> list:
+        return []
+
+
+_NO_KEYS = KeyIndex(np.empty(0, dtype=np.int64))
+
+
+def table_checks(table: str, keys: dict) -> list:
+    """
+    Build the running-state checks for one table.
+
+    Args:
+        table: OMOP table name
+        keys: Parent KeyIndex by table name (see KEY_COLUMNS); a missing
+            parent table is treated as having no keys
+
+    Returns:
+        List of checks, each with ``columns``, ``update(chunk)`` and
+        ``errors()``
+    """
+    persons = keys.get("person", _NO_KEYS)
+    visits = keys.get("visit_occurrence", _NO_KEYS)
+
+    if table == "person":
+        return [
+            _FlagCheck(["person_id"], lambda df: df["person_id"].isnull(),
+                       "person: Missing person_id values"),
+            _InvalidValuesCheck("gender_concept_id", {8507, 8532},  # Male, Female
+                                "person: Invalid gender_concept_id: {}"),
+            _FlagCheck(["year_of_birth"],
+                       lambda df: (df["year_of_birth"] < 1900) | (df["year_of_birth"] > 2026),
+                       "person: Invalid year_of_birth values"),
+        ]
+    if table == "visit_occurrence":
+        return [
+            _InvalidValuesCheck("person_id", persons,
+                                "visit_occurrence: Invalid person_id references: {}"),
+        ]
+    if table == "condition_occurrence":
+        return [
+            _InvalidValuesCheck("person_id", persons,
+                                "condition_occurrence: Invalid person_id: {}"),
+            _InvalidValuesCheck("visit_occurrence_id", visits,
+                                "condition_occurrence: Invalid visit_occurrence_id: {}"),
+        ]
+    if table == "measurement":
+        return [
+            _InvalidValuesCheck("person_id", persons,
+                                "measurement: Invalid person_id: {}"),
+            _FlagCheck(["value_as_number"], lambda df: df["value_as_number"] < 0,
+                       "measurement: Negative values found in value_as_number"),
+        ]
+    if table == "drug_exposure":
+        return [
+            _InvalidValuesCheck("person_id", persons,
+                                "drug_exposure: Invalid person_id: {}"),
+            _FlagCheck(["days_supply"], lambda df: df["days_supply"] <= 0,
+                       "drug_exposure: Invalid days_supply values"),
+        ]
+    if table == "provider" and "care_site" in keys:
+        return [
+            _InvalidValuesCheck("care_site_id", keys["care_site"],
+                                "provider: Invalid care_site_id references: {}",
+                                dropna=True),
+        ]
+    return []
+
+
+def run_checks(checks: list, chunks) -> list:
+    """Feed each chunk through every check and collect the errors."""
+    for chunk in chunks:
+        for check in checks:
+            check.update(chunk)
+    return [error for check in checks for error in check.errors()]
+
+
+def _key_sets(data: dict) -> dict:
+    """Parent key indexes from fully loaded tables."""
+    return {
+        table: KeyIndex.from_values(data[table][column])
+        for table, column in KEY_COLUMNS.items()
+        if table in data and column in data[table]
+    }
 
-    # Check year of birth is reasonable
-    if (df["year_of_birth"] < 1900).any() or (df["year_of_birth"] > 2026).any():
-        errors.append("person: Invalid year_of_birth values")
 
-    return errors
+def validate_person(df: pd.DataFrame) -> list:
+    """Validate person table."""
+    return run_checks(table_checks("person", {}), [df])
 
 
-def validate_visit_occurrence(df: pd.DataFrame, person_df: pd.DataFrame) -> list:
-    """Validate visit_occurrence table."""
-    errors = []
+def validate_visit_occurrence(df: pd.DataFrame, person_df: pd.DataFrame,
+                              keys: dict = None) -> list:
+    """
+    Validate visit_occurrence table.
 
-    # Check person_id references exist
-    valid_persons = set(person_df["person_id"])
-    invalid_refs = set(df["person_id"]) - valid_persons
-    if invalid_refs:
-        errors.append(f"visit_occurrence: Invalid person_id references: {invalid_refs}")
+    ``keys`` (from _key_sets()) lets callers validating several tables
+    build each parent key index once; otherwise it is built from the
+    parent DataFrames. The same applies to the functions below.
+    """
+    if keys is None:
+        keys = _key_sets({"person": person_df})
+    errors = run_checks(table_checks("visit_occurrence", keys), [df])
 
     # Check visit dates are reasonable
     df["visit_start_date"] = pd.to_datetime(df["visit_start_date"])
@@ -60,80 +303,429 @@ def validate_visit_occurrence(df: pd.DataFrame, person_df: pd.DataFrame) -> list
 
 
 def validate_condition_occurrence(df: pd.DataFrame, person_df: pd.DataFrame,
-                                   visit_df: pd.DataFrame) -> list:
+                                   visit_df: pd.DataFrame, keys: dict = None) -> list:
     """Validate condition_occurrence table."""
-    errors = []
-
-    # Check person_id references
-    valid_persons = set(person_df["person_id"])
-    invalid_persons = set(df["person_id"]) - valid_persons
-    if invalid_persons:
-        errors.append(f"condition_occurrence: Invalid person_id: {invalid_persons}")
-
-    # Check visit_occurrence_id references
-    valid_visits = set(visit_df["visit_occurrence_id"])
-    invalid_visits = set(df["visit_occurrence_id"]) - valid_visits
-    if invalid_visits:
-        errors.append(f"condition_occurrence: Invalid visit_occurrence_id: {invalid_visits}")
-
-    return errors
+    if keys is None:
+        keys = _key_sets({"person": person_df, "visit_occurrence": visit_df})
+    return run_checks(table_checks("condition_occurrence", keys), [df])
 
 
 def validate_measurement(df: pd.DataFrame, person_df: pd.DataFrame,
-                         visit_df: pd.DataFrame) -> list:
+                         visit_df: pd.DataFrame, keys: dict = None) -> list:
     """Validate measurement table."""
-    errors = []
+    if keys is None:
+        keys = _key_sets({"person": person_df})
+    return run_checks(table_checks("measurement", keys), [df])
 
-    # Check person_id references
-    valid_persons = set(person_df["person_id"])
-    invalid_persons = set(df["person_id"]) - valid_persons
-    if invalid_persons:
-        errors.append(f"measurement: Invalid person_id: {invalid_persons}")
 
-    # Check numeric values are reasonable
-    if (df["value_as_number"] < 0).any():
-        errors.append("measurement: Negative values found in value_as_number")
+def validate_drug_exposure(df: pd.DataFrame, person_df: pd.DataFrame,
+                           visit_df: pd.DataFrame, keys: dict = None) -> list:
+    """Validate drug_exposure table."""
+    if keys is None:
+        keys = _key_sets({"person": person_df})
+    return run_checks(table_checks("drug_exposure", keys), [df])
 
-    return errors
 
+def validate_referential_integrity(data: dict, keys: dict = None) -> list:
+    """Check all foreign key relationships."""
+    if "provider" in data and "care_site" in data:
+        if keys is None:
+            keys = _key_sets(data)
+        return run_checks(table_checks("provider", keys), [data["provider"]])
+    return []
+
+
+def _csv_paths(data_dir: Path) -> dict:
+    """CSV extracts in the data directory by table name."""
+    return {
+        path.stem: path for path in data_dir.glob("*.csv")
+        if path.name != "data_dictionary.csv"
+    }
+
+
+def _ordered_tables(csv_paths: dict) -> list:
+    """Table names in STREAMING_ORDER, followed by the rest alphabetically."""
+    ordered = [t for t in STREAMING_ORDER if t in csv_paths]
+    return ordered + sorted(t for t in csv_paths if t not in STREAMING_ORDER)
+
+
+def check_table(path: Path, checks: list, chunk_size: int = None,
+                schema: dict = None, cache_dir: Path = None,
+                offset: int = 0) -> tuple:
+    """
+    Run checks over one CSV file, parsing only the columns they need.
+
+    Args:
+        path: CSV file to validate
+        checks: Checks from table_checks() (plus any key collector)
+        chunk_size: Rows per chunk, or None to read the table in one go
+        schema: Schema from omop_loader.load_schema() for typed parsing
+        cache_dir: Optional columnar cache (used when not chunking)
+        offset: Byte offset to start at, to check only appended rows
+
+    Returns:
+        (errors, number of rows)
+    """
+    columns = sorted({c for check in checks for c in check.columns})
+    # Tables without checks are still parsed (first column only) to count rows
+    usecols = columns or [0]
+    if schema is not None and not chunk_size and not offset:
+        reader = [load_table(path, schema, cache_dir, usecols=usecols)]
+    elif chunk_size:
+        reader = read_csv_typed(path, schema, usecols, chunk_size, offset)
+    else:
+        reader = [read_csv_typed(path, schema, usecols, offset=offset)]
 
-def validate_drug_exposure(df: pd.DataFrame, person_df: pd.DataFrame,
-                           visit_df: pd.DataFrame) -> list:
-    """Validate drug_exposure table."""
-    errors = []
+    rows = 0
 
-    # Check person_id references
-    valid_persons = set(person_df["person_id"])
-    invalid_persons = set(df["person_id"]) - valid_persons
-    if invalid_persons:
-        errors.append(f"drug_exposure: Invalid person_id: {invalid_persons}")
+    def chunks():
+        nonlocal rows
+        for chunk in reader:
+            rows += len(chunk)
+            yield chunk
 
-    # Check days_supply is positive
-    if (df["days_supply"] <= 0).any():
-        errors.append("drug_exposure: Invalid days_supply values")
+    errors = run_checks(checks, chunks())
+    return errors, rows
 
-    return errors
 
+def validate_streaming(data_dir: Path, chunk_size: int, schema: dict = None) -> tuple:
+    """
+    Validate every table in fixed-size chunks with bounded memory.
 
-def validate_referential_integrity(data: dict) -> list:
-    """Check all foreign key relationships."""
-    errors = []
+    Only the columns a table's checks need are parsed. Parent tables are
+    streamed first so their key indexes are available to child tables;
+    the key indexes and the counts of invalid values are the only state
+    carried between chunks.
 
-    if "provider" in data and "care_site" in data:
-        valid_care_sites = set(data["care_site"]["care_site_id"])
-        provider_care_sites = set(data["provider"]["care_site_id"].dropna())
-        invalid = provider_care_sites - valid_care_sites
-        if invalid:
-            errors.append(f"provider: Invalid care_site_id references: {invalid}")
+    Args:
+        data_dir: Directory containing the OMOP CSV extracts
+        chunk_size: Rows per chunk
+        schema: Optional schema for typed parsing (omop_loader.load_schema)
 
-    return errors
+    Returns:
+        (errors, number of tables validated)
+    """
+    csv_paths = _csv_paths(data_dir)
+    ordered = _ordered_tables(csv_paths)
 
+    keys = {}
+    errors = []
+    for table in ordered:
+        checks = table_checks(table, keys)
+        collector = None
+        if table in KEY_COLUMNS:
+            collector = _KeyCollector(KEY_COLUMNS[table])
+            checks.append(collector)
+
+        table_errors, rows = check_table(csv_paths[table], checks, chunk_size, schema)
+        errors.extend(table_errors)
+        if collector is not None:
+            keys[table] = collector.index()
+        print(f"Streamed {csv_paths[table].name}: {rows} records")
+
+    return errors, len(ordered)
+
+
+def validate_incremental(data_dir: Path, state_dir: Path, chunk_size: int = None,
+                         schema: dict = None) -> tuple:
+    """
+    Validate only what changed since the previous run.
+
+    ``state_dir`` holds a manifest with each table's size, mtime,
+    content digest and row count, the running state of every check, and
+    the parent key sets as .npy arrays. On each run a table is:
+
+    - unchanged: no rows are read; its stored check state is re-tested
+      against the current parent keys (so e.g. a person_id that was
+      missing last time stops being reported once person gains it)
+    - appended: only the bytes after the previous end of file are
+      parsed, checked against the stored parent keys, and new parent
+      keys are merged into the stored set
+    - rewritten (any other change) or new: fully rescanned; tables whose
+      foreign keys point at a rewritten parent are rescanned as well,
+      since keys may have been removed
+
+    Args:
+        data_dir: Directory containing the OMOP CSV extracts
+        state_dir: Directory for the manifest and persisted state
+        chunk_size: Optional rows per chunk when parsing
+        schema: Optional schema for typed parsing (omop_loader.load_schema)
+
+    Returns:
+        (errors, number of tables validated)
+    """
+    state_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = state_dir / MANIFEST_FILE
+    manifest = {"version": MANIFEST_VERSION, "tables": {}}
+    if manifest_path.exists():
+        stored = json.loads(manifest_path.read_text())
+        if stored.get("version") == MANIFEST_VERSION:
+            manifest = stored
+
+    csv_paths = _csv_paths(data_dir)
+    ordered = _ordered_tables(csv_paths)
+    keys = {}
+    rescanned = set()
+    errors = []
 
-def main():
-    """Main validation function."""
-    # Determine data directory
+    for table in ordered:
+        path = csv_paths[table]
+        stat = path.stat()
+        entry = manifest["tables"].get(table)
+        state_path = state_dir / f"{table}.state.pkl"
+        keys_path = state_dir / f"{table}_keys.npy"
+
+        parent_rescanned = any(p in rescanned for p in TABLE_DEPENDENCIES.get(table, ()))
+        digest = None
+        if entry is None or parent_rescanned or not state_path.exists():
+            mode = "rescanned"
+        elif entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            mode = "unchanged"
+            digest = entry["digest"]
+        else:
+            # Only a byte-identical copy of the validated prefix makes the
+            # change an append; any edit within it means a full rescan
+            grown = stat.st_size >= entry["size"]
+            previous, digest = file_digests(path, entry["size"] if grown else 0,
+                                            stat.st_size)
+            if grown and entry["ends_with_newline"] and previous == entry["digest"]:
+                mode = "appended" if stat.st_size > entry["size"] else "unchanged"
+            else:
+                mode = "rescanned"
+        if digest is None:
+            digest = file_digests(path, 0, stat.st_size)[1]
+        if table in KEY_COLUMNS and mode != "rescanned" and not keys_path.exists():
+            mode = "rescanned"
+
+        checks = table_checks(table, keys)
+        collector = None
+        if table in KEY_COLUMNS and mode != "unchanged":
+            collector = _KeyCollector(KEY_COLUMNS[table])
+
+        rows = 0
+        if mode != "rescanned":
+            with open(state_path, "rb") as f:
+                states = pickle.load(f)
+            for check in checks:
+                check.set_state(states[check.message])
+            rows = entry["rows"]
+
+        if mode != "unchanged":
+            offset = entry["size"] if mode == "appended" else 0
+            _, new_rows = check_table(path, checks + [collector] if collector else checks,
+                                      chunk_size, schema, offset=offset)
+            rows += new_rows
+            print(f"Validated {path.name}: {new_rows} {mode} records "
+                  f"({rows} total)")
+        else:
+            print(f"Validated {path.name}: unchanged ({rows} records)")
+
+        if mode == "rescanned":
+            rescanned.add(table)
+
+        if table in KEY_COLUMNS:
+            if collector is None:
+                table_keys = np.load(keys_path)
+            else:
+                table_keys = collector.keys()
+                if mode == "appended":
+                    table_keys = np.union1d(np.load(keys_path), table_keys)
+                np.save(keys_path, table_keys)
+            keys[table] = KeyIndex(table_keys)
+
+        with open(state_path, "wb") as f:
+            pickle.dump({check.message: check.get_state() for check in checks}, f)
+        manifest["tables"][table] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "digest": digest,
+            "ends_with_newline": ends_with_newline(path, stat.st_size),
+            "rows": rows,
+        }
+        errors.extend(error for check in checks for error in check.errors())
+
+    for table in set(manifest["tables"]) - set(csv_paths):
+        del manifest["tables"][table]
+    partial = manifest_path.with_suffix(".tmp")
+    partial.write_text(json.dumps(manifest, indent=2))
+    os.replace(partial, manifest_path)
+
+    return errors, len(ordered)
+
+
+def _read_keys(path: Path, column: str, schema: dict = None,
+               cache_dir: Path = None) -> KeyIndex:
+    """Index of the distinct non-null values of a parent key column."""
+    if schema is None:
+        values = pd.read_csv(path, usecols=[column])[column]
+    else:
+        values = load_table(path, schema, cache_dir, usecols=[column])[column]
+    return KeyIndex.from_values(values)
+
+
+def _share_array(array: np.ndarray) -> tuple:
+    """Copy an array into shared memory; returns (handle, descriptor)."""
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _attach_array(descriptor: tuple) -> tuple:
+    """Map a shared array without copying; returns (handle, array)."""
+    name, shape, dtype = descriptor
+    try:
+        shm = shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        # Only the creating process may unlink the segment; older Pythons
+        # register every attach with the resource tracker
+        if os.name == "posix":
+            resource_tracker.unregister(shm._name, "shared_memory")
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _validate_table_worker(table: str, path: Path, chunk_size: int,
+                           shared_keys: dict, schema: dict = None,
+                           cache_dir: Path = None) -> tuple:
+    """Process-pool task: validate one table against shared parent keys."""
+    handles = []
+    try:
+        keys = {}
+        for parent, (parts, descriptor) in shared_keys.items():
+            shm, data = _attach_array(descriptor)
+            handles.append(shm)
+            keys[parent] = KeyIndex.from_parts(*parts, data)
+        errors, rows = check_table(path, table_checks(table, keys), chunk_size,
+                                   schema, cache_dir)
+        # Drop the views before closing the mappings they point into
+        keys.clear()
+        return errors, rows
+    finally:
+        for shm in handles:
+            shm.close()
+
+
+def validate_parallel(data_dir: Path, workers: int, chunk_size: int = None,
+                      schema: dict = None, cache_dir: Path = None) -> tuple:
+    """
+    Validate tables concurrently across a process pool.
+
+    Parent key columns are read first (in parallel, one column each),
+    indexed, and each KeyIndex is published once to shared memory;
+    workers map them without copying. Tables are submitted as soon as
+    the key indexes they depend on (TABLE_DEPENDENCIES) are available,
+    so tables without foreign keys start immediately and wall-clock time
+    approaches that of the slowest single table.
+
+    Args:
+        data_dir: Directory containing the OMOP CSV extracts
+        workers: Number of worker processes
+        chunk_size: Optional rows per chunk within each worker
+        schema: Optional schema for typed parsing (omop_loader.load_schema)
+        cache_dir: Optional columnar cache directory
+
+    Returns:
+        (errors, number of tables validated)
+    """
+    csv_paths = _csv_paths(data_dir)
+    ordered = _ordered_tables(csv_paths)
+    results = {}
+    shared = {}
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending_keys = {
+                pool.submit(_read_keys, csv_paths[t], column, schema, cache_dir): t
+                for t, column in KEY_COLUMNS.items() if t in csv_paths
+            }
+            waiting = list(ordered)
+            running = {}
+
+            while waiting or running or pending_keys:
+                for table in list(waiting):
+                    parents = [p for p in TABLE_DEPENDENCIES.get(table, ())
+                               if p in csv_paths]
+                    if all(p in shared for p in parents):
+                        descriptors = {p: shared[p][1:] for p in parents}
+                        future = pool.submit(_validate_table_worker, table,
+                                             csv_paths[table], chunk_size,
+                                             descriptors, schema, cache_dir)
+                        running[future] = table
+                        waiting.remove(table)
+
+                done, _ = wait(list(pending_keys) + list(running),
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in pending_keys:
+                        index = future.result()
+                        shm, descriptor = _share_array(index.data)
+                        shared[pending_keys.pop(future)] = (shm, index.parts(), descriptor)
+                    else:
+                        table = running.pop(future)
+                        results[table] = future.result()
+                        print(f"Validated {csv_paths[table].name}: "
+                              f"{results[table][1]} records")
+    finally:
+        for shm, _, _ in shared.values():
+            shm.close()
+            shm.unlink()
+
+    errors = [error for table in ordered for error in results[table][0]]
+    return errors, len(ordered)
+
+
+def peak_rss_mb(children: bool = False):
+    """
+    Peak resident set size in MB (None if unavailable).
+
+    With ``children=True`` this is the largest peak of any finished
+    child process, e.g. a validate_parallel() worker.
+    """
+    if resource is None:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def parse_args(argv=None):
+    """Parse command-line options."""
     script_dir = Path(__file__).parent
-    data_dir = script_dir.parent.parent / "data" / "csv"
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--data-dir", type=Path,
+        default=script_dir.parent.parent.parent / "data" / "csv",
+        help="Directory containing the OMOP CSV files")
+    parser.add_argument(
+        "--chunk-size", type=int, default=None,
+        help="Stream each table in chunks of this many rows instead of "
+             "loading it fully")
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="Validate tables in parallel across this many processes")
+    parser.add_argument(
+        "--cache-dir", type=Path, default=None,
+        help="Cache parsed tables here (keyed by file hash) so repeat runs "
+             "skip CSV parsing")
+    parser.add_argument(
+        "--state-dir", type=Path, default=None,
+        help="Validate incrementally, keeping a manifest and key sets here "
+             "so only appended or changed rows are checked on later runs")
+    parser.add_argument(
+        "--no-types", dest="typed", action="store_false",
+        help="Let pandas infer column types instead of using the data "
+             "dictionary")
+    args = parser.parse_args(argv)
+    if args.state_dir and args.workers:
+        parser.error("--state-dir cannot be combined with --workers")
+    return args
+
+
+def main(argv=None):
+    """Main validation function."""
+    args = parse_args(argv)
+    data_dir = args.data_dir
 
     if not data_dir.exists():
         print(f"Error: Data directory not found: {data_dir}")
@@ -142,45 +734,68 @@ def main():
     print(f"\nValidating data in: {data_dir}\n")
     print("=" * 50)
 
-    # Load all CSV files
-    data = load_csv_files(data_dir)
-    print("=" * 50)
-
-    all_errors = []
-
-    # Run validations
-    if "person" in data:
-        all_errors.extend(validate_person(data["person"]))
-
-    if "visit_occurrence" in data and "person" in data:
-        all_errors.extend(validate_visit_occurrence(
-            data["visit_occurrence"], data["person"]))
-
-    if "condition_occurrence" in data:
-        all_errors.extend(validate_condition_occurrence(
-            data["condition_occurrence"],
-            data.get("person", pd.DataFrame()),
-            data.get("visit_occurrence", pd.DataFrame())))
-
-    if "measurement" in data:
-        all_errors.extend(validate_measurement(
-            data["measurement"],
-            data.get("person", pd.DataFrame()),
-            data.get("visit_occurrence", pd.DataFrame())))
-
-    if "drug_exposure" in data:
-        all_errors.extend(validate_drug_exposure(
-            data["drug_exposure"],
-            data.get("person", pd.DataFrame()),
-            data.get("visit_occurrence", pd.DataFrame())))
-
-    # Check referential integrity
-    all_errors.extend(validate_referential_integrity(data))
+    schema = load_schema(data_dir) if args.typed else None
+
+    if args.state_dir:
+        all_errors, table_count = validate_incremental(
+            data_dir, args.state_dir, args.chunk_size, schema)
+        print("=" * 50)
+    elif args.workers:
+        all_errors, table_count = validate_parallel(
+            data_dir, args.workers, args.chunk_size, schema, args.cache_dir)
+        print("=" * 50)
+    elif args.chunk_size:
+        all_errors, table_count = validate_streaming(
+            data_dir, args.chunk_size, schema)
+        print("=" * 50)
+    else:
+        # Load all CSV files
+        data = load_csv_files(data_dir, args.typed, args.cache_dir)
+        table_count = len(data)
+        print("=" * 50)
+
+        all_errors = []
+        keys = _key_sets(data)
+
+        # Run validations
+        if "person" in data:
+            all_errors.extend(validate_person(data["person"]))
+
+        if "visit_occurrence" in data and "person" in data:
+            all_errors.extend(validate_visit_occurrence(
+                data["visit_occurrence"], data["person"], keys))
+
+        if "condition_occurrence" in data:
+            all_errors.extend(validate_condition_occurrence(
+                data["condition_occurrence"],
+                data.get("person", pd.DataFrame()),
+                data.get("visit_occurrence", pd.DataFrame()), keys))
+
+        if "measurement" in data:
+            all_errors.extend(validate_measurement(
+                data["measurement"],
+                data.get("person", pd.DataFrame()),
+                data.get("visit_occurrence", pd.DataFrame()), keys))
+
+        if "drug_exposure" in data:
+            all_errors.extend(validate_drug_exposure(
+                data["drug_exposure"],
+                data.get("person", pd.DataFrame()),
+                data.get("visit_occurrence", pd.DataFrame()), keys))
+
+        # Check referential integrity
+        all_errors.extend(validate_referential_integrity(data, keys))
 
     # Report results
     print("\nValidation Results")
     print("=" * 50)
 
+    peak_rss = peak_rss_mb()
+    if peak_rss is not None:
+        print(f"Peak memory (RSS): {peak_rss:.1f} MB")
+        if args.workers:
+            print(f"Peak worker memory (RSS): {peak_rss_mb(children=True):.1f} MB")
+
     if all_errors:
         print(f"\nFound {len(all_errors)} error(s):\n")
         for error in all_errors:
@@ -188,7 +803,7 @@ def main():
         sys.exit(1)
     else:
         print("\nAll validations passed!")
-        print(f"Validated {len(data)} tables successfully.")
+        print(f"Validated {table_count} tables successfully.")
         sys.exit(0)
 
 
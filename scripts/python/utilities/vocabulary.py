@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Concept Ancestor Index for Clinical Informatics Textbook
+Concept-set expansion over a memory-mapped concept_ancestor closure.
+
+The phenotype and quality SQL expands concept sets at query time:
+
+    SELECT descendant_concept_id FROM vocabulary.concept_ancestor
+    WHERE ancestor_concept_id = 313217
+
+ConceptAncestorIndex holds the same closure as three NumPy arrays in
+CSR layout:
+
+    ancestors    sorted distinct ancestor_concept_id          (int32)
+    offsets      start of each ancestor's descendants          (int64)
+    descendants  descendant_concept_id, sorted per ancestor    (int32)
+
+Every ancestor is its own descendant (min_levels_of_separation 0), as
+in the OHDSI vocabulary and the SQL's UNION with the ancestor itself.
+The arrays are saved as .npy files and memory-mapped on load, so a
+vocabulary of tens of millions of closure rows is opened without parsing
+and shared between processes through the page cache.
+
+Lookups are binary searches over the mapped arrays: descendants() is a
+zero-copy slice and is_descendant() a search within it. Expanded
+concept sets are KeyIndex objects (a bitmap when the ids are dense), so
+masks over a condition_concept_id column cost one NumPy call.
+
+Usage:
+    from vocabulary import load_concept_ancestor
+    vocabulary = load_concept_ancestor("CONCEPT_ANCESTOR.csv", cache_dir=".cache")
+    afib = vocabulary.mask(conditions["condition_concept_id"], [313217])
+    sets = expand_concept_sets({1: [313217], 2: [201826, 201254]}, vocabulary)
+    flags = concept_flags(conditions["condition_concept_id"], sets)
+
+    python vocabulary.py [--concept-ancestor CONCEPT_ANCESTOR.csv]
+                         [--cache-dir DIR] [--concepts 1000000]
+"""
+
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from key_index import KeyIndex
+from omop_loader import file_digest
+
+ANCESTOR_COLUMNS = ["ancestor_concept_id", "descendant_concept_id"]
+
+# Bump when the saved layout changes
+INDEX_VERSION = 1
+INDEX_ARRAYS = ("ancestors", "offsets", "descendants")
+META_FILE = "meta.json"
+
+# Closure rows parsed per chunk when reading a concept_ancestor CSV
+READ_CHUNK_ROWS = 5_000_000
+
+# Expanded concept sets kept per index
+CONCEPT_SET_CACHE = 256
+
+_INT32_MIN, _INT32_MAX = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+
+
+class ConceptAncestorIndex:
+    """
+    Immutable concept_ancestor closure.
+
+    Build with from_pairs() or from_csv(); save() writes the arrays to a
+    directory that load() maps back without copying.
+    """
+
+    def __init__(self, ancestors: np.ndarray, offsets: np.ndarray,
+                 descendants: np.ndarray):
+        self.ancestors = ancestors
+        self.offsets = offsets
+        self.descendants_array = descendants
+        self._expanded = lru_cache(maxsize=CONCEPT_SET_CACHE)(self._concept_set)
+
+    @classmethod
+    def from_pairs(cls, ancestor_ids, descendant_ids) -> "ConceptAncestorIndex":
+        """Index (ancestor, descendant) pairs; duplicates are dropped."""
+        ancestor_ids = np.asarray(ancestor_ids, dtype=np.int32)
+        descendant_ids = np.asarray(descendant_ids, dtype=np.int32)
+        distinct = np.unique(ancestor_ids)
+        ancestor_ids = np.concatenate([ancestor_ids, distinct])
+        descendant_ids = np.concatenate([descendant_ids, distinct])
+
+        order = np.lexsort((descendant_ids, ancestor_ids))
+        ancestor_ids, descendant_ids = ancestor_ids[order], descendant_ids[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = ((ancestor_ids[1:] != ancestor_ids[:-1])
+                     | (descendant_ids[1:] != descendant_ids[:-1]))
+        ancestor_ids, descendant_ids = ancestor_ids[first], descendant_ids[first]
+
+        ancestors, starts = np.unique(ancestor_ids, return_index=True)
+        offsets = np.append(starts, len(ancestor_ids)).astype(np.int64)
+        return cls(ancestors, offsets, descendant_ids)
+
+    @classmethod
+    def from_csv(cls, path: Path, chunk_rows: int = READ_CHUNK_ROWS) -> "ConceptAncestorIndex":
+        """
+        Index a concept_ancestor extract.
+
+        Both the comma-separated form and the tab-separated files of an
+        Athena vocabulary download are read; only the two id columns are
+        parsed.
+        """
+        with open(path) as f:
+            header = f.readline()
+        sep = "\t" if "\t" in header else ","
+        columns = {c.strip().lower(): c for c in header.rstrip("\r\n").split(sep)}
+        usecols = [columns[c] for c in ANCESTOR_COLUMNS]
+
+        ancestors, descendants = [], []
+        for chunk in pd.read_csv(path, sep=sep, usecols=usecols, dtype=np.int32,
+                                 chunksize=chunk_rows):
+            ancestors.append(chunk[usecols[0]].to_numpy())
+            descendants.append(chunk[usecols[1]].to_numpy())
+        if not ancestors:
+            return cls.from_pairs([], [])
+        return cls.from_pairs(np.concatenate(ancestors), np.concatenate(descendants))
+
+    def save(self, directory: Path):
+        """Write the arrays as .npy files (meta.json last, as a commit marker)."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / META_FILE).unlink(missing_ok=True)
+        for name, array in zip(INDEX_ARRAYS, self._arrays()):
+            partial = directory / f"{name}.{os.getpid()}.tmp.npy"
+            np.save(partial, array)
+            os.replace(partial, directory / f"{name}.npy")
+        meta = {"version": INDEX_VERSION, "ancestors": len(self.ancestors),
+                "pairs": len(self.descendants_array)}
+        (directory / META_FILE).write_text(json.dumps(meta))
+
+    @classmethod
+    def load(cls, directory: Path, mmap: bool = True) -> "ConceptAncestorIndex":
+        """Open a saved index, memory-mapped read-only by default."""
+        directory = Path(directory)
+        meta = json.loads((directory / META_FILE).read_text())
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"{directory}: index version {meta.get('version')}, "
+                             f"expected {INDEX_VERSION}")
+        # Plain ndarray views of the maps: slicing an np.memmap is several
+        # times slower, which dominates single-concept lookups
+        return cls(*(np.load(directory / f"{name}.npy",
+                             mmap_mode="r" if mmap else None).view(np.ndarray)
+                     for name in INDEX_ARRAYS))
+
+    def _arrays(self) -> tuple:
+        return self.ancestors, self.offsets, self.descendants_array
+
+    def __len__(self) -> int:
+        return len(self.ancestors)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self._arrays())
+
+    def _position(self, concept_id: int) -> int:
+        """Row of an ancestor concept, or -1."""
+        return _find(self.ancestors, concept_id)
+
+    def descendants(self, concept_id: int) -> np.ndarray:
+        """
+        Sorted descendant concept ids (int32), the concept itself included.
+
+        The concept is found by binary search over the ancestors, O(log n),
+        and its descendants returned as a zero-copy slice. A concept that
+        is no one's ancestor (e.g. not in the extract) only has itself.
+
+        Raises:
+            ValueError: if concept_id is outside the int32 range of OMOP
+                concept ids
+        """
+        position = self._position(concept_id)
+        if position < 0:
+            if not _INT32_MIN <= concept_id <= _INT32_MAX:
+                raise ValueError(f"Concept id {concept_id} is outside the int32 range")
+            return np.array([concept_id], dtype=self.descendants_array.dtype)
+        return self.descendants_array[self.offsets[position]:self.offsets[position + 1]]
+
+    def is_descendant(self, concept_id: int, ancestor_id: int) -> bool:
+        """True if concept_id is ancestor_id or falls under it."""
+        return concept_id == ancestor_id or _find(self.descendants(ancestor_id), concept_id) >= 0
+
+    def _concept_set(self, ancestors: tuple) -> KeyIndex:
+        if not ancestors:
+            return KeyIndex(np.zeros(0, dtype=np.int64))
+        return KeyIndex(np.unique(np.concatenate(
+            [self.descendants(a) for a in ancestors]).astype(np.int64)))
+
+    def expand(self, ancestors) -> KeyIndex:
+        """
+        Concept set of the given ancestors and all their descendants.
+
+        Results are cached per distinct set of ancestors.
+        """
+        return self._expanded(tuple(sorted({int(a) for a in ancestors})))
+
+    def mask(self, values, ancestors) -> np.ndarray:
+        """
+        Vectorized membership of a concept id column in an expanded set.
+
+        Args:
+            values: Concept ids (array, Series or nullable column); nulls
+                are never members
+            ancestors: Ancestor concept ids of the concept set
+
+        Returns:
+            Boolean array, one entry per value
+        """
+        return self.expand(ancestors).contains(values)
+
+
+def _find(ids: np.ndarray, concept_id: int) -> int:
+    """Position of a concept id in a sorted int32 array, or -1."""
+    if not _INT32_MIN <= concept_id <= _INT32_MAX:
+        return -1
+    # Search with an int32 key: a Python int would make NumPy upcast
+    # (copy) the whole array to int64 on every lookup
+    key = np.int32(concept_id)
+    position = int(ids.searchsorted(key))
+    return position if position < len(ids) and ids[position] == key else -1
+
+
+def index_dir(path: Path, cache_dir: Path) -> Path:
+    """Saved-index directory for an extract, keyed by its content hash."""
+    return Path(cache_dir) / f"{Path(path).stem.lower()}-{INDEX_VERSION}-{file_digest(path)}"
+
+
+def load_concept_ancestor(path: Path, cache_dir: Path = None) -> ConceptAncestorIndex:
+    """
+    Load a concept_ancestor extract, through a memory-mapped index cache.
+
+    Without ``cache_dir`` the CSV is parsed into an in-memory index. With
+    it, the first call saves the index there and later calls map it;
+    indexes of earlier versions of the extract are removed.
+    """
+    if cache_dir is None:
+        return ConceptAncestorIndex.from_csv(path)
+
+    directory = index_dir(path, cache_dir)
+    if not (directory / META_FILE).exists():
+        ConceptAncestorIndex.from_csv(path).save(directory)
+        for stale in Path(cache_dir).glob(f"{Path(path).stem.lower()}-*"):
+            if stale != directory and (stale / META_FILE).exists():
+                for file in stale.iterdir():
+                    file.unlink()
+                stale.rmdir()
+    return ConceptAncestorIndex.load(directory)
+
+
+def expand_concept_sets(criteria: dict, vocabulary: ConceptAncestorIndex = None) -> dict:
+    """
+    Expand {key: ancestor concept ids} into {key: KeyIndex}.
+
+    Without a vocabulary each set holds only the listed concepts.
+    """
+    if vocabulary is None:
+        return {key: KeyIndex(np.unique(np.asarray(ancestors, dtype=np.int64)))
+                for key, ancestors in criteria.items()}
+    return {key: vocabulary.expand(ancestors) for key, ancestors in criteria.items()}
+
+
+def concept_flags(values, concept_sets: dict) -> np.ndarray:
+    """
+    Bit flags per row from {bit: KeyIndex} concept sets.
+
+    Each distinct concept id is tested once; nulls carry no flags.
+    """
+    codes, distinct = pd.factorize(pd.Series(values))
+    distinct = np.asarray(distinct, dtype=np.int64)
+    # Missing values (-1) index the trailing zero
+    distinct_flags = np.zeros(len(distinct) + 1, dtype=np.uint8)
+    for bit, concept_set in concept_sets.items():
+        distinct_flags[:-1][concept_set.contains(distinct)] |= bit
+    return distinct_flags[codes]
+
+
+def synthetic_hierarchy(concepts: int, branching: int = 8, seed: int = 0) -> tuple:
+    """
+    Closure pairs of a random concept tree, for demos and benchmarks.
+
+    Concept ids are 1..concepts in breadth-first order under root 1;
+    each concept's parent is drawn from the previous level.
+
+    Returns:
+        (ancestor ids, descendant ids) excluding the self pairs
+    """
+    rng = np.random.default_rng(seed)
+    ids = np.arange(1, concepts + 1, dtype=np.int32)
+    parent = np.zeros(concepts + 1, dtype=np.int32)
+    level_start, level_size = 1, 1
+    while level_start + level_size <= concepts:
+        first = level_start + level_size
+        count = min(level_size * branching, concepts + 1 - first)
+        parent[first:first + count] = rng.integers(level_start, level_start + level_size,
+                                                   count, dtype=np.int32)
+        level_start, level_size = first, count
+
+    ancestors, descendants = [], []
+    current = parent[ids]
+    while True:
+        has_parent = current > 0
+        if not has_parent.any():
+            break
+        ancestors.append(current[has_parent])
+        descendants.append(ids[has_parent])
+        ids, current = ids[has_parent], parent[current[has_parent]]
+    return np.concatenate(ancestors), np.concatenate(descendants)
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+    import time
+
+    parser = argparse.ArgumentParser(description="Concept ancestor closure index")
+    parser.add_argument("--concept-ancestor", type=Path, default=None,
+                        help="concept_ancestor extract (CSV or Athena TSV); "
+                             "default: a synthetic hierarchy")
+    parser.add_argument("--cache-dir", type=Path, default=None,
+                        help="Directory for the memory-mapped index")
+    parser.add_argument("--concepts", type=int, default=1_000_000,
+                        help="Concepts in the synthetic hierarchy")
+    parser.add_argument("--rows", type=int, default=10_000_000,
+                        help="Rows in the synthetic condition_concept_id column")
+    parser.add_argument("--ancestor", type=int, nargs="+", default=None,
+                        help="Ancestor concept ids to expand (default: 313217, "
+                             "or concept 2 for the synthetic hierarchy)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        cache_dir = args.cache_dir or Path(scratch)
+        start = time.perf_counter()
+        if args.concept_ancestor:
+            source = args.concept_ancestor
+            vocabulary = load_concept_ancestor(source, cache_dir)
+            ancestors = args.ancestor or [313217]
+        else:
+            source = f"synthetic tree of {args.concepts:,} concepts"
+            vocabulary = ConceptAncestorIndex.from_pairs(*synthetic_hierarchy(args.concepts))
+            vocabulary.save(cache_dir / "synthetic")
+            vocabulary = ConceptAncestorIndex.load(cache_dir / "synthetic")
+            ancestors = args.ancestor or [2]
+        build_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        expanded = vocabulary.expand(ancestors)
+        expand_seconds = time.perf_counter() - start
+
+        rng = np.random.default_rng(1)
+        pool = vocabulary.ancestors if len(vocabulary) else np.array(ancestors)
+        column = rng.choice(np.asarray(pool, dtype=np.int64), args.rows)
+        start = time.perf_counter()
+        mask = vocabulary.mask(column, ancestors)
+        mask_seconds = time.perf_counter() - start
+
+        probes = rng.choice(np.asarray(pool), 100_000)
+        start = time.perf_counter()
+        hits = sum(vocabulary.is_descendant(int(c), ancestors[0]) for c in probes)
+        probe_seconds = time.perf_counter() - start
+        check = np.array([vocabulary.is_descendant(int(c), ancestors[0]) for c in probes[:1000]])
+        mismatches = int((check != vocabulary.mask(probes[:1000].astype(np.int64),
+                                                   ancestors[:1])).sum())
+
+        print("=" * 60)
+        print("Concept Ancestor Index")
+        print("=" * 60)
+        print(f"Source: {source}")
+        print(f"Ancestors: {len(vocabulary):,}, closure pairs: "
+              f"{len(vocabulary.descendants_array):,} "
+              f"({vocabulary.nbytes / 1e6:.1f} MB mapped), built in {build_seconds:.2f}s")
+        print(f"Concept set {ancestors}: {len(expanded):,} concepts "
+              f"({expanded.kind}), expanded in {expand_seconds * 1000:.2f} ms")
+        print(f"Mask over {args.rows:,} concept ids: {int(mask.sum()):,} members in "
+              f"{mask_seconds:.3f}s ({args.rows / mask_seconds / 1e6:.0f}M rows/s)")
+        print(f"is_descendant: {hits:,} of {len(probes):,} under {ancestors[0]}, "
+              f"{probe_seconds / len(probes) * 1e6:.1f} us each")
+        print(f"Mismatches is_descendant vs mask: {mismatches} / 1,000")
+        print("=" * 60)
+        del vocabulary, expanded